@@ -0,0 +1,186 @@
+'''
+Minimal Modbus TCP client for the Lambdatronic 3200 (not an app itself; imported by heating_froeling_modbus)
+
+Talks to the boiler's Modbus TCP side (or an ethernet-to-RS232 converter in Modbus TCP gateway mode)
+without pymodbus or the HA integration in between:
+
+* persistent connections: `connections` sockets (default 1) stay open and are reopened on error,
+* a request queue served by one worker thread per connection, in priority order: writes (WRITE)
+  always go before queued poll reads (POLL), so an HFFT change never waits behind a poll cycle,
+* block reads: plan_blocks() groups the registers to poll into as few contiguous FC03/FC04
+  requests as possible (the Lambdatronic answers at most MAX_BLOCK registers per request).
+
+Register addressing follows the doc: ID 30001 is input register offset 0, ID 40001 holding register
+offset 0 (doc/lambdatronic_3200_registers.csv lists all of them with their scaling).
+'''
+import itertools
+import queue
+import socket
+import struct
+import threading
+
+READ_HOLDING = 3
+READ_INPUT = 4
+WRITE_SINGLE = 6
+
+WRITE = 0
+POLL = 1
+
+MAX_BLOCK = 122  # registers per read request, from the Lambdatronic doc
+
+
+class ModbusError(Exception):
+    pass
+
+
+def plan_blocks(offsets, max_gap=8, max_len=MAX_BLOCK):
+    """Contiguous (start, count) blocks covering all offsets; gaps up to max_gap are read along."""
+    blocks = []
+    for offset in sorted(set(offsets)):
+        if blocks:
+            start, count = blocks[-1]
+            if offset - (start + count) <= max_gap and offset - start < max_len:
+                blocks[-1] = (start, offset - start + 1)
+                continue
+        blocks.append((offset, 1))
+    return blocks
+
+
+def signed(raw):
+    return raw - 0x10000 if raw & 0x8000 else raw
+
+
+# ==================================================================================================
+# ONE CONNECTION
+# ==================================================================================================
+class ModbusTcpConnection:
+    def __init__(self, host, port=502, unit_id=2, timeout=3.0):
+        self.host, self.port, self.unit_id, self.timeout = host, port, unit_id, timeout
+        self.sock = None
+        self.transaction = itertools.count(1)
+
+    def close(self):
+        if self.sock:
+            try: self.sock.close()
+            except: pass
+        self.sock = None
+
+    def request(self, pdu):
+        """Sends one PDU and returns the response PDU; one reconnect + retry on a broken connection."""
+        for attempt in (1, 2):
+            try:
+                if self.sock is None:
+                    self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                    self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                tid = next(self.transaction) & 0xFFFF
+                self.sock.sendall(struct.pack(">HHHB", tid, 0, len(pdu) + 1, self.unit_id) + pdu)
+                while True:
+                    rtid, _, length, _ = struct.unpack(">HHHB", self.recv(7))
+                    response = self.recv(length - 1)
+                    if rtid == tid:  # drop late answers to requests that timed out before
+                        break
+            except (OSError, struct.error) as e:
+                self.close()
+                if attempt == 2:
+                    raise ModbusError(f"{self.host}:{self.port}: {e}")
+                continue
+            if len(response) < 2:
+                self.close()  # a header without a PDU: the stream is out of step
+                raise ModbusError(f"short response {response!r} for function {pdu[0]}")
+            if response[0] & 0x80:
+                raise ModbusError(f"exception code {response[1]} for function {pdu[0]}")
+            return response
+
+    def recv(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise OSError("connection closed by peer")
+            data += chunk
+        return data
+
+    def read(self, function, start, count):
+        response = self.request(struct.pack(">BHH", function, start, count))
+        if response[0] != function or response[1] != 2 * count or len(response) != 2 + 2 * count:
+            raise ModbusError(f"malformed response to function {function} at {start}: "
+                              f"{len(response) - 2} data bytes, byte count {response[1]}, {2 * count} expected")
+        return list(struct.unpack(f">{count}H", response[2:]))
+
+    def write(self, offset, raw):
+        self.request(struct.pack(">BHH", WRITE_SINGLE, offset, raw & 0xFFFF))
+
+
+# ==================================================================================================
+# POOL (persistent connections, prioritized request queue)
+# ==================================================================================================
+class ModbusTcpPool:
+    def __init__(self, host, port=502, unit_id=2, connections=1, timeout=3.0):
+        self.jobs = queue.PriorityQueue()
+        self.order = itertools.count()  # FIFO within a priority
+        self.pending_polls = 0
+        self.lock = threading.Lock()
+        self.stats = {"reads": 0, "writes": 0, "errors": 0}
+        self.connections = [ModbusTcpConnection(host, port, unit_id, timeout) for _ in range(max(1, int(connections)))]
+        self.workers = [threading.Thread(target=self.work, args=(c,), daemon=True, name=f"modbus-tcp-{i}")
+                        for i, c in enumerate(self.connections)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, priority, func, args, done):
+        self.jobs.put((priority, next(self.order), func, args, done))
+
+    def write(self, offset, raw, done=None):
+        """Queues a FC06 write ahead of all polls; done(result, error) is called from the worker thread."""
+        self.submit(WRITE, "write", (offset, raw), done)
+
+    def poll(self, reads, done):
+        """Queues the (function, start, count) reads; done({(function, offset): raw}, error) once all are in.
+        Returns False (and queues nothing) while the previous poll is still pending."""
+        with self.lock:
+            if self.pending_polls or not reads:
+                return False
+            self.pending_polls = len(reads)
+        values, errors = {}, []
+
+        def block_done(result, error):
+            if error:
+                errors.append(error)
+            else:
+                values.update(result)
+            with self.lock:
+                self.pending_polls -= 1
+                last = self.pending_polls == 0
+            if last:
+                done(values, errors[0] if errors else None)
+
+        for read in reads:
+            self.submit(POLL, "read", read, block_done)
+        return True
+
+    def work(self, connection):
+        while True:
+            _, _, func, args, done = self.jobs.get()
+            if func is None:
+                connection.close()
+                return
+            result, error = None, None
+            try:
+                if func == "read":
+                    function, start, count = args
+                    raw = connection.read(function, start, count)
+                    result = {(function, start + i): value for i, value in enumerate(raw)}
+                    self.stats["reads"] += 1
+                else:
+                    connection.write(*args)
+                    self.stats["writes"] += 1
+            except Exception as e:  # anything else would kill the worker and leave the poll pending forever
+                error = e if isinstance(e, ModbusError) else ModbusError(f"{func} {args}: {e!r}")
+                self.stats["errors"] += 1
+            if done:
+                try: done(result, error)
+                except: pass
+
+    def close(self):
+        for _ in self.workers:
+            self.submit(WRITE, None, (), None)
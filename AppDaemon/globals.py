@@ -1,9 +1,89 @@
 import hassapi as hass
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import heating_metrics
+from heating_metrics import instrument
 
 class GlobalSettings(hass.Hass):
 
     def initialize(self):
         """Called when the app is loaded."""
+        # Write-through cache shared by all heating apps (entity/service -> last value written)
+        self.write_cache = {}
+        self.write_cache_ttl = float(self.args.get("write_cache_ttl", 900))
+        self.write_stats = {"issued": 0, "suppressed": 0}
+        # States created via set_state are gone after an HA restart, so forget what was written
+        self.listen_event(self.on_ha_started, "plugin_started")
+
+        # Schedule definitions of all rooms, fetched in one batched call and refreshed on edits only
+        self.schedule_cache = {}
+        self.schedule_listeners = {}  # app name -> (schedule entities, callback)
+        self.schedule_lock = threading.Lock()
+        self.listen_event(self.on_registry_update, "entity_registry_updated")
+
+        # Shared listeners: one HA listener per globally watched entity/event, fanned out to the apps
+        self.shared = {}          # entity -> {"state", "value", "parser", "coalesce", "subscribers", ...}
+        self.shared_events = {}   # event -> {app name: callback}
+        self.coalesce_seconds = self.args.get("coalesce_seconds", {}) or {}
+
+        # Bulk refresh transactions: these events are fanned out between begin and commit of the participants
+        self.transaction_events = self.args.get("transaction_events", ["HEATING_FORCE_EVALUATION"]) or []
+        self.transaction_participants = {}  # app name -> (begin, commit)
+
+        # Callback instrumentation of the heating apps, exported as sensor and Prometheus text file
+        heating_metrics.ENABLED = bool(self.args.get("metrics_enabled", True))
+        self.metrics_sensor = self.args.get("metrics_sensor", "sensor.heating_metrics")
+        self.metrics_file = self.args.get("metrics_file")
+        metrics_interval = int(self.args.get("metrics_interval", 60))
+        if heating_metrics.ENABLED and metrics_interval > 0:
+            self.run_every(self.export_metrics, self.get_now() + timedelta(seconds=metrics_interval), metrics_interval)
+
+        # Readiness gate: apps wait for their critical entities via listeners instead of polling
+        self.gates = {}          # app name -> {"app", "entities", "allow", "condition", "callback", "since"}
+        self.gate_handles = {}   # entity -> listen_state handle (one per entity for all gates)
+        self.gate_timer = None
+        self.boot_started = self.get_now()
+        self.boot_times = {}     # app name -> seconds from GlobalSettings start to ready
+        self.first_evaluation_jitter = float(self.args.get("first_evaluation_jitter", 10))
+
+        # Warm restart: the apps' controller state is snapshotted to local disk and handed back at start-up
+        self.snapshot_file = self.args.get("snapshot_file", os.path.join(os.path.dirname(os.path.abspath(__file__)), "heating_snapshot.json"))
+        self.snapshot_max_age = float(self.args.get("snapshot_max_age_minutes", 30)) * 60
+        self.snapshot_delay = float(self.args.get("snapshot_delay", 5))
+        self.snapshot_providers = {}  # app name -> callable returning the app's state (JSON-serializable)
+        self.learned_providers = {}   # app name -> callable returning what the app learned (kept regardless of age)
+        self.learned = {}             # app name -> learned state, of the previous run until the app registers
+        self.snapshot_timer = None
+        self.snapshot = self.load_snapshot()  # app name -> state of the previous run
+
+        # Notification outbox: Telegram messages are queued, merged by key and sent from a timer
+        self.notification_window = float(self.args.get("notification_window", 30))
+        self.notification_rate = max(1, int(self.args.get("notification_rate_per_minute", 6)))
+        self.outbox = {}         # key -> {"target", "title", "message", "disable_notification", "count", "queued"}
+        self.outbox_sent = []    # send times of the last minute (rate limit)
+        self.outbox_timer = None
+        self.outbox_stats = {"queued": 0, "merged": 0, "sent": 0}
+        self.outbox_lock = threading.Lock()  # send_telegram runs on the apps' threads, flush_outbox on ours
+
+        # Outdoor temperature failover: the best sensor of temp_outdoor_map is kept resolved by listeners
+        self.outdoor = {}            # sensor -> {"value": float or None, "updated": datetime or None}
+        self.outdoor_source = None   # sensor in use
+        self.outdoor_value = None    # last good value (kept when every sensor fails)
+        self.outdoor_listeners = {}  # app name -> callback
+        self.outdoor_max_age = float(self.args.get("outdoor_max_age_minutes", 60)) * 60
+        self.outdoor_source_sensor = self.args.get("outdoor_source_sensor", "sensor.heating_outdoor_source")
+        for sensor in self.get_outdoor_sensor_hierarchy():
+            self.outdoor[sensor] = self.parse_outdoor(self.get_state(sensor, attribute="all"))
+            self.listen_state(self.on_outdoor_change, sensor, attribute="all")
+        self.resolve_outdoor()
+        # A frozen sensor sends no events, so staleness is checked on a timer
+        self.run_every(self.check_outdoor_staleness, self.get_now() + timedelta(seconds=60), 60)
         self.log("GlobalSettings initialized.")
 
     def get_room_temp(self, room_alias):
@@ -20,7 +100,7 @@ class GlobalSettings(hass.Hass):
         return mapping.get(key)
 
     def get_outdoor_sensor_hierarchy(self):
-        """Used by HeatSupplyManager for dynamic failover of the main outdoor temp."""
+        """Priority order of the outdoor temperature failover (see resolve_outdoor)."""
         mapping = self.args.get("temp_outdoor_map", {})
         # Returns all sensors in the exact order they are listed in apps.yaml
         return list(mapping.values())
@@ -35,14 +115,558 @@ class GlobalSettings(hass.Hass):
         return mapping.get(f"valve_{room_alias}") or mapping.get(room_alias)
 
 
-    def send_telegram(self, target, title, message, disable_notification):
+    # ==============================================================================================
+    # OUTDOOR TEMPERATURE FAILOVER
+    # ==============================================================================================
+    @staticmethod
+    def parse_outdoor(entry):
+        """{"value", "updated"} from a full HA state; 'last_reported' counts as update if HA provides it."""
+        entry = entry or {}
+        try: value = float(entry.get("state"))
+        except (ValueError, TypeError): value = None
+        updated = None
+        for key in ["last_reported", "last_updated"]:
+            try:
+                stamp = datetime.fromisoformat(str(entry.get(key)))
+                updated = stamp if updated is None else max(updated, stamp)
+            except (ValueError, TypeError):
+                continue
+        return {"value": value, "updated": updated}
+
+    def on_outdoor_change(self, entity, attribute, old, new, kwargs):
+        self.outdoor[entity] = self.parse_outdoor(new)
+        self.resolve_outdoor()
+
+    def check_outdoor_staleness(self, kwargs):
+        # A sensor reporting the same value fires no state_changed, so the listener's timestamps are not enough
+        for sensor in self.outdoor:
+            try: self.outdoor[sensor] = self.parse_outdoor(self.get_state(sensor, attribute="all"))
+            except Exception as e:
+                self.log(f"Could not re-read {sensor}: {e}", level="WARNING")
+        self.resolve_outdoor()
+
+    def is_outdoor_fresh(self, sensor, now):
+        info = self.outdoor[sensor]
+        if info["value"] is None:
+            return False
+        return info["updated"] is None or (now - info["updated"]).total_seconds() <= self.outdoor_max_age
+
+    def resolve_outdoor(self):
+        """Picks the first fresh sensor in apps.yaml order; notifies subscribers if the value in use changed."""
+        now = self.get_now()
+        stale = [s for s in self.outdoor if self.outdoor[s]["value"] is not None and not self.is_outdoor_fresh(s, now)]
+        source = next((s for s in self.outdoor if self.is_outdoor_fresh(s, now)), None)
+        old_value, old_source = self.outdoor_value, self.outdoor_source
+        if source is not None:
+            self.outdoor_value = self.outdoor[source]["value"]
+        self.outdoor_source = source
+
+        if source != old_source:
+            if source is None:
+                self.log(f"No fresh outdoor temperature sensor; keeping last value {self.outdoor_value}.", level="WARNING")
+            else:
+                self.log(f"Outdoor temperature now from {source}" + (f" (stale: {stale})." if stale else "."))
+        if source != old_source or self.outdoor_value != old_value:
+            self.set_state(self.outdoor_source_sensor, state=source or "none", attributes={
+                "friendly_name": "Heating Outdoor Temperature Source",
+                "temperature": self.outdoor_value,
+                "stale": stale,
+                "unavailable": [s for s in self.outdoor if self.outdoor[s]["value"] is None],
+                "icon": "mdi:thermometer-check" if source else "mdi:thermometer-alert",
+            })
+        if source is not None and old_source is None and self.gates:
+            self.check_gates()
+        if self.outdoor_value != old_value:
+            for app_name, callback in list(self.outdoor_listeners.items()):
+                try:
+                    callback(source, "state", old_value, self.outdoor_value, {})
+                except Exception as e:
+                    self.log(f"Outdoor listener of {app_name} failed: {e}", level="WARNING")
+
+    def get_outdoor_value(self):
+        """Outdoor temperature from the best fresh sensor, else the last good value (None if there never was one)."""
+        return self.outdoor_value
+
+    def get_outdoor_source(self):
+        return self.outdoor_source
+
+    def subscribe_outdoor(self, app_name, callback):
+        """Registers callback(source sensor, attribute, old, new, kwargs) for changes of the outdoor temperature in use."""
+        self.outdoor_listeners[app_name] = instrument(callback)
+
+    # ==============================================================================================
+    # WRITE COALESCING
+    # ==============================================================================================
+    def on_ha_started(self, event_name, data, kwargs):
+        self.write_cache.clear()
+        if self.gates:
+            self.check_gates()
+
+    def _is_redundant(self, key, value):
+        """Returns True if value equals the last write for key and that write is still fresh."""
+        cached = self.write_cache.get(key)
+        if cached is not None and cached[0] == value and time.monotonic() - cached[1] < self.write_cache_ttl:
+            self.write_stats["suppressed"] += 1
+            return True
+        return False
+
+    def _record_write(self, key, value):
+        """Remembers a write once it went through; a failed write is not cached, so its retry is sent."""
+        self.write_cache[key] = (value, time.monotonic())
+        self.write_stats["issued"] += 1
+
+    def _write_through(self, app, key, value, write):
+        self.write_cache.pop(key, None)
+        record = lambda: self._record_write(key, value)
+        # Apps in async mode buffer their writes: only cache once the flush sent it
+        if hasattr(app, "write_through"):
+            app.write_through(write, record)
+        else:
+            write()
+            record()
+
+    def set_state_cached(self, app, entity, state, attributes=None):
+        """set_state on behalf of app; dropped if state and attributes equal the last write."""
+        attributes = dict(attributes or {})
+        if self._is_redundant(entity, (state, attributes)):
+            return False
+        self._write_through(app, entity, (state, attributes),
+                            lambda: app.set_state(entity, state=state, attributes=attributes))
+        return True
+
+    def call_service_cached(self, app, service, entity_id, **data):
+        """call_service on behalf of app; dropped if the same data was last sent to entity_id."""
+        if self._is_redundant((service, entity_id), data):
+            return False
+        self._write_through(app, (service, entity_id), data,
+                            lambda: app.call_service(service, entity_id=entity_id, **data))
+        return True
+
+    def get_write_stats(self):
+        return dict(self.write_stats, cached_entities=len(self.write_cache))
+
+    # ==============================================================================================
+    # SCHEDULE CACHE
+    # ==============================================================================================
+    def get_schedule_entities(self):
+        kinds = ['standard', 'holiday', 'temp', 'party', 'off']
+        return [f"schedule.{k}_{room}" for room in self.get_all_rooms() for k in kinds]
+
+    def fetch_schedules(self, entities=None):
+        """Fetches schedule definitions with a single schedule/get_schedule call."""
+        entities = entities or self.get_schedule_entities()
+        existing = [e for e in entities if self.entity_exists(e)]
+        rules = {}
+        if existing:
+            try:
+                response = self.call_service("schedule/get_schedule", entity_id=existing)
+                rules = response.get("result", {}).get("response", {})
+            except Exception as e:
+                self.log(f"Schedule fetch failed: {e}", level="WARNING")
+                return False
+        for e in entities:
+            self.schedule_cache[e] = rules.get(e, {})
+        return True
+
+    def get_schedule_rules(self, sched_entity):
+        """Cached definition of a schedule entity; None if it could not be fetched."""
+        with self.schedule_lock:
+            if sched_entity not in self.schedule_cache:
+                # The first reader loads the schedules of all rooms at once
+                self.fetch_schedules()
+            return self.schedule_cache.get(sched_entity)
+
+    def register_schedule_listener(self, app_name, entities, callback):
+        """callback(entity) runs after the cached definition of one of entities was refreshed."""
+        self.schedule_listeners[app_name] = (set(entities), instrument(callback))
+
+    def on_registry_update(self, event_name, data, kwargs):
+        entity = data.get("entity_id", "")
+        if not entity.startswith("schedule."):
+            return
+        with self.schedule_lock:
+            if not self.fetch_schedules([entity]):
+                self.schedule_cache.pop(entity, None)
+        for entities, callback in list(self.schedule_listeners.values()):
+            if entity in entities:
+                callback(entity)
+
+    # ==============================================================================================
+    # SHARED LISTENERS (fan-out dispatcher)
+    # ==============================================================================================
+    @staticmethod
+    def parse_float(raw):
+        try: return float(raw)
+        except (ValueError, TypeError): return None
+
+    def subscribe(self, app_name, entity, callback, parser=None, coalesce=None):
         """
-        Centralized Telegram notification service.
-        Parameters: title (str), message (str), target (int/str), disable_notification (bool)
+        Registers callback(entity, attribute, old, new, kwargs) for entity, with old/new parsed once by
+        parser. Only the first subscription creates an HA listener. With coalescing (seconds, per call
+        or via 'coalesce_seconds' in apps.yaml), a burst of changes is delivered once with the latest value.
         """
-        self.call_service("telegram_bot/send_message", service_data={
-            "target": target, 
-            "title": title,
-            "message": message,
-            "disable_notification": disable_notification
+        sub = self.shared.get(entity)
+        if sub is None:
+            raw = self.get_state(entity)
+            sub = self.shared[entity] = {
+                "state": raw,
+                "value": parser(raw) if parser else raw,
+                "parser": parser,
+                "coalesce": 0,
+                "subscribers": {},
+                "timer": None,
+                "pending_old": None,
+            }
+            self.listen_state(self.on_shared_change, entity)
+        if coalesce is None:
+            coalesce = self.coalesce_seconds.get(entity, 0)
+        sub["coalesce"] = max(sub["coalesce"], coalesce)
+        sub["subscribers"][app_name] = instrument(callback)
+
+    def subscribe_event(self, app_name, event, callback):
+        """Registers callback(event_name, data, kwargs); one HA event listener per event name."""
+        if event not in self.shared_events:
+            self.shared_events[event] = {}
+            self.listen_event(self.on_shared_event, event)
+        self.shared_events[event][app_name] = instrument(callback)
+
+    def is_shared(self, entity):
+        return entity in self.shared
+
+    def get_shared_state(self, entity):
+        """Raw state as last seen by the shared listener."""
+        return self.shared[entity]["state"]
+
+    def get_shared_value(self, entity):
+        """Parsed value as last seen by the shared listener."""
+        return self.shared[entity]["value"]
+
+    def on_shared_change(self, entity, attribute, old, new, kwargs):
+        sub = self.shared[entity]
+        old_value = sub["value"]
+        sub["state"] = new
+        sub["value"] = sub["parser"](new) if sub["parser"] else new
+        if sub["coalesce"] <= 0:
+            self.dispatch_shared(entity, old_value)
+        elif sub["timer"] is None:
+            sub["pending_old"] = old_value
+            sub["timer"] = self.run_in(self.flush_shared, sub["coalesce"], entity=entity)
+
+    def flush_shared(self, kwargs):
+        entity = kwargs["entity"]
+        sub = self.shared[entity]
+        sub["timer"] = None
+        if sub["pending_old"] != sub["value"]:
+            self.dispatch_shared(entity, sub["pending_old"])
+
+    def dispatch_shared(self, entity, old_value):
+        sub = self.shared[entity]
+        for app_name, callback in list(sub["subscribers"].items()):
+            try:
+                callback(entity, "state", old_value, sub["value"], {})
+            except Exception as e:
+                self.log(f"Shared listener of {app_name} for {entity} failed: {e}", level="WARNING")
+
+    def on_shared_event(self, event_name, data, kwargs):
+        if event_name in self.transaction_events:
+            with self.transaction(event_name):
+                self.dispatch_event(event_name, data, kwargs)
+        else:
+            self.dispatch_event(event_name, data, kwargs)
+
+    def dispatch_event(self, event_name, data, kwargs):
+        for app_name, callback in list(self.shared_events.get(event_name, {}).items()):
+            try:
+                callback(event_name, data, kwargs)
+            except Exception as e:
+                self.log(f"Shared event listener of {app_name} for {event_name} failed: {e}", level="WARNING")
+
+    # ==============================================================================================
+    # BULK REFRESH TRANSACTIONS
+    # ==============================================================================================
+    def register_transaction(self, app_name, begin, commit):
+        """begin(name) and commit(name) are called around every bulk refresh (see transaction())."""
+        self.transaction_participants[app_name] = (instrument(begin), instrument(commit))
+
+    @contextmanager
+    def transaction(self, name):
+        """
+        Wraps a bulk refresh of many rooms (e.g. HEATING_FORCE_EVALUATION): participants such as
+        HeatSupplyManager hold back their reactions in begin() and evaluate once in commit().
+        """
+        begun = []
+        for app_name, (begin, commit) in list(self.transaction_participants.items()):
+            try:
+                begin(name)
+                begun.append((app_name, commit))
+            except Exception as e:
+                self.log(f"Transaction begin of {app_name} for {name} failed: {e}", level="WARNING")
+        try:
+            yield
+        finally:
+            for app_name, commit in begun:
+                try:
+                    commit(name)
+                except Exception as e:
+                    self.log(f"Transaction commit of {app_name} for {name} failed: {e}", level="WARNING")
+
+    # ==============================================================================================
+    # READINESS GATE & BOOT
+    # ==============================================================================================
+    def when_ready(self, app, entities, callback, allow=None, condition=None):
+        """
+        Runs callback({}) in app once every entity exists and is not unavailable/unknown/None (states in
+        allow[entity] are accepted as well) and condition() - if given, a (description, func) pair - is
+        true. Released by the entities' state listeners, i.e. the moment HA reports them. An entity that
+        is not configured or does not exist in HA is a config error: the gate is never released.
+        """
+        absent = [e for e in entities if not self.gate_entity_exists(e)]
+        if absent:
+            self.log(f"CRITICAL: {app.name} not started, entities missing: {absent}", level="ERROR")
+            return
+        gate = {"app": app, "entities": list(entities), "allow": allow or {}, "condition": condition,
+                "callback": callback, "since": self.get_now()}
+        self.gates[app.name] = gate
+        if self.release_if_ready(app.name, gate, direct=True):
+            return
+        for entity in gate["entities"]:
+            if entity not in self.gate_handles:
+                self.gate_handles[entity] = self.listen_state(self.on_gate_entity, entity)
+        self.log(f"{app.name} waiting for: {self.gate_missing(gate)}")
+        if self.gate_timer is None:
+            # Safety net only: a missed event (e.g. while HA restarts) must not hold an app back forever
+            self.gate_timer = self.run_every(self.on_gate_timer, self.get_now() + timedelta(seconds=60), 60)
+
+    def gate_entity_exists(self, entity):
+        # get_state(None) returns the whole state dict and listen_state(cb, None) listens to everything
+        if not entity:
+            return False
+        try: return self.entity_exists(entity)
+        except: return False
+
+    def gate_missing(self, gate):
+        missing = []
+        for entity in gate["entities"]:
+            if not self.gate_entity_exists(entity):
+                missing.append(f"{entity} (missing)")
+                continue
+            state = self.get_state(entity)
+            if state in gate["allow"].get(entity, []):
+                continue
+            if state in ["unavailable", "unknown", None]:
+                missing.append(f"{entity} ({state})")
+        condition = gate["condition"]
+        if condition and not condition[1]():
+            missing.append(condition[0])
+        return missing
+
+    def release_if_ready(self, app_name, gate, direct=False):
+        if self.gate_missing(gate):
+            return False
+        self.gates.pop(app_name, None)
+        waited = (self.get_now() - gate["since"]).total_seconds()
+        if waited > 0.5:
+            self.log(f"{app_name} released after waiting {waited:.1f}s.")
+        if direct:
+            gate["callback"]({})
+        else:
+            gate["app"].run_in(gate["callback"], 0)
+        self.release_gate_listeners()
+        return True
+
+    def release_gate_listeners(self):
+        needed = {e for gate in self.gates.values() for e in gate["entities"]}
+        for entity in [e for e in self.gate_handles if e not in needed]:
+            try: self.cancel_listen_state(self.gate_handles.pop(entity))
+            except: pass
+        if not self.gates and self.gate_timer is not None:
+            try: self.cancel_timer(self.gate_timer)
+            except: pass
+            self.gate_timer = None
+
+    def check_gates(self):
+        for app_name, gate in list(self.gates.items()):
+            self.release_if_ready(app_name, gate)
+
+    def on_gate_entity(self, entity, attribute, old, new, kwargs):
+        self.check_gates()
+
+    def on_gate_timer(self, kwargs):
+        self.check_gates()
+        for app_name, gate in self.gates.items():
+            self.log(f"{app_name} still waiting for: {self.gate_missing(gate)}", level="WARNING")
+
+    def first_evaluation_delay(self, base=5):
+        """Start delay for a room's first evaluation, spread by first_evaluation_jitter so rooms do not all start at once."""
+        return base + random.uniform(0, self.first_evaluation_jitter)
+
+    def record_boot(self, app_name):
+        """Called by an app once it is up and running; the time since GlobalSettings started is logged and exported."""
+        seconds = round((self.get_now() - self.boot_started).total_seconds(), 1)
+        self.boot_times[app_name] = seconds
+        self.log(f"{app_name} up {seconds}s after start.", level="DEBUG")
+        return seconds
+
+    # ==============================================================================================
+    # WARM RESTART SNAPSHOT
+    # ==============================================================================================
+    def load_snapshot(self):
+        try:
+            with open(self.snapshot_file) as f:
+                data = json.load(f)
+            age = (self.get_now() - datetime.fromisoformat(data["saved"])).total_seconds()
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.log(f"Ignoring unreadable snapshot {self.snapshot_file}: {e}", level="WARNING")
+            return {}
+        self.learned = data.get("learned", {})
+        if age > self.snapshot_max_age:
+            self.log(f"Snapshot is {int(age / 60)} min old, starting cold.")
+            return {}
+        self.log(f"Warm restart: snapshot from {int(age)}s ago with {', '.join(data.get('apps', {})) or 'no apps'}.")
+        return data.get("apps", {})
+
+    def register_snapshot(self, app_name, provider):
+        """provider() returns the app's state for the snapshot; returns the app's state of the previous run (None if cold)."""
+        state = self.snapshot.pop(app_name, None)
+        previous = self.snapshot_providers.get(app_name)
+        if previous is not None:
+            # The app alone was reloaded: its old instance still holds the latest state
+            try: state = previous()
+            except Exception: pass
+        self.snapshot_providers[app_name] = provider
+        return state
+
+    def register_learned(self, app_name, provider):
+        """Like register_snapshot for state learned over weeks (e.g. the heat-up model): it is kept in the
+        snapshot file however old the file is. Returns the learned state of the previous run (None if none)."""
+        previous = self.learned_providers.get(app_name)
+        state = self.learned.get(app_name)
+        if previous is not None:
+            try: state = previous()
+            except Exception: pass
+        self.learned_providers[app_name] = provider
+        return state
+
+    def snapshot_changed(self, app_name=None):
+        """Called by the apps when their state changed; the file is written once per snapshot_delay."""
+        if self.snapshot_timer is None:
+            self.snapshot_timer = self.run_in(self.write_snapshot, self.snapshot_delay)
+
+    def write_snapshot(self, kwargs=None):
+        self.snapshot_timer = None
+        apps = {}
+        for app_name, provider in list(self.snapshot_providers.items()):
+            try: apps[app_name] = provider()
+            except Exception as e:
+                self.log(f"Snapshot of {app_name} failed: {e}", level="WARNING")
+        # Apps that have not registered (yet) keep what they learned in the previous run
+        for app_name, provider in list(self.learned_providers.items()):
+            try: self.learned[app_name] = provider()
+            except Exception as e:
+                self.log(f"Snapshot of {app_name}'s learned state failed: {e}", level="WARNING")
+        # Written atomically, a restart in the middle never leaves half a file behind
+        tmp = f"{self.snapshot_file}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"saved": self.get_now().isoformat(), "apps": apps, "learned": self.learned}, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_file)
+        except OSError as e:
+            self.log(f"Could not write snapshot {self.snapshot_file}: {e}", level="WARNING")
+
+    def terminate(self):
+        if self.snapshot_providers or self.learned_providers:
+            self.write_snapshot()
+        if self.outbox:
+            self.flush_outbox(force=True)
+
+    # ==============================================================================================
+    # METRICS EXPORT
+    # ==============================================================================================
+    def export_metrics(self, kwargs):
+        callbacks = heating_metrics.summary()
+        with self.outbox_lock:
+            notifications = dict(self.outbox_stats, pending=len(self.outbox))
+        total = sum(s.count for _, s in heating_metrics.snapshot())
+        self.set_state(self.metrics_sensor, state=total, attributes={
+            "friendly_name": "Heating Callback Metrics",
+            "unit_of_measurement": "callbacks",
+            "callbacks": callbacks,
+            "boot_seconds": dict(self.boot_times),
+            "notifications": notifications,
         })
+        if self.metrics_file:
+            try:
+                heating_metrics.write_prometheus(self.metrics_file)
+            except OSError as e:
+                self.log(f"Could not write metrics file {self.metrics_file}: {e}", level="WARNING")
+
+    # ==============================================================================================
+    # NOTIFICATION OUTBOX
+    # ==============================================================================================
+    def send_telegram(self, target, title, message, disable_notification, key=None):
+        """
+        Centralized Telegram notification service. Only queues the message, it is sent by flush_outbox.
+        Parameters: title (str), message (str), target (int/str), disable_notification (bool),
+        key (str, default: title) - messages with the same key within notification_window are sent once,
+        with the latest title/message and the number of merged notifications.
+        Called from the apps' threads, so the outbox is only touched under outbox_lock.
+        """
+        key = (target, key or title)
+        with self.outbox_lock:
+            entry = self.outbox.get(key)
+            if entry:
+                entry.update(title=title, message=message, count=entry["count"] + 1,
+                             disable_notification=entry["disable_notification"] and disable_notification)
+                self.outbox_stats["merged"] += 1
+            else:
+                self.outbox[key] = {"target": target, "title": title, "message": message, "count": 1,
+                                    "disable_notification": disable_notification, "queued": self.get_now()}
+                self.outbox_stats["queued"] += 1
+                self.schedule_outbox()
+
+    def schedule_outbox(self, delay=None):
+        """Arms the flush timer if none is pending; call with outbox_lock held."""
+        if self.outbox_timer is None and self.outbox:
+            self.outbox_timer = self.run_in(self.flush_outbox, self.notification_window if delay is None else delay)
+
+    def flush_outbox(self, kwargs=None, force=False):
+        """Sends the messages whose window has passed, at most notification_rate_per_minute per minute."""
+        now = self.get_now()
+        due = []
+        with self.outbox_lock:
+            self.outbox_timer = None
+            self.outbox_sent = [t for t in self.outbox_sent if (now - t).total_seconds() < 60]
+            for key, entry in list(self.outbox.items()):
+                waited = (now - entry["queued"]).total_seconds()
+                if not force and (waited < self.notification_window or len(self.outbox_sent) >= self.notification_rate):
+                    continue
+                # Taken out under the lock: a message with the same key arriving from now on starts a new entry
+                del self.outbox[key]
+                due.append((entry, waited))
+                self.outbox_sent.append(now)
+                self.outbox_stats["sent"] += 1
+            if self.outbox:
+                # Next due: the oldest entry's window or, when rate limited, the oldest send leaving the minute
+                delay = min((self.notification_window - (now - e["queued"]).total_seconds() for e in self.outbox.values()))
+                if len(self.outbox_sent) >= self.notification_rate:
+                    delay = max(delay, 60 - (now - self.outbox_sent[0]).total_seconds())
+                self.schedule_outbox(max(1, delay))
+
+        # Sent outside the lock, a slow Telegram call does not hold up the apps queueing messages
+        for entry, waited in due:
+            message = entry["message"]
+            if entry["count"] > 1:
+                message += f"\n({entry['count']} notifications in {int(waited)}s)"
+            try:
+                self.call_service("telegram_bot/send_message", service_data={
+                    "target": entry["target"],
+                    "title": entry["title"],
+                    "message": message,
+                    "disable_notification": entry["disable_notification"]
+                })
+            except Exception as e:
+                self.log(f"Telegram notification '{entry['title']}' failed: {e}", level="WARNING")
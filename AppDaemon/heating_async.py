@@ -0,0 +1,216 @@
+'''
+Async execution mode for the heating apps (not an app itself; imported by the apps)
+
+With `async_mode: true` (per app, or once under global_config) the hot paths of an app run as native
+AppDaemon async callbacks instead of occupying a worker thread for every HA round trip:
+
+1. the HA states the callback read last time are fetched concurrently (asyncio.gather),
+2. the unchanged synchronous logic runs in AppDaemon's executor against that snapshot (anything it
+   reads on top is read as usual and prefetched from the next pass on),
+3. the writes it issued (set_state, set_value, select_option, turn_on/off) are sent one after
+   another in their original order (writes to different entities can depend on each other).
+
+Write-through cache entries of GlobalSettings (set_state_cached / call_service_cached) are recorded
+only once the buffered write went through, so a failed write is sent again by the next pass.
+
+Callbacks are routed through hot(): the callback itself in sync mode, a native async callback
+otherwise. Apps list `AsyncEvaluation` after `Instrumented` and before `hass.Hass`:
+
+    class HeatSupplyManager(Instrumented, AsyncEvaluation, hass.Hass):
+
+In async mode all sync callbacks of the app take the app's pass lock, so a sync callback never runs
+while an async pass of the same app is in the executor (AppDaemon's usual one-thread-per-app guarantee).
+'''
+import asyncio
+import functools
+import threading
+from heating_metrics import counting, instrument
+
+BUFFERED_ACTIONS = ("set_value", "select_option", "turn_on", "turn_off")
+
+_local = threading.local()  # .passes = {app name: pass state} of the buffered passes running in this thread
+
+
+class EvaluationPass:
+    """Snapshot, recorded reads and buffered writes of one async pass."""
+    __slots__ = ("states", "reads", "writes")
+
+    def __init__(self, states):
+        self.states = states
+        self.reads = set()
+        self.writes = []  # (entity, method, args, kwargs, callbacks run once the write went through)
+
+
+class AsyncEvaluation:
+    """Mixin for hass.Hass apps; must come after Instrumented and before hass.Hass in the bases."""
+
+    @property
+    def async_mode(self):
+        mode = getattr(self, "_async_mode", None)
+        if mode is None:
+            gl = self.get_app("global_config") if self.name != "global_config" else self
+            mode = self._async_mode = bool(self.args.get("async_mode", gl.args.get("async_mode", False)))
+        return mode
+
+    @property
+    def pass_lock(self):
+        lock = getattr(self, "_pass_lock", None)
+        if lock is None:
+            lock = self._pass_lock = threading.RLock()
+        return lock
+
+    def hot(self, callback):
+        """callback itself in sync mode, else a native async callback running it as one buffered pass."""
+        if not self.async_mode:
+            return callback
+        cache = self.__dict__.setdefault("_async_callbacks", {})
+        name = callback.__name__
+        if name not in cache:
+            async def async_callback(*args, **kwargs):
+                await self.run_async(name, callback, *args, **kwargs)
+            async_callback.__name__ = name
+            cache[name] = instrument(async_callback, app=self)
+        return cache[name]
+
+    async def run_async(self, name, func, *args, **kwargs):
+        read_sets = self.__dict__.setdefault("_read_sets", {})
+        keys = list(read_sets.get(name, ()))
+        values = await asyncio.gather(*[self._read(entity, attribute) for entity, attribute in keys], return_exceptions=True)
+        states = {key: value for key, value in zip(keys, values) if not isinstance(value, Exception)}
+
+        evaluation = await self.run_in_executor(self._run_buffered, name, func, states, args, kwargs)
+        # Union over passes: a branch taken only now and then is prefetched as well
+        read_sets[name] = read_sets.get(name, set()) | evaluation.reads
+        await self._flush(evaluation.writes)
+
+    def _read(self, entity, attribute):
+        if attribute == "__exists__":
+            return super(AsyncEvaluation, self).entity_exists(entity)
+        if attribute:
+            return super(AsyncEvaluation, self).get_state(entity, attribute=attribute)
+        return super(AsyncEvaluation, self).get_state(entity)
+
+    def _run_buffered(self, name, func, states, args, kwargs):
+        evaluation = EvaluationPass(states)
+        passes = _local.__dict__.setdefault("passes", {})
+        with self.pass_lock, counting(self.name, name):
+            passes[self.name] = evaluation
+            try:
+                func(*args, **kwargs)
+            finally:
+                passes.pop(self.name, None)
+        return evaluation
+
+    async def _flush(self, writes):
+        failed = set()  # after a failed write, the later writes to the same entity are dropped
+        for entity, method, args, kwargs, written in writes:
+            if entity in failed:
+                continue
+            try:
+                result = getattr(super(AsyncEvaluation, self), method)(*args, **kwargs)
+                if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+                    await result
+            except Exception as error:
+                failed.add(entity)
+                self.log(f"Async write failed: {error}", level="WARNING")
+                continue
+            for callback in written:
+                callback()
+
+    def write_through(self, write, on_success):
+        """Runs write() and on_success() once it went through: right away, or after the flush if the
+        write was buffered by a running pass."""
+        evaluation = self._current_pass()
+        buffered = len(evaluation.writes) if evaluation is not None else None
+        write()
+        if buffered is not None and len(evaluation.writes) > buffered:
+            evaluation.writes[-1][4].append(on_success)
+        else:
+            on_success()
+
+    def _current_pass(self):
+        return getattr(_local, "passes", {}).get(self.name)
+
+    # ==============================================================================================
+    # STATE ACCESS (served from the snapshot / buffered while a pass is running in this thread)
+    # ==============================================================================================
+    def get_state(self, entity_id=None, attribute=None, **kwargs):
+        evaluation = self._current_pass()
+        if evaluation is None or entity_id is None or kwargs:
+            if attribute is not None:
+                kwargs["attribute"] = attribute
+            return super().get_state(entity_id, **kwargs)
+        key = (entity_id, attribute)
+        evaluation.reads.add(key)
+        if key not in evaluation.states:
+            evaluation.states[key] = super().get_state(entity_id, attribute=attribute) if attribute else super().get_state(entity_id)
+        return evaluation.states[key]
+
+    def entity_exists(self, entity_id, **kwargs):
+        evaluation = self._current_pass()
+        if evaluation is None:
+            return super().entity_exists(entity_id, **kwargs)
+        key = (entity_id, "__exists__")
+        evaluation.reads.add(key)
+        if key not in evaluation.states:
+            evaluation.states[key] = super().entity_exists(entity_id)
+        return evaluation.states[key]
+
+    def set_state(self, entity_id, *args, **kwargs):
+        evaluation = self._current_pass()
+        if evaluation is None:
+            return super().set_state(entity_id, *args, **kwargs)
+        evaluation.writes.append((entity_id, "set_state", (entity_id,) + args, kwargs, []))
+        state = args[0] if args else kwargs.get("state")
+        if state is not None:
+            evaluation.states[(entity_id, None)] = state
+
+    def call_service(self, service, **kwargs):
+        evaluation = self._current_pass()
+        entity_id = kwargs.get("entity_id")
+        if evaluation is None or service.split("/")[-1] not in BUFFERED_ACTIONS or not isinstance(entity_id, str):
+            return super().call_service(service, **kwargs)
+        evaluation.writes.append((entity_id, "call_service", (service,), kwargs, []))
+        # Later reads in the same pass see the written value, like they would after a blocking call
+        action = service.split("/")[-1]
+        if action == "set_value":
+            evaluation.states[(entity_id, None)] = kwargs.get("value")
+        elif action == "select_option":
+            evaluation.states[(entity_id, None)] = kwargs.get("option")
+        else:
+            evaluation.states[(entity_id, None)] = action.removeprefix("turn_")
+
+    def turn_on(self, entity_id, **kwargs):
+        if self._current_pass() is None:
+            return super().turn_on(entity_id, **kwargs)
+        self.call_service(f"{entity_id.split('.')[0]}/turn_on", entity_id=entity_id, **kwargs)
+
+    def turn_off(self, entity_id, **kwargs):
+        if self._current_pass() is None:
+            return super().turn_off(entity_id, **kwargs)
+        self.call_service(f"{entity_id.split('.')[0]}/turn_off", entity_id=entity_id, **kwargs)
+
+    # ==============================================================================================
+    # CALLBACK REGISTRATION (sync callbacks serialize with the async passes)
+    # ==============================================================================================
+    def _locked(self, callback):
+        if not self.async_mode or asyncio.iscoroutinefunction(callback):
+            return callback
+
+        @functools.wraps(callback)
+        def locked(*args, **kwargs):
+            with self.pass_lock:
+                return callback(*args, **kwargs)
+        return locked
+
+    def listen_state(self, callback, *args, **kwargs):
+        return super().listen_state(self._locked(callback), *args, **kwargs)
+
+    def listen_event(self, callback, *args, **kwargs):
+        return super().listen_event(self._locked(callback), *args, **kwargs)
+
+    def run_in(self, callback, *args, **kwargs):
+        return super().run_in(self._locked(callback), *args, **kwargs)
+
+    def run_every(self, callback, *args, **kwargs):
+        return super().run_every(self._locked(callback), *args, **kwargs)
@@ -1,17 +1,298 @@
 import hassapi as hass  # type: ignore
+import heapq
+import math
+from bisect import bisect_left, insort
+from contextlib import contextmanager
 from datetime import datetime, timedelta, time
+from heating_async import AsyncEvaluation
+from heating_metrics import Instrumented
+
+# ==================================================================================================
+# EVALUATION CONTEXT (one state snapshot per evaluation pass)
+# ==================================================================================================
+class EvaluationContext:
+    """Per-pass snapshot: every entity/attribute is read from HA once, derived values are memoized."""
+    def __init__(self, app):
+        self.app = app
+        self.states = {}
+        self.memo = {}
+        self.reads = 0
+        self.saved = 0
+
+    def get_state(self, entity, attribute=None):
+        key = (entity, attribute)
+        if key in self.states:
+            self.saved += 1
+            return self.states[key]
+        self.reads += 1
+        val = self.app.get_state(entity, attribute=attribute) if attribute else self.app.get_state(entity)
+        self.states[key] = val
+        return val
+
+    def entity_exists(self, entity):
+        key = ("__exists__", entity)
+        if key in self.states:
+            self.saved += 1
+            return self.states[key]
+        self.reads += 1
+        self.states[key] = self.app.entity_exists(entity)
+        return self.states[key]
+
+    def record(self, entity, state):
+        """Keeps the snapshot in line with a write issued during this pass."""
+        self.states[(entity, None)] = state
+
+    def memoize(self, key, func):
+        # A hit saves all the reads (and hits) the first computation needed
+        if key in self.memo:
+            value, cost = self.memo[key]
+            self.saved += cost
+            return value
+        before = self.reads + self.saved
+        value = func()
+        self.memo[key] = (value, self.reads + self.saved - before)
+        return value
+
+
+# ==================================================================================================
+# COMPILED WEEKLY SCHEDULE (schedule/get_schedule response as merged week-relative intervals)
+# ==================================================================================================
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+DAY_SECONDS = 86400
+WEEK_SECONDS = 7 * DAY_SECONDS
+CHAIN_TOLERANCE = 65  # blocks starting within this many seconds of the previous end are chained
+
+class CompiledSchedule:
+    """
+    Weekly schedule compiled once into sorted, merged [start, end) intervals (seconds since Monday 00:00).
+    Blocks starting within CHAIN_TOLERANCE of the previous end are chained, across midnight as well
+    (23:59 chains into 00:00 of the next day; the former day-by-day walk only did so for blocks ending
+    at 24:00). tools/check_schedule_chain.py compares chain_end with that walk.
+    """
+    def __init__(self, rules_dict):
+        blocks = []
+        for day_idx, day in enumerate(WEEKDAYS):
+            for block in rules_dict.get(day, []) or []:
+                try:
+                    start = day_idx * DAY_SECONDS + self.parse_time(block.get('from'))
+                    end = day_idx * DAY_SECONDS + self.parse_time(block.get('to'))
+                except: continue
+                if end > start:
+                    blocks.append((start, end, block.get('data') or {}))
+        blocks.sort(key=lambda b: b[0])
+
+        # Adjacent blocks are chained up front, so a chain end is a single lookup later on
+        merged = []
+        for start, end, data in blocks:
+            if merged and start - merged[-1][1] <= CHAIN_TOLERANCE:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end, data])
+        self.intervals = [tuple(m) for m in merged]
+        self.starts = [m[0] for m in merged]
+        # Sunday's last block runs into Monday's first one
+        self.wraps = bool(merged) and merged[0][0] <= CHAIN_TOLERANCE and WEEK_SECONDS - merged[-1][1] <= CHAIN_TOLERANCE
+
+    @staticmethod
+    def parse_time(t_str):
+        if ".999999" in t_str:
+            return DAY_SECONDS
+        parts = [int(p) for p in t_str.split(':')]
+        return parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) > 2 else 0)
+
+    @staticmethod
+    def week_offset(dt):
+        return dt.weekday() * DAY_SECONDS + dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1e6
+
+    def _containing(self, offset):
+        """Index of the interval that starts within tolerance of, or contains, offset (else None)."""
+        idx = bisect_left(self.starts, offset + CHAIN_TOLERANCE + 1e-6) - 1
+        if idx >= 0 and offset <= self.intervals[idx][1]:
+            return idx
+        return None
+
+    def chain_end(self, start_dt):
+        """End of the chain of blocks running from start_dt; capped at start_dt + 7 days."""
+        limit_dt = start_dt + timedelta(days=7)
+        offset = self.week_offset(start_dt)
+        idx = self._containing(offset)
+        if idx is None and self.wraps and WEEK_SECONDS - offset <= CHAIN_TOLERANCE:
+            offset -= WEEK_SECONDS
+            idx = 0
+        if idx is None:
+            return start_dt
+        end = self.intervals[idx][1]
+        if self.wraps and idx == len(self.intervals) - 1:
+            if len(self.intervals) == 1:
+                return limit_dt
+            end = WEEK_SECONDS + self.intervals[0][1]
+        return min(start_dt + timedelta(seconds=end - offset), limit_dt)
+
+    def next_start(self, dt):
+        """Start of the first interval beginning after dt, with its block data (None if the schedule is empty)."""
+        if not self.intervals:
+            return None, None
+        offset = self.week_offset(dt)
+        idx = bisect_left(self.starts, offset + 1e-6)
+        start, _, data = self.intervals[idx] if idx < len(self.intervals) else self.intervals[0]
+        if idx >= len(self.intervals):
+            start += WEEK_SECONDS
+        return dt + timedelta(seconds=start - offset), data
+
+# ==================================================================================================
+# HEAT-UP MODEL (predictive preheat)
+# ==================================================================================================
+PREHEAT_MAX_HOURS = 4.0
+
+class HeatUpModel:
+    """
+    Heat-up rate of a room in °C/h as w0 + w1 * outdoor temp + w2 * HFFT, fitted by least squares over
+    the observed claim periods. Only the normal equations are kept (updated per observation, older ones
+    slowly forgotten), so the fit is incremental and the state fits into a sensor attribute.
+    """
+    FORGET = 0.97
+    RIDGE = 1.0  # keeps the slopes near 0 while the observations hardly vary
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.xtx = [list(map(float, row)) for row in state.get("xtx", [[0.0] * 3 for _ in range(3)])]
+        self.xty = list(map(float, state.get("xty", [0.0] * 3)))
+        self.samples = int(state.get("samples", 0))
+        self.weights = None
+
+    def add(self, outdoor, hfft, rate):
+        x = (1.0, outdoor, hfft)
+        for i in range(3):
+            self.xty[i] = self.FORGET * self.xty[i] + x[i] * rate
+            for j in range(3):
+                self.xtx[i][j] = self.FORGET * self.xtx[i][j] + x[i] * x[j]
+        self.samples += 1
+        self.weights = None
+
+    def solve(self):
+        """Weights via Gaussian elimination on the (ridge-regularized) normal equations."""
+        a = [row[:] + [self.xty[i]] for i, row in enumerate(self.xtx)]
+        a[1][1] += self.RIDGE
+        a[2][2] += self.RIDGE
+        for col in range(3):
+            pivot = max(range(col, 3), key=lambda r: abs(a[r][col]))
+            if abs(a[pivot][col]) < 1e-9:
+                return None
+            a[col], a[pivot] = a[pivot], a[col]
+            for r in range(3):
+                if r != col:
+                    f = a[r][col] / a[col][col]
+                    a[r] = [v - f * p for v, p in zip(a[r], a[col])]
+        return [a[i][3] / a[i][i] for i in range(3)]
+
+    def mean_hfft(self):
+        return self.xtx[0][2] / self.xtx[0][0] if self.xtx[0][0] > 0 else None
+
+    def rate(self, outdoor, hfft):
+        """Predicted °C/h (None until at least one observation); never below a tenth of the mean rate."""
+        if self.samples == 0 or self.xtx[0][0] <= 0:
+            return None
+        mean_rate = self.xty[0] / self.xtx[0][0]
+        if self.weights is None:
+            self.weights = self.solve()
+        if self.weights is None or self.samples < 3 or outdoor is None or hfft is None:
+            return mean_rate
+        w0, w1, w2 = self.weights
+        return max(w0 + w1 * outdoor + w2 * hfft, 0.1 * mean_rate)
+
+    def to_state(self):
+        return {"xtx": [[round(v, 4) for v in row] for row in self.xtx],
+                "xty": [round(v, 4) for v in self.xty], "samples": self.samples}
+
+# ==================================================================================================
+# ROOM LOGIC (pure functions shared by RoomDemandCalculator and HeatingDemandEngine)
+# ==================================================================================================
+SCHEDULE_MODES = {'Standard': 'standard', 'Holiday': 'holiday', 'Temporary': 'temp', 'Party': 'party'}
+
+# --- BAKED IN VALUES (sun compensation) ---
+SUN_START_T = 20.0
+SUN_PEAK_T = 35.0
+# ------------------------------------------
+
+def calc_sun_offset(max_comp, g_temp):
+    """Offset scaled linearly from 0 (garden temp at SUN_START_T) to max_comp (at SUN_PEAK_T)."""
+    if max_comp == 0:
+        return 0.0
+    if g_temp <= SUN_START_T:
+        factor = 0.0
+    elif g_temp >= SUN_PEAK_T:
+        factor = 1.0
+    else:
+        denom = SUN_PEAK_T - SUN_START_T
+        factor = (g_temp - SUN_START_T) / denom if denom != 0 else 0.0
+    return round(factor * max_comp, 2)
+
+def calc_claim(curr_t, targ_t, margin, delta, has_claim, force_start=False):
+    """Hysteresis: claim below target - delta, release at target - margin, keep the claim in between."""
+    upper_bound = targ_t - margin
+    lower_bound = targ_t - delta
+
+    if curr_t >= upper_bound:
+        has_claim = False
+    elif curr_t < lower_bound:
+        has_claim = True
+    elif force_start and curr_t < upper_bound:
+        has_claim = True
+    return has_claim
+
+def calc_boost(boost_enabled, curr_t, targ_t, factor, threshold):
+    if boost_enabled == "on" and (targ_t - curr_t) >= threshold:
+        return round(max(0.0, (targ_t - curr_t) * factor), 1)
+    return 0.0
+
+def boost_status(location, contribution, raw_boost, boost_enabled):
+    """State and attributes of binary_sensor.boost_status_<room>."""
+    if boost_enabled is None or boost_enabled not in ["on", "off"]:
+        boost_enabled = "off"
+
+    try:
+        is_active = float(contribution) > 0
+    except:
+        is_active = False
+
+    icon = "mdi:fire-alert" if is_active else "mdi:fire"
+    if boost_enabled == "off":
+        icon = "mdi:fire-off"
+
+    return "on" if is_active else "off", {
+        "friendly_name": f"Boost Status {location.capitalize()}",
+        "boost": contribution if contribution is not None else 0.0,
+        "raw_boost": raw_boost if raw_boost is not None else 0.0,
+        "boost_enabled": str(boost_enabled),
+        "icon": icon
+    }
+
+def sun_status(location, offset, g_val):
+    """State and attributes of binary_sensor.sun_compensation_<room> (kept binary to match boost_status)."""
+    is_active = offset > 0
+    # State is on/off, but the specific delta is available in the 'compensation' attribute
+    return "on" if is_active else "off", {
+        "friendly_name": f"Sun Compensation {location.capitalize()}",
+        "compensation": offset,
+        "garten_temp": g_val,
+        "icon": "mdi:weather-sunny-alert" if is_active else "mdi:weather-sunny"
+    }
 
 # ==================================================================================================
 # ROOM DEMAND CALCULATOR
 # ==================================================================================================
-class RoomDemandCalculator(hass.Hass):     
+class RoomDemandCalculator(Instrumented, AsyncEvaluation, hass.Hass):     
     def initialize(self):
         self.gl = self.get_app("global_config")
         # Extract location from app name to allow code reuse across multiple rooms
         self.location = self.name.removeprefix("heating_") 
         self.sensor_temp = self.gl.get_room_temp(self.location)
-        self.mode_mapping = {'Standard': 'standard', 'Holiday': 'holiday', 'Temporary': 'temp', 'Party': 'party'}
+        self.mode_mapping = SCHEDULE_MODES
         self.delay_timer = None
+        self.booted = False
+        self.ctx = None
+        self.compiled_schedules = {}
+        self.eval_stats = {"evaluations": 0, "reads": 0, "reads_saved": 0}
 
         # Dynamically build schedule list to ensure the app reacts to all potential mode changes
         self.my_schedules = [f'schedule.{s}_{self.location}' for s in list(self.mode_mapping.values()) + ['off']]
@@ -22,7 +303,7 @@ class RoomDemandCalculator(hass.Hass):
                 self.listen_state(self.callback_debounced_refresh, sched, attribute='temp')
                 self.listen_state(self.callback_debounced_refresh, sched, attribute='next_event')
 
-        self.listen_event(self.on_config_change, "entity_registry_updated")
+        self.gl.register_schedule_listener(self.name, self.my_schedules, self.on_config_change)
         self.listen_state(self.callback_debounced_refresh, f'input_select.heating_schedule_{self.location}')
         self.listen_state(self.callback_temp_sensor, f'input_number.target_temp_{self.location}')
         self.listen_state(self.callback_debounced_refresh, f'input_number.delta_temp_{self.location}')
@@ -32,31 +313,105 @@ class RoomDemandCalculator(hass.Hass):
         self.garten_temp_sensor = self.gl.get_outdoor_temp("garten_temp")
         self.sun_comp_helper = f"input_number.sun_compensation_{self.location}"
         
-        self.listen_state(self.callback_temp_sensor, self.garten_temp_sensor)
+        # Globally watched entities go through GlobalSettings' shared listeners (one HA listener for all rooms)
+        self.gl.subscribe(self.name, self.garten_temp_sensor, self.callback_temp_sensor, parser=self.gl.parse_float)
         if self.entity_exists(self.sun_comp_helper):
             self.listen_state(self.callback_temp_sensor, self.sun_comp_helper)
         
         # Listen to the Input Select for Master Off, auto, heating, party
-        self.listen_state(self.callback_master_switch, "input_select.heating_mode")
+        self.gl.subscribe(self.name, "input_select.heating_mode", self.callback_master_switch)
 
         self.boost_helper = f"input_boolean.boost_enabled_{self.location}"
         if self.entity_exists(self.boost_helper):
             self.listen_state(self.callback_temp_sensor, self.boost_helper)
-            self.listen_state(self.callback_temp_sensor, "input_number.heating_boost_threshold")
-            self.listen_state(self.callback_temp_sensor, "input_number.heating_boost_factor")
-
-        self.listen_event(self.force_refresh_handler, "HEATING_FORCE_EVALUATION")
+            self.gl.subscribe(self.name, "input_number.heating_boost_threshold", self.callback_temp_sensor, parser=self.gl.parse_float)
+            self.gl.subscribe(self.name, "input_number.heating_boost_factor", self.callback_temp_sensor, parser=self.gl.parse_float)
+
+        self.gl.subscribe_event(self.name, "HEATING_FORCE_EVALUATION", self.force_refresh_handler)
+
+        # PREDICTIVE PREHEAT: only for rooms with the helper; the learned model is kept in the snapshot file
+        self.preheat_helper = f"input_boolean.heating_preheat_{self.location}"
+        self.preheat_sensor = f"sensor.heating_preheat_{self.location}"
+        self.preheat_timer = None
+        self.preheat_at = None
+        self.preheat_wake_at = None
+        self.heatup_start = None
+        self.heatup = HeatUpModel()
+        self.preheat_available = self.entity_exists(self.preheat_helper)
+        if self.preheat_available:
+            self.listen_state(self.callback_temp_sensor, self.preheat_helper)
+            learned = self.gl.register_learned(self.name, lambda: {"model": self.heatup.to_state()})
+            if learned:
+                self.heatup = HeatUpModel(learned.get("model"))
+            elif self.entity_exists(self.preheat_sensor):
+                # Installs from before the snapshot held the model: take it over from the sensor once
+                self.heatup = HeatUpModel(self.get_state(self.preheat_sensor, attribute="model"))
+            # Warm restart: a claim period that was being observed keeps its start
+            restored = self.gl.register_snapshot(self.name, self.snapshot_state)
+            if restored and restored.get("heatup_start"):
+                t0, temp0, outdoor0, flow0 = restored["heatup_start"]
+                self.heatup_start = (datetime.fromisoformat(t0), temp0, outdoor0, flow0)
+
+        self.run_in(self.hot(self.first_evaluation), self.gl.first_evaluation_delay())
 
-        self.run_in(self.first_evaluation, 5)
+    # ==============================================================================================
+    # STATE ACCESS (routed through the evaluation context while a pass is running)
+    # ==============================================================================================
+    @contextmanager
+    def evaluation(self):
+        """Opens an evaluation pass; nested calls share the outer pass' snapshot."""
+        # GlobalSettings dispatches shared callbacks from its own thread; in async mode they wait for a running pass
+        with self.pass_lock:
+            if self.ctx is not None:
+                yield self.ctx
+                return
+            self.ctx = EvaluationContext(self)
+            try:
+                yield self.ctx
+            finally:
+                ctx, self.ctx = self.ctx, None
+                self.eval_stats["evaluations"] += 1
+                self.eval_stats["reads"] += ctx.reads
+                self.eval_stats["reads_saved"] += ctx.saved
+                self.log(f"Evaluation pass: {ctx.reads} reads, {ctx.saved} saved.", level="DEBUG")
+
+    def _get(self, entity, attribute=None):
+        # Shared entities are mirrored by GlobalSettings' listener; no HA read needed
+        if attribute is None and self.gl.is_shared(entity):
+            return self.gl.get_shared_state(entity)
+        if self.ctx is not None:
+            return self.ctx.get_state(entity, attribute)
+        return self.get_state(entity, attribute=attribute) if attribute else self.get_state(entity)
+
+    def _exists(self, entity):
+        if self.ctx is not None:
+            return self.ctx.entity_exists(entity)
+        return self.entity_exists(entity)
+
+    def _memo(self, key, func):
+        if self.ctx is not None:
+            return self.ctx.memoize(key, func)
+        return func()
 
     def force_refresh_handler(self, event_name, data, kwargs):
+        if self.async_mode:
+            # GlobalSettings calls this synchronously; the pass itself runs on the event loop
+            self.run_in(self.hot(self.force_refresh), 0)
+            return
+        self.force_refresh({})
+
+    def force_refresh(self, kwargs):
         entity = f'input_boolean.heating_claim_{self.location}'
         self.turn_off(entity)
+        if self.heatup_start is not None:
+            self.heatup_start = None
+            self.gl.snapshot_changed(self.name)
         self.refresh_logic(force_reset=True)
 
-    def on_config_change(self, event_name, data, kwargs):
-        if data.get("entity_id", "") in self.my_schedules:
-            self.prepare_dashboard_next_event()
+    def on_config_change(self, sched_entity):
+        # Called by GlobalSettings once the edited schedule's definition has been re-fetched
+        self.compiled_schedules.pop(sched_entity, None)
+        self.prepare_dashboard_next_event()
 
     def callback_debounced_refresh(self, entity, attribute, old, new, args):
         self.update_dashboard_msg('Calculating next event...')
@@ -66,31 +421,35 @@ class RoomDemandCalculator(hass.Hass):
         
         # Use a longer debounce for schedule transitions to allow attributes to populate
         delay = 3 if (entity.startswith("schedule.") and new == "on") else 1
-        self.delay_timer = self.run_in(self.first_evaluation, delay)
+        self.delay_timer = self.run_in(self.hot(self.first_evaluation), delay)
 
     def first_evaluation(self, kwargs):
         self.delay_timer = None
 
-        curr_sched = self.current_schedule()
-        is_active = self.current_schedule_active()
+        with self.evaluation():
+            curr_sched = self.current_schedule()
+            is_active = self.current_schedule_active()
         
-        # Get both attributes to determine if the entity is fully loaded
-        sched_temp = self.get_state(curr_sched, attribute='temp')
-        next_event = self.get_state(curr_sched, attribute='next_event')
-
-        # RACE CONDITION CHECK:
-        # We only retry if the schedule is ON but BOTH attributes are missing.
-        # If next_event exists but temp doesn't, it's a valid "No Temp" schedule.
-        if is_active and (sched_temp is None) and (next_event is None or next_event == "None"):
-            retry_count = kwargs.get("retry_count", 0)
-            if retry_count < 2:
-                self.log(f"⚠️ {curr_sched} is active but appears unloaded. Retrying in 5s...")
-                self.run_in(self.first_evaluation, 5, retry_count=retry_count + 1)
-                return
-
-        # If we have data, or if it's a valid "No Temp" block, proceed to logic
-        self.refresh_logic(force_reset=False)
-        self.prepare_dashboard_next_event()
+            # Get both attributes to determine if the entity is fully loaded
+            sched_temp = self._get(curr_sched, 'temp')
+            next_event = self._get(curr_sched, 'next_event')
+
+            # RACE CONDITION CHECK:
+            # We only retry if the schedule is ON but BOTH attributes are missing.
+            # If next_event exists but temp doesn't, it's a valid "No Temp" schedule.
+            if is_active and (sched_temp is None) and (next_event is None or next_event == "None"):
+                retry_count = kwargs.get("retry_count", 0)
+                if retry_count < 2:
+                    self.log(f"⚠️ {curr_sched} is active but appears unloaded. Retrying in 5s...")
+                    self.run_in(self.hot(self.first_evaluation), 5, retry_count=retry_count + 1)
+                    return
+
+            # If we have data, or if it's a valid "No Temp" block, proceed to logic
+            self.refresh_logic(force_reset=False)
+            self.prepare_dashboard_next_event()
+        if not self.booted:
+            self.booted = True
+            self.gl.record_boot(self.name)
 
     def callback_master_switch(self, entity, attribute, old, new, args):
         force_start = (new == "Heating" and old != "Heating")
@@ -100,109 +459,209 @@ class RoomDemandCalculator(hass.Hass):
         self.evaluate_heating_claim() 
 
     def refresh_logic(self, force_reset=False):
-        curr_sched = self.current_schedule()
+        with self.evaluation():
+            curr_sched = self.current_schedule()
         
-        if curr_sched == f'schedule.off_{self.location}':
-            target = 5.0
-            self.set_target_temp(target)
-            self.update_heating_claim(False)
-            self.update_boost_attributes(0.0, 0.0, "off")
-            self.update_sun_sensor(0.0)
-            return 
-
-        if self.current_schedule_active():
-            sched_temp = self.get_state(curr_sched, attribute='temp')
-            try: 
-                target = float(sched_temp)
-            except: 
-                target = self.heat_temp() 
-        else:
-            target = self.base_temp()
+            if curr_sched == f'schedule.off_{self.location}':
+                target = 5.0
+                self.set_target_temp(target)
+                self.update_heating_claim(False)
+                self.update_boost_attributes(0.0, 0.0, "off")
+                self.update_sun_sensor(0.0)
+                return 
 
-        self.set_target_temp(target)
+            if self.current_schedule_active():
+                sched_temp = self._get(curr_sched, 'temp')
+                try: 
+                    target = float(sched_temp)
+                except: 
+                    target = self.heat_temp() 
+            else:
+                target = self.base_temp()
+
+            self.set_target_temp(target)
         
-        # Calculate offset and update sensor once
-        sun_offset = self.get_sun_offset()
-        self.update_sun_sensor(sun_offset)
+            # Calculate offset and update sensor once
+            sun_offset = self.get_sun_offset()
+            self.update_sun_sensor(sun_offset)
         
-        effective_target = target - sun_offset
-        self.evaluate_heating_claim(override_target=effective_target, force_reset=force_reset)
+            effective_target = target - sun_offset
+            self.evaluate_heating_claim(override_target=effective_target, force_reset=force_reset)
 
     def evaluate_heating_claim(self, override_target=None, force_reset=False, force_start=False):
-        if self.get_state("input_select.heating_mode") == "Off":
-            self.update_heating_claim(False)
-            self.update_boost_attributes(0.0, 0.0, "off")
-            self.update_sun_sensor(0.0)
-            return
+        with self.evaluation():
+            if self._get("input_select.heating_mode") == "Off":
+                self.update_heating_claim(False)
+                self.update_boost_attributes(0.0, 0.0, "off")
+                self.update_sun_sensor(0.0)
+                return
 
-        if self.current_schedule() == f'schedule.off_{self.location}' or not self.current_schedule_active():
-            self.update_heating_claim(False)
-            self.update_boost_attributes(0.0, 0.0, "off")
-            self.update_sun_sensor(0.0)
-            return
+            if self.current_schedule() == f'schedule.off_{self.location}' or not self.current_schedule_active():
+                if self.preheat_claim(force_reset):
+                    return
+                self.update_heating_claim(False, self.current_temp())
+                self.update_boost_attributes(0.0, 0.0, "off")
+                self.update_sun_sensor(0.0)
+                return
             
+            curr_t = self.current_temp()
+            targ_t = override_target if override_target is not None else self.target_temp()
+            if curr_t is None: return
+
+            self.update_sun_sensor(self.get_sun_offset())
+
+            current_state = self._get(f'input_boolean.heating_claim_{self.location}')
+            has_claim = (current_state == 'on') if not force_reset else False
+            has_claim = calc_claim(curr_t, targ_t, self.margin(), self.delta(), has_claim, force_start)
+
+            self.update_heating_claim(has_claim, curr_t)
+            self.calculate_and_update_boost(curr_t, targ_t)
+
+    # ==============================================================================================
+    # PREDICTIVE PREHEAT
+    # ==============================================================================================
+    def preheat_claim(self, force_reset=False):
+        """Claims ahead of the next schedule start so the room is warm when it begins; True if claiming."""
+        if not self.preheat_available or self._get(self.preheat_helper) != 'on':
+            self.set_preheat_at(None)
+            return False
+        if self.current_schedule() == f'schedule.off_{self.location}':
+            self.set_preheat_at(None)
+            return False
         curr_t = self.current_temp()
-        targ_t = override_target if override_target is not None else self.target_temp()
-        if curr_t is None: return
+        plan = self.preheat_plan(curr_t) if curr_t is not None else None
+        if plan is None:
+            self.set_preheat_at(None)
+            return False
+        preheat_at, target = plan
+        if target is None:  # the next start is beyond the horizon: plan again once it is within
+            self.set_preheat_at(None, recheck_at=preheat_at)
+            return False
+        self.set_preheat_at(preheat_at)
+        if self.get_now() < preheat_at:
+            return False
 
+        has_claim = self._get(f'input_boolean.heating_claim_{self.location}') == 'on' and not force_reset
+        has_claim = calc_claim(curr_t, target, self.margin(), self.delta(), has_claim, force_start=True)
+        self.update_heating_claim(has_claim, curr_t)
+        self.update_boost_attributes(0.0, 0.0, "off")
         self.update_sun_sensor(self.get_sun_offset())
+        return has_claim
 
-        current_state = self.get_state(f'input_boolean.heating_claim_{self.location}')
-        has_claim = (current_state == 'on') if not force_reset else False
-        
-        upper_bound = targ_t - self.margin()
-        lower_bound = targ_t - self.delta()
+    def preheat_plan(self, curr_t):
+        """(time to raise the claim, target temp) for the next schedule start, None if no preheat is needed;
+        (time to plan again, None) while the start is further ahead than preheat can reach."""
+        curr_sched = self.current_schedule()
+        rules_dict = self.gl.get_schedule_rules(curr_sched)
+        if not rules_dict:
+            return None
+        now = self.get_now().astimezone()  # schedules are in local time, get_now() is UTC
+        start_dt, data = self.compiled_schedule(curr_sched, rules_dict).next_start(now)
+        if start_dt is None:
+            return None
+        # The claim has to mature before HeatSupplyManager starts the pump
+        try: claim_delay = float(self._get("input_number.heating_claim_duration") or 0)
+        except (TypeError, ValueError): claim_delay = 0.0
+        horizon = timedelta(hours=PREHEAT_MAX_HOURS, seconds=claim_delay)
+        if start_dt - now > horizon:
+            return start_dt - horizon, None
+        try: target = float(data.get('temp'))
+        except (TypeError, ValueError): target = self.heat_temp()
+        target -= self.get_sun_offset()
+
+        missing = target - self.margin() - curr_t
+        rate = self.heatup.rate(self.outdoor_temp(), self.flow_temp() or self.heatup.mean_hfft())
+        if missing <= 0 or not rate:
+            return None
+        lead_hours = min(missing / rate, PREHEAT_MAX_HOURS)
+        return start_dt - timedelta(hours=lead_hours, seconds=claim_delay), target
+
+    def set_preheat_at(self, preheat_at, recheck_at=None):
+        """Arms the timer that re-evaluates the room when preheating has to start (or at recheck_at, when the
+        next start comes within reach), and publishes the plan."""
+        wake_at = preheat_at or recheck_at
+        if preheat_at == self.preheat_at and wake_at == self.preheat_wake_at:
+            return
+        self.preheat_at, self.preheat_wake_at = preheat_at, wake_at
+        if self.preheat_timer:
+            try: self.cancel_timer(self.preheat_timer)
+            except: pass
+            self.preheat_timer = None
+        if wake_at is not None and wake_at > self.get_now():
+            self.preheat_timer = self.run_in(self.on_preheat_due, math.ceil((wake_at - self.get_now()).total_seconds()))
+        self.publish_preheat()
+
+    def on_preheat_due(self, kwargs):
+        self.preheat_timer = None
+        self.evaluate_heating_claim()
+
+    def observe_heatup(self, has_claim, curr_t):
+        """Feeds the heat-up model with the temperature rise of every finished claim period."""
+        now = self.get_now()
+        if has_claim:
+            if self.heatup_start is None and curr_t is not None:
+                self.heatup_start = (now, curr_t, self.outdoor_temp(), self.flow_temp())
+                self.gl.snapshot_changed(self.name)
+            return
+        start, self.heatup_start = self.heatup_start, None
+        if start is None:
+            return
+        self.gl.snapshot_changed(self.name)
+        if curr_t is None:
+            return
+        t0, temp0, outdoor0, flow0 = start
+        hours = (now - t0).total_seconds() / 3600
+        rise = curr_t - temp0
+        outdoor_values = [v for v in [outdoor0, self.outdoor_temp()] if v is not None]
+        # Use the HFFT the pump was running with at the end; at the start it may still have been 0
+        flow = self.flow_temp() or flow0
+        if hours < 0.25 or rise <= 0.1 or not outdoor_values or not flow:
+            return
+        self.heatup.add(sum(outdoor_values) / len(outdoor_values), flow, rise / hours)
+        self.gl.snapshot_changed(self.name)
+        self.publish_preheat()
+
+    def snapshot_state(self):
+        start = self.heatup_start
+        return {"heatup_start": [start[0].isoformat()] + list(start[1:]) if start else None}
+
+    def publish_preheat(self):
+        if not self.preheat_available:
+            return
+        rate = self.heatup.rate(self.outdoor_temp(), self.flow_temp() or self.heatup.mean_hfft())
+        self.gl.set_state_cached(self, self.preheat_sensor, self.preheat_at.isoformat() if self.preheat_at else "idle", {
+            "friendly_name": f"Preheat {self.location.capitalize()}",
+            "heat_up_rate": round(rate, 2) if rate else None,
+            "model": self.heatup.to_state(),
+            "icon": "mdi:radiator",
+        })
 
-        if curr_t >= upper_bound:
-            has_claim = False
-        elif curr_t < lower_bound:
-            has_claim = True
-        elif force_start and curr_t < upper_bound:
-            has_claim = True
+    def outdoor_temp(self):
+        return self.gl.get_outdoor_value()
 
-        self.update_heating_claim(has_claim)
-        self.calculate_and_update_boost(curr_t, targ_t)
+    def flow_temp(self):
+        try: return float(self._get("input_number.target_flow_temp")) or None
+        except (TypeError, ValueError): return None
 
     def calculate_and_update_boost(self, curr_t, targ_t):
         boost_enabled = "off"
-        if self.entity_exists(f"input_boolean.boost_enabled_{self.location}"):
-            boost_enabled = self.get_state(f"input_boolean.boost_enabled_{self.location}")
-        
-        factor = float(self.get_state("input_number.heating_boost_factor") or 1.0)
-        threshold = float(self.get_state("input_number.heating_boost_threshold") or 4.0)
+        if self._exists(f"input_boolean.boost_enabled_{self.location}"):
+            boost_enabled = self._get(f"input_boolean.boost_enabled_{self.location}")
         
-        raw_boost = 0.0
-        if boost_enabled == "on" and (targ_t - curr_t) >= threshold:
-            raw_boost = round(max(0.0, (targ_t - curr_t) * factor), 1)
+        factor = float(self._get("input_number.heating_boost_factor") or 1.0)
+        threshold = float(self._get("input_number.heating_boost_threshold") or 4.0)
         
+        raw_boost = calc_boost(boost_enabled, curr_t, targ_t, factor, threshold)
+
         self.update_boost_attributes(raw_boost, raw_boost, boost_enabled)
 
     def update_boost_attributes(self, contribution, raw_boost, boost_enabled):
-        ent_status = f"binary_sensor.boost_status_{self.location}"
-        if boost_enabled is None or boost_enabled not in ["on", "off"]:
-            boost_enabled = "off"
-        
-        try:
-            is_active = float(contribution) > 0
-        except:
-            is_active = False
-
-        status_state = "on" if is_active else "off"
-        icon = "mdi:fire-alert" if is_active else "mdi:fire"
-        if boost_enabled == "off":
-            icon = "mdi:fire-off"
-        
-        self.set_state(ent_status, state=status_state, attributes={
-            "friendly_name": f"Boost Status {self.location.capitalize()}",
-            "boost": contribution if contribution is not None else 0.0,
-            "raw_boost": raw_boost if raw_boost is not None else 0.0,
-            "boost_enabled": str(boost_enabled),
-            "icon": icon
-        })
+        state, attributes = boost_status(self.location, contribution, raw_boost, boost_enabled)
+        self.gl.set_state_cached(self, f"binary_sensor.boost_status_{self.location}", state, attributes)
 
     def current_temp(self):
         try: 
-            val = self.get_state(self.sensor_temp)
+            val = self._get(self.sensor_temp)
             return float(val) if val not in [None, "unavailable", "unknown"] else None
         except: return None
 
@@ -211,34 +670,22 @@ class RoomDemandCalculator(hass.Hass):
     # ==============================================================================================
     def get_sun_offset(self):
         """Pure Query: Calculates offset based on greenhouse heat with baked-in limits."""
+        return self._memo("sun_offset", self._calc_sun_offset)
+
+    def _calc_sun_offset(self):
         # Check if the feature helper exists
-        if not self.entity_exists(self.sun_comp_helper):
+        if not self._exists(self.sun_comp_helper):
             return 0.0
             
         try:
-            max_comp = float(self.get_state(self.sun_comp_helper) or 0)
+            max_comp = float(self._get(self.sun_comp_helper) or 0)
             if max_comp == 0:
                 return 0.0
 
-            raw_g = self.get_state(self.garten_temp_sensor)
+            raw_g = self._get(self.garten_temp_sensor)
             if raw_g in [None, "unavailable", "unknown"]:
                 return 0.0
-            g_temp = float(raw_g)
-            
-            # --- BAKED IN VALUES ---
-            start_t = 20.0
-            peak_t = 35.0
-            # -----------------------
-
-            if g_temp <= start_t:
-                factor = 0.0
-            elif g_temp >= peak_t:
-                factor = 1.0
-            else:
-                denom = peak_t - start_t
-                factor = (g_temp - start_t) / denom if denom != 0 else 0.0
-
-            return round(factor * max_comp, 2)
+            return calc_sun_offset(max_comp, float(raw_g))
 
         except Exception as e:
             self.log(f"Solar Calc Error: {e}", level="WARNING")
@@ -247,68 +694,70 @@ class RoomDemandCalculator(hass.Hass):
     def update_sun_sensor(self, offset):
         """Command: Updates the HA binary sensor."""
         # Kept as binary_sensor to match boost_status behavior
-        ent_sun = f"binary_sensor.sun_compensation_{self.location}"
-        
-        is_active = offset > 0
-        g_val = self.get_state(self.garten_temp_sensor)
-        
-        # State is on/off, but the specific delta is available in the 'compensation' attribute
-        self.set_state(ent_sun, state="on" if is_active else "off", attributes={
-            "friendly_name": f"Sun Compensation {self.location.capitalize()}",
-            "compensation": offset,
-            "garten_temp": g_val,
-            "icon": "mdi:weather-sunny-alert" if is_active else "mdi:weather-sunny"
-        })
+        state, attributes = sun_status(self.location, offset, self._get(self.garten_temp_sensor))
+        self.gl.set_state_cached(self, f"binary_sensor.sun_compensation_{self.location}", state, attributes)
 
     def target_temp(self):
         """Pure Query: Returns current target minus calculated sun offset."""
         try: 
-            val = float(self.get_state(f'input_number.target_temp_{self.location}'))
+            val = float(self._get(f'input_number.target_temp_{self.location}'))
             return val - self.get_sun_offset()
         except: return 5.0
 
     def base_temp(self):
-        try: return float(self.get_state(f'input_number.base_temp_{self.location}'))
+        try: return float(self._get(f'input_number.base_temp_{self.location}'))
         except: return 5.0
 
     def delta(self):
-        try: return float(self.get_state(f'input_number.delta_temp_{self.location}'))
+        return self._memo("delta", self._calc_delta)
+
+    def _calc_delta(self):
+        try: return float(self._get(f'input_number.delta_temp_{self.location}'))
         except: return 2
 
     def margin(self):
-        try: return float(self.get_state('input_number.heating_margin'))
+        return self._memo("margin", self._calc_margin)
+
+    def _calc_margin(self):
+        try: return float(self._get('input_number.heating_margin'))
         except: return 0.5
 
     def heat_temp(self):
-        try: return float(self.get_state(f'input_number.heat_temp_{self.location}'))
+        try: return float(self._get(f'input_number.heat_temp_{self.location}'))
         except: return 21.0
 
     def current_schedule(self):
-        mode = self.get_state(f'input_select.heating_schedule_{self.location}')
+        return self._memo("schedule", self._calc_current_schedule)
+
+    def _calc_current_schedule(self):
+        mode = self._get(f'input_select.heating_schedule_{self.location}')
         suffix = self.mode_mapping.get(mode, 'off')
         return f'schedule.{suffix}_{self.location}'
     
     def current_schedule_active(self):
-        return self.get_state(self.current_schedule()) == 'on'
+        return self._get(self.current_schedule()) == 'on'
 
     def set_target_temp(self, x):
         try:
-            if float(self.get_state(f'input_number.target_temp_{self.location}')) == x: return
+            if float(self._get(f'input_number.target_temp_{self.location}')) == x: return
         except: pass
         self.call_service("input_number/set_value", entity_id=f'input_number.target_temp_{self.location}', value=x)
+        if self.ctx is not None: self.ctx.record(f'input_number.target_temp_{self.location}', x)
 
-    def update_heating_claim(self, has_claim):
+    def update_heating_claim(self, has_claim, curr_t=None):
         entity = f'input_boolean.heating_claim_{self.location}'
         new_state = 'on' if has_claim else 'off'
-        if self.get_state(entity) != new_state:
+        if self.preheat_available:
+            self.observe_heatup(has_claim, curr_t)
+        if self._get(entity) != new_state:
             self.turn_on(entity) if has_claim else self.turn_off(entity)
+            if self.ctx is not None: self.ctx.record(entity, new_state)
 
     def update_dashboard_msg(self, msg):
-        self.call_service("input_text/set_value", entity_id=f'input_text.next_event_{self.location}', value=msg)
+        self.gl.call_service_cached(self, "input_text/set_value", f'input_text.next_event_{self.location}', value=msg)
 
     def prepare_dashboard_next_event(self):
         curr_sched = self.current_schedule()
-        self.last_schedule_response = self.call_service("schedule/get_schedule", entity_id=curr_sched)
         self.run_in(self.calculate_relay_chain, 1, sched_entity=curr_sched)
 
     def calculate_relay_chain(self, kwargs):
@@ -316,16 +765,17 @@ class RoomDemandCalculator(hass.Hass):
             return
         curr_sched = kwargs["sched_entity"]
         try:
-            full_data = self.last_schedule_response
-            res_obj = full_data.get("result", {}).get("response", {})
-            rules_dict = res_obj.get(curr_sched, {})
-            next_event_str = self.get_state(curr_sched, attribute='next_event')
+            rules_dict = self.gl.get_schedule_rules(curr_sched)
+            if rules_dict is None:
+                self.log(f"No schedule definition available for {curr_sched}.", level="WARNING")
+                return
+            next_event_str = self._get(curr_sched, 'next_event')
             if not rules_dict or not next_event_str or next_event_str == "None":
                 self.update_dashboard_msg('No heating scheduled.')
                 return
             event_dt = datetime.strptime(next_event_str, '%Y-%m-%dT%H:%M:%S%z').astimezone()
             if self.current_schedule_active():
-                true_end_dt = self.find_true_chain_end(event_dt, rules_dict)
+                true_end_dt = self.compiled_schedule(curr_sched, rules_dict).chain_end(event_dt)
                 limit_dt = event_dt + timedelta(days=7)
                 msg = 'Heating stops at next power cut ;)' if true_end_dt >= limit_dt else f"Heating stops at {self.format_time_msg(true_end_dt)}"
             else:
@@ -334,120 +784,279 @@ class RoomDemandCalculator(hass.Hass):
         except Exception as e:
             self.log(f"Response Evaluation Error: {e}")
 
-    def find_true_chain_end(self, start_dt, rules_dict):
-        current_dt = start_dt
-        limit_dt = start_dt + timedelta(days=7)
-        while current_dt < limit_dt:
-            day_name = current_dt.strftime('%A').lower()
-            day_rules = rules_dict.get(day_name, [])
-            found_link = False
-            for block in day_rules:
-                try:
-                    f_str = block.get('from')
-                    f_time = datetime.strptime(f_str, '%H:%M:%S' if len(f_str) > 5 else '%H:%M').time()
-                    block_start_dt = datetime.combine(current_dt.date(), f_time).replace(tzinfo=current_dt.tzinfo)
-                    if abs((block_start_dt - current_dt).total_seconds()) <= 65:
-                        to_str = block.get('to')
-                        if ".999999" in to_str:
-                            current_dt = (current_dt + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-                        else:
-                            t_parts = [int(p) for p in to_str.split(':')]
-                            current_dt = current_dt.replace(hour=t_parts[0], minute=t_parts[1], second=t_parts[2] if len(t_parts) > 2 else 0, microsecond=0)
-                        found_link = True
-                        break 
-                except: continue
-            if not found_link: break
-        return current_dt
+    def compiled_schedule(self, sched_entity, rules_dict):
+        """Compiled form of a schedule, cached until its definition changes (see on_config_change)."""
+        compiled = self.compiled_schedules.get(sched_entity)
+        if compiled is None:
+            compiled = self.compiled_schedules[sched_entity] = CompiledSchedule(rules_dict)
+        return compiled
 
-    def format_time_msg(self, date_obj):
+    @staticmethod
+    def format_time_msg(date_obj):
         now = datetime.now(date_obj.tzinfo)
         if date_obj.date() == now.date(): return date_obj.strftime('%H:%M.')
         elif date_obj.date() == (now + timedelta(days=1)).date(): return date_obj.strftime('%H:%M tomorrow.')
         else: return date_obj.strftime('%H:%M on %d.%m.')
         
+# ==================================================================================================
+# CLAIM INDEX (kept current by HeatSupplyManager's listeners)
+# ==================================================================================================
+class ClaimIndex:
+    """Claims with their start times plus realized boosts, kept sorted for cheap max lookups."""
+    def __init__(self):
+        self.claim_start_times = {}
+        self.boosts = {}
+        self.sorted_boosts = []  # (boost, loc), ascending
+        self.maturity_heap = []  # (start, loc); released/matured entries are dropped lazily
+        self.heap_duration = None
+
+    def set_claim(self, loc, is_on, now):
+        if is_on:
+            if loc not in self.claim_start_times:
+                self.claim_start_times[loc] = now
+                heapq.heappush(self.maturity_heap, (now, loc))
+        else:
+            self.claim_start_times.pop(loc, None)
+
+    def restore_claim(self, loc, start):
+        """Re-raises a claim with the start time it had before it was dropped."""
+        self.claim_start_times[loc] = start
+        heapq.heappush(self.maturity_heap, (start, loc))
+
+    def next_maturity(self, now, duration):
+        """Earliest point in time at which a pending claim becomes active (None if there is none)."""
+        if duration != self.heap_duration:
+            # Matured entries were dropped under the old duration, so start over
+            self.maturity_heap = [(start, loc) for loc, start in self.claim_start_times.items()]
+            heapq.heapify(self.maturity_heap)
+            self.heap_duration = duration
+        heap = self.maturity_heap
+        while heap:
+            start, loc = heap[0]
+            deadline = start + timedelta(seconds=duration)
+            if self.claim_start_times.get(loc) != start or deadline <= now:
+                heapq.heappop(heap)
+                continue
+            return deadline
+        return None
+
+    def set_boost(self, loc, boost):
+        """Returns True if the realized boost of the room changed."""
+        old = self.boosts.get(loc)
+        if old == boost:
+            return False
+        if old is not None:
+            del self.sorted_boosts[bisect_left(self.sorted_boosts, (old, loc))]
+        self.boosts[loc] = boost
+        insort(self.sorted_boosts, (boost, loc))
+        return True
+
+    def active_claims(self, now, duration):
+        return [loc for loc, start in self.claim_start_times.items()
+                if (now - start).total_seconds() >= duration]
+
+    def max_boost(self, locations):
+        for boost, loc in reversed(self.sorted_boosts):
+            if loc in locations:
+                return max(boost, 0.0)
+        return 0.0
+
+# ==================================================================================================
+# VALVE INDEX (kept current by HeatSupplyManager's valve listeners)
+# ==================================================================================================
+PARTY_VALVE_MIN = 20.0  # % below which all valves count as closed and Party mode ends
+
+class ValveIndex:
+    """Valve positions (%) of the managed rooms, kept sorted so the most open valve is a single lookup."""
+    def __init__(self):
+        self.entities = {}   # loc -> valve sensor (only those that exist)
+        self.positions = {}  # loc -> %, rooms with an unavailable sensor are left out
+        self.sorted = []     # (position, loc), ascending
+
+    def set_position(self, loc, raw):
+        """Returns True if the room's position changed."""
+        try: value = float(raw or 0)
+        except (ValueError, TypeError): value = None
+        old = self.positions.get(loc)
+        if old == value:
+            return False
+        if old is not None:
+            del self.sorted[bisect_left(self.sorted, (old, loc))]
+            del self.positions[loc]
+        if value is not None:
+            self.positions[loc] = value
+            insort(self.sorted, (value, loc))
+        return True
+
+    def max_position(self):
+        return self.sorted[-1][0] if self.sorted else 0.0
+
+    def summary(self):
+        return {
+            "max": self.max_position(),
+            "most_open": self.sorted[-1][1] if self.sorted else None,
+            "open": sum(1 for value, _ in self.sorted if value >= PARTY_VALVE_MIN),
+            "positions": dict(self.positions),
+        }
+
+# ==================================================================================================
+# FLOW TARGET (live controller and shadow strategies)
+# ==================================================================================================
+FLOW_PARAMS = {  # parameter -> (helper, default)
+    "heating_baseline_0_deg": ("input_number.heating_baseline_0_deg", 36.0),
+    "baseline_adjustment": ("input_number.baseline_adjustment", 0.4),
+    "flow_temp_multi_room_offset": ("input_number.flow_temp_multi_room_offset", 0.0),
+    "max_flow_temp": ("input_number.max_flow_temp", 45.0),
+}
+
+def calc_flow_target(out_t, max_boost, claim_count, params):
+    """HFFT in 0.5 °C steps: heating curve + largest realized boost + offset per additional claiming room."""
+    baseline = (-params["baseline_adjustment"] * out_t) + params["heating_baseline_0_deg"]
+    multi_room_boost = max(0, claim_count - 1) * params["flow_temp_multi_room_offset"]
+    calc_target = float(round((baseline + max_boost + multi_room_boost) * 2) / 2)
+    return min(calc_target, params["max_flow_temp"])
+
+class ShadowStrategy:
+    """Alternative parameter set evaluated on the live inputs; tracks how its HFFT diverges from the live one."""
+    def __init__(self, name, overrides):
+        self.name = name
+        self.overrides = overrides
+        self.sensor = f"sensor.heating_shadow_{name}"
+        self.target = None
+        self.diff = 0.0
+        self.since = None          # time of the last evaluation (divergence is weighted by time)
+        self.evaluations = 0
+        self.differing = 0
+        self.seconds = 0.0
+        self.seconds_different = 0.0
+        self.diff_seconds = 0.0    # integral of shadow - live (°C * s)
+        self.abs_diff_seconds = 0.0
+        self.max_abs_diff = 0.0
+        self.live = None
+        self.published = None      # (shadow, live) of the last sensor update
+        self.published_at = None
+        self.dirty = False         # sensor update pending
+
+    def evaluate(self, now, live, out_t, max_boost, claim_count, params, live_boost_factor):
+        """Returns the shadow HFFT; live is the HFFT of the live controller (0 when it does not heat)."""
+        if self.since is not None:
+            elapsed = (now - self.since).total_seconds()
+            self.seconds += elapsed
+            self.diff_seconds += self.diff * elapsed
+            self.abs_diff_seconds += abs(self.diff) * elapsed
+            if self.diff:
+                self.seconds_different += elapsed
+        self.since = now
+        if out_t is None:
+            target = live  # live controller does not heat, no curve to compare
+        else:
+            factor = self.overrides.get("heating_boost_factor")
+            if factor is not None and live_boost_factor:
+                # The rooms' boost is linear in the factor (calc_boost)
+                max_boost = max_boost * float(factor) / live_boost_factor
+            target = calc_flow_target(out_t, max_boost, claim_count, dict(params, **self.overrides))
+        self.target, self.live = target, live
+        self.diff = round(target - live, 1)
+        self.evaluations += 1
+        if self.diff:
+            self.differing += 1
+            self.max_abs_diff = max(self.max_abs_diff, abs(self.diff))
+        return target
+
+    def publish_due(self, now, interval):
+        """The sensor is updated when a target changed; the stats alone only every interval seconds."""
+        if (self.target, self.live) != self.published or (now - self.published_at).total_seconds() >= interval:
+            self.published, self.published_at = (self.target, self.live), now
+            self.dirty = True
+        return self.dirty
+
+    def attributes(self):
+        return {
+            "friendly_name": f"Heating Shadow {self.name}",
+            "unit_of_measurement": "°C",
+            "icon": "mdi:flask-outline",
+            "live_flow_temp": self.live,
+            "difference": self.diff,
+            "parameters": dict(self.overrides),
+            "evaluations": self.evaluations,
+            "differing_evaluations": self.differing,
+            "hours_different": round(self.seconds_different / 3600, 2),
+            "mean_difference": round(self.diff_seconds / self.seconds, 2) if self.seconds else 0.0,
+            "mean_abs_difference": round(self.abs_diff_seconds / self.seconds, 2) if self.seconds else 0.0,
+            "max_abs_difference": self.max_abs_diff,
+        }
+
 # ==================================================================================================
 # HEAT SUPPLY MANAGER
 # ==================================================================================================
-class HeatSupplyManager(hass.Hass):
+class HeatSupplyManager(Instrumented, AsyncEvaluation, hass.Hass):
     def initialize(self):
         # PHASE 1: Static Initialization (Runs ONCE)
         self.gl = self.get_app("global_config")
         raw_deps = self.args.get('dependencies', [])
         self.managed_locations = [d.replace("heating_", "") for d in raw_deps if d not in ["global_config", "heat_supply_manager"]]
+        # Engine mode: the rooms live inside one app, so they are listed explicitly
+        if self.args.get('rooms'):
+            self.managed_locations = list(self.args['rooms'])
         
-        self.valve_map = self.gl.args.get("valve_map", {})
         self.flow_target_helper = "input_number.target_flow_temp"     
         self.mode_select = "input_select.heating_mode"
 
-        self.ext_temp_sensors = self.gl.get_outdoor_sensor_hierarchy()
         self.telegram_target = self.args.get('telegram_id') 
         
         self.debounce_timer = None
-        self.claim_start_times = {} 
-        self.startup_timer = None
-
-        # Start the health check loop
-        self.try_startup()
-
-    def try_startup(self, kwargs=None):
-        # PHASE 2: Health Check Loop
-        if not self.check_system_health():
-            self.startup_timer = self.run_in(self.try_startup, 30)
-            return
-
-        # PHASE 3: Boot (Only reached when healthy)
-        self.boot_up()
-
-    def check_system_health(self):
-        critical_entities = [
-            self.flow_target_helper,
-            self.mode_select
-        ]
-        
-        missing = []
-        unavailable = []
-        
-        for entity in critical_entities:
-            if not self.entity_exists(entity):
-                missing.append(entity)
-                continue
-            
-            state = self.get_state(entity)
-            if state in ["unavailable", "unknown", None]:
-                unavailable.append(f"{entity} ({state})")
-
-        # Check temperature sensor hierarchy separately
-        temp_sensor_healthy = False
-        for sensor in self.ext_temp_sensors:
-            if self.entity_exists(sensor):
-                state = self.get_state(sensor)
-                if state not in ["unavailable", "unknown", None]:
-                    temp_sensor_healthy = True
-                    break
-                    
-        if not temp_sensor_healthy:
-            unavailable.append("Any valid outdoor temp sensor")
-
-        if missing:
-            self.log(f"CRITICAL: Entities missing: {missing}", level="ERROR")
-            return False
-
-        if unavailable:
-            self.log(f"Startup delayed. Waiting for: {unavailable}", level="WARNING")
-            return False
-        
-        return True
-
-    def boot_up(self):
-        self.log("System Healthy. Registering listeners.")
+        self.claims = ClaimIndex()
+        self.valves = ValveIndex()
+        self.valve_sensor = self.args.get("valve_sensor", "sensor.heating_valves")
+        self.maturity_timer = None
+        self.maturity_deadline = None
+        self.transaction = None  # {"name", "depth", "released": {loc: claim start}, "timer"} during a bulk refresh
+        self.transaction_settle = float(self.args.get("transaction_settle", 3))
+        # Shadow strategies: alternative parameter sets published as sensor.heating_shadow_<name>
+        self.shadows = []
+        for name, overrides in (self.args.get("shadow_strategies") or {}).items():
+            unknown = set(overrides or {}) - set(FLOW_PARAMS) - {"heating_boost_factor"}
+            if unknown:
+                self.log(f"Shadow strategy {name}: ignoring unknown parameter(s) {', '.join(sorted(unknown))}.", level="WARNING")
+            self.shadows.append(ShadowStrategy(name, {k: float(v) for k, v in (overrides or {}).items() if k not in unknown}))
+        self.shadow_publish_interval = float(self.args.get("shadow_publish_interval", 300))
+        self.shadow_publish_delay = float(self.args.get("shadow_publish_delay", 10))
+        self.shadow_timer = None
+        self.shadow_boost_factor = any("heating_boost_factor" in shadow.overrides for shadow in self.shadows)
+        # Claim start times of the previous run (warm restart), applied to claims that are still on at boot
+        self.restored = self.gl.register_snapshot(self.name, self.snapshot_state)
+
+        # Boot as soon as the critical helpers and an outdoor temperature are available
+        self.gl.when_ready(self, [self.flow_target_helper, self.mode_select], self.boot_up,
+                           condition=("Any valid outdoor temp sensor", lambda: self.gl.get_outdoor_value() is not None))
+
+    def boot_up(self, kwargs=None):
+        self.log(f"System Healthy after {self.gl.record_boot(self.name)}s. Registering listeners.")
         
+        # Seed the claim index once; from here on the listeners keep it current
+        now = self.get_now()
+        restored, self.restored = self.restored or {}, None
+        restored_starts = restored.get("claim_start_times", {})
         for loc in self.managed_locations:
-            self.listen_state(self.callback_debounced_eval, f"input_boolean.heating_claim_{loc}")
+            claim = f"input_boolean.heating_claim_{loc}"
             status_sensor = f"binary_sensor.boost_status_{loc}"
-            self.listen_state(self.callback_debounced_eval, status_sensor, attribute="all")
+            is_on = self.get_state(claim) == 'on'
+            if is_on and loc in restored_starts:
+                # Warm restart: a running claim keeps its age instead of waiting the claim duration again
+                self.claims.restore_claim(loc, datetime.fromisoformat(restored_starts[loc]))
+            else:
+                self.claims.set_claim(loc, is_on, now)
+            self.claims.set_boost(loc, self.parse_boost(self.get_state(status_sensor, attribute="boost")))
+            self.listen_state(self.on_claim_change, claim, loc=loc)
+            self.listen_state(self.on_boost_change, status_sensor, attribute="all", loc=loc)
+            valve = self.gl.get_valve_map(loc)
+            if valve and self.entity_exists(valve):
+                self.valves.entities[loc] = valve
+                self.valves.set_position(loc, self.get_state(valve))
+                self.listen_state(self.on_valve_change, valve, loc=loc)
+        self.publish_valves()
             
-        for sensor in self.ext_temp_sensors:
-            self.listen_state(self.callback_debounced_eval, sensor)
+        self.gl.subscribe_outdoor(self.name, self.callback_debounced_eval)
             
         self.listen_state(self.on_mode_change, self.mode_select)
         
@@ -462,6 +1071,11 @@ class HeatSupplyManager(hass.Hass):
         ]
         for e in config_entities:
             self.listen_state(self.callback_debounced_eval, e)
+
+        self.gl.register_transaction(self.name, self.begin_transaction, self.commit_transaction)
+        if restored_starts:
+            self.log(f"Warm restart: claim start times restored for {', '.join(sorted(set(restored_starts) & set(self.claims.claim_start_times))) or 'no running claims'}.")
+        self.gl.snapshot_changed(self.name)
                 
         self.evaluate_heating_pump()
 
@@ -483,54 +1097,141 @@ class HeatSupplyManager(hass.Hass):
         self.callback_debounced_eval(entity, attribute, old, new, args)
 
     def reset_all_claims(self):
-        for loc in self.managed_locations:
-            claim = f"input_boolean.heating_claim_{loc}"
-            if self.get_state(claim) == "on":
-                self.turn_off(claim)
+        for loc in list(self.claims.claim_start_times):
+            self.turn_off(f"input_boolean.heating_claim_{loc}")
+
+    def on_claim_change(self, entity, attribute, old, new, kwargs):
+        loc = kwargs["loc"]
+        tx = self.transaction
+        if tx is not None:
+            # A claim dropped and raised again within the transaction keeps its start (no new claim duration)
+            if new == 'on' and loc in tx["released"]:
+                self.claims.restore_claim(loc, tx["released"].pop(loc))
+                self.gl.snapshot_changed(self.name)
+                return
+            if new != 'on' and loc in self.claims.claim_start_times:
+                tx["released"][loc] = self.claims.claim_start_times[loc]
+        self.claims.set_claim(loc, new == 'on', self.get_now())
+        self.gl.snapshot_changed(self.name)
+        self.callback_debounced_eval(entity, attribute, old, new, kwargs)
+
+    def on_boost_change(self, entity, attribute, old, new, kwargs):
+        attributes = new.get("attributes", {}) if isinstance(new, dict) else {}
+        if self.claims.set_boost(kwargs["loc"], self.parse_boost(attributes.get("boost"))):
+            self.callback_debounced_eval(entity, attribute, old, new, kwargs)
+
+    def on_valve_change(self, entity, attribute, old, new, kwargs):
+        if not self.valves.set_position(kwargs["loc"], new):
+            return
+        self.publish_valves()
+        # The last valve closing ends Party mode right away
+        if self.valves.max_position() < PARTY_VALVE_MIN and self.get_state(self.mode_select) == "Party":
+            self.evaluate_heating_pump()
+
+    def publish_valves(self):
+        """Valve aggregate for other consumers: state is the most open valve (%)."""
+        summary = self.valves.summary()
+        self.gl.set_state_cached(self, self.valve_sensor, summary["max"], dict(summary,
+            friendly_name="Heating Valves (most open)", unit_of_measurement="%", icon="mdi:valve"))
+
+    def get_valve_summary(self):
+        return self.valves.summary()
+
+    def snapshot_state(self):
+        if self.restored is not None:
+            return self.restored  # not booted yet, keep the previous run's state
+        return {"claim_start_times": {loc: start.isoformat() for loc, start in self.claims.claim_start_times.items()}}
+
+    @staticmethod
+    def parse_boost(value):
+        try: return float(value or 0.0)
+        except (ValueError, TypeError): return 0.0
 
     def callback_debounced_eval(self, entity, attribute, old, new, args):
+        if self.transaction is not None:
+            return  # the commit evaluates once
         if self.debounce_timer:
             try: self.cancel_timer(self.debounce_timer)
             except: pass 
-        self.debounce_timer = self.run_in(self.retry_evaluation, 3)
+        self.debounce_timer = self.run_in(self.hot(self.retry_evaluation), 3)
 
     def retry_evaluation(self, kwargs):
         self.debounce_timer = None
         self.evaluate_heating_pump()
 
+    def arm_maturity_timer(self, now, duration):
+        """Keeps exactly one timer armed for the next claim to mature, so the pump starts on time."""
+        deadline = self.claims.next_maturity(now, duration)
+        if deadline == self.maturity_deadline:
+            return
+        if self.maturity_timer:
+            try: self.cancel_timer(self.maturity_timer)
+            except: pass
+            self.maturity_timer = None
+        self.maturity_deadline = deadline
+        if deadline is not None:
+            self.maturity_timer = self.run_in(self.hot(self.on_claim_matured), math.ceil((deadline - now).total_seconds()))
+
+    def on_claim_matured(self, kwargs):
+        self.maturity_timer = None
+        self.maturity_deadline = None
+        self.evaluate_heating_pump()
+
+    # ==============================================================================================
+    # BULK REFRESH TRANSACTION (see GlobalSettings.transaction)
+    # ==============================================================================================
+    def begin_transaction(self, name):
+        if self.transaction is None:
+            self.transaction = {"name": name, "depth": 0, "released": {}, "timer": None}
+            if self.debounce_timer:
+                try: self.cancel_timer(self.debounce_timer)
+                except: pass
+                self.debounce_timer = None
+        tx = self.transaction
+        tx["depth"] += 1
+        if tx["timer"]:
+            # Another bulk refresh within the settle time extends the transaction
+            try: self.cancel_timer(tx["timer"])
+            except: pass
+            tx["timer"] = None
+
+    def commit_transaction(self, name):
+        tx = self.transaction
+        if tx is None:
+            return
+        tx["depth"] -= 1
+        if tx["depth"] > 0:
+            return
+        # The rooms' claim changes reach us as state callbacks after they are done; let them arrive first
+        tx["timer"] = self.run_in(self.hot(self.end_transaction), self.transaction_settle)
+
+    def end_transaction(self, kwargs):
+        tx, self.transaction = self.transaction, None
+        if tx is None:
+            return
+        self.log(f"{tx['name']}: rooms recomputed, {len(tx['released'])} claim(s) released. Evaluating once.")
+        self.evaluate_heating_pump()
+
     def evaluate_heating_pump(self):
+        if self.transaction is not None:
+            return  # held back until the bulk refresh is committed
         mode = self.get_state(self.mode_select)
 
         if mode == "Off": 
             self._set_flow_target(0)
+            self.evaluate_shadows(self.get_now(), 0.0)
             return
 
-        now = datetime.now()
+        now = self.get_now()
         user_duration = int(float(self.get_state("input_number.heating_claim_duration") or 10))
-        
-        for loc in self.managed_locations:
-            if self.get_state(f"input_boolean.heating_claim_{loc}") == 'on':
-                if loc not in self.claim_start_times: self.claim_start_times[loc] = now 
-            else:
-                self.claim_start_times.pop(loc, None)
-
-        active_claims = [loc for loc, start in self.claim_start_times.items() 
-                         if (now - start).total_seconds() >= user_duration]
+        active_claims = self.claims.active_claims(now, user_duration)
+        self.arm_maturity_timer(now, user_duration)
 
         should_heat = False
         
         if mode == "Party":
-            max_valve = 0.0
-            found_valves = False
-            for loc in self.managed_locations:
-                valve_entity = self.valve_map.get(f"valve_{loc}")
-                if valve_entity and self.entity_exists(valve_entity):
-                    found_valves = True
-                    try:
-                        val = float(self.get_state(valve_entity) or 0)
-                        if val > max_valve: max_valve = val
-                    except: pass
-            if found_valves and max_valve < 20.0:
+            max_valve = self.valves.max_position()
+            if self.valves.entities and max_valve < PARTY_VALVE_MIN:
                 self.call_service("input_select/select_option", entity_id=self.mode_select, option="Auto")
                 if self.telegram_target:
                     self.notify(self.telegram_target, "🛑 Party Mode Ended", f"Valves are closed ({max_valve}%).", True)
@@ -546,35 +1247,48 @@ class HeatSupplyManager(hass.Hass):
                 self.call_service("input_select/select_option", entity_id=self.mode_select, option="Auto")
 
         if should_heat:
-            out_t = 0.0
-            for sensor in self.ext_temp_sensors:
-                raw_out = self.get_state(sensor)
-                if raw_out not in [None, "unavailable", "unknown"]:
-                    try:
-                        out_t = float(raw_out)
-                        break
-                    except ValueError:
-                        pass
-                        
-            adj_factor = float(self.get_state("input_number.baseline_adjustment") or 0.4)
-            baseline = (-adj_factor * out_t) + float(self.get_state("input_number.heating_baseline_0_deg") or 36.0)
-            
-            max_realized_boost = 0.0
-            for loc in active_claims:
-                realized = float(self.get_state(f"binary_sensor.boost_status_{loc}", attribute="boost") or 0.0)
-                if realized > max_realized_boost:
-                    max_realized_boost = realized
-
-            multi_room_factor = float(self.get_state("input_number.flow_temp_multi_room_offset") or 0.0)
-            multi_room_boost = max(0, len(active_claims) - 1) * multi_room_factor
-
-            calc_target = float(round((baseline + max_realized_boost + multi_room_boost) * 2) / 2)
-            max_f = float(self.get_state("input_number.max_flow_temp") or 45.0)
-            if calc_target > max_f: calc_target = max_f
-                
+            out_t = self.gl.get_outdoor_value()
+            if out_t is None:
+                self.log("No outdoor temperature available, assuming 0°C.", level="WARNING")
+                out_t = 0.0
+
+            params = {}
+            for key, (helper, default) in FLOW_PARAMS.items():
+                params[key] = float(self.get_state(helper) or default)
+            max_realized_boost = self.claims.max_boost(set(active_claims))
+            calc_target = calc_flow_target(out_t, max_realized_boost, len(active_claims), params)
+
             self._set_flow_target(calc_target)
+            self.evaluate_shadows(now, calc_target, out_t, max_realized_boost, len(active_claims), params)
             if mode != "Heating" and mode != "Party":
                 self.call_service("input_select/select_option", entity_id=self.mode_select, option="Heating")
+        else:
+            self.evaluate_shadows(now, 0.0)
 
-    def notify(self, target, title, message, disable_notification=True):
-        self.gl.send_telegram(target, title, message, disable_notification)
+    # ==============================================================================================
+    # SHADOW STRATEGIES (evaluated with the inputs of the live evaluation, never written to the boiler)
+    # ==============================================================================================
+    def evaluate_shadows(self, now, live, out_t=None, max_boost=0.0, claim_count=0, params=None):
+        if not self.shadows:
+            return
+        live_boost_factor = None
+        if self.shadow_boost_factor:
+            try: live_boost_factor = float(self.get_state("input_number.heating_boost_factor") or 1.0)
+            except (ValueError, TypeError): live_boost_factor = None
+        due = False
+        for shadow in self.shadows:
+            shadow.evaluate(now, live, out_t, max_boost, claim_count, params, live_boost_factor)
+            due = shadow.publish_due(now, self.shadow_publish_interval) or due
+        # The sensors are written from a timer, the evaluation itself only does the arithmetic
+        if due and self.shadow_timer is None:
+            self.shadow_timer = self.run_in(self.publish_shadows, self.shadow_publish_delay)
+
+    def publish_shadows(self, kwargs):
+        self.shadow_timer = None
+        for shadow in self.shadows:
+            if shadow.dirty:
+                shadow.dirty = False
+                self.gl.set_state_cached(self, shadow.sensor, shadow.target, shadow.attributes())
+
+    def notify(self, target, title, message, disable_notification=True, key=None):
+        self.gl.send_telegram(target, title, message, disable_notification, key)
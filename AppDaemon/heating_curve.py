@@ -0,0 +1,218 @@
+''' Manual
+Heating-curve fitter for HeatSupplyManager's HFFT baseline:
+
+    baseline = -baseline_adjustment * outdoor temp + heating_baseline_0_deg
+
+HeatingCurveFitter reads what HeatingHistory has recorded (outdoor temperature, HFFT, claims, boost,
+room temperatures and targets, valve positions) and estimates for every 5 minutes of heating which
+HFFT would have been needed:
+
+* valves of all claiming rooms well below VALVE_TARGET: the water was hotter than needed, so the
+  needed HFFT is lower (VALVE_GAIN per 100 % of valve reserve);
+* a claiming room with its valve fully open that is not warming up: too cold, so the needed HFFT
+  is higher (ERROR_GAIN per °C below target);
+* otherwise the HFFT was about right.
+
+Periods with boost are skipped and the multi-room offset is taken out, so what is left is the
+baseline. A straight line fitted through these points (least squares) is the proposed curve; it is
+moved towards at most MAX_STEP per run and published as sensor.heating_curve_proposal. With
+`apply: true` in apps.yaml (or input_boolean.heating_curve_autotune switched on) the proposal is
+written to input_number.heating_baseline_0_deg and input_number.baseline_adjustment.
+
+The same fit can be run offline on a copy of the history files: tools/fit_heating_curve.py.
+'''
+
+import hassapi as hass  # type: ignore
+from bisect import bisect_right
+from heating_metrics import Instrumented
+
+STEP_SECONDS = 300
+VALVE_TARGET = 70.0      # % valve opening of the most open claiming room that counts as 'just right'
+VALVE_OPEN = 95.0        # % that counts as fully open
+VALVE_GAIN = 10.0        # K of HFFT per 100 % valve reserve
+ERROR_GAIN = 2.0         # K of HFFT per °C a stalled room is below target
+STALLED_RISE = 0.1       # °C per hour; slower counts as not warming up
+MIN_SAMPLES = 48         # 4 hours of heating
+MIN_SPREAD = 4.0         # °C of outdoor temperature range needed to fit the slope
+MAX_STEP = {"baseline_0_deg": 1.0, "adjustment": 0.05}
+LIMITS = {"baseline_0_deg": (25.0, 45.0), "adjustment": (0.1, 1.5)}
+
+# ==================================================================================================
+# FITTING (pure functions, also used by tools/fit_heating_curve.py)
+# ==================================================================================================
+def resample(samples, grid):
+    """Value of a [(time, value)] series held at each grid time (None before the first sample)."""
+    times = [t for t, _ in samples]
+    out = []
+    for t in grid:
+        idx = bisect_right(times, t) - 1
+        out.append(samples[idx][1] if idx >= 0 else None)
+    return out
+
+
+def curve_points(series, rooms, outdoor_keys, multi_room_offset, start=None, end=None, step=STEP_SECONDS):
+    """(outdoor temp, needed baseline HFFT) for every step with heating between start and end (unix time)."""
+    hfft = series.get("hfft") or []
+    if not hfft:
+        return []
+    start = max(start or hfft[0][0], hfft[0][0])
+    end = end or hfft[-1][0]
+    grid = [start + i * step for i in range(int((end - start) // step) + 1)]
+    hold = {name: resample(samples, grid) for name, samples in series.items()}
+    none = [None] * len(grid)
+    lag = max(1, int(3600 // step))  # warming-up check over the last hour
+
+    points = []
+    for i, t in enumerate(grid):
+        flow = hold["hfft"][i]
+        if not flow:
+            continue
+        outdoor = next((hold.get(f"outdoor_{k}", none)[i] for k in outdoor_keys
+                        if hold.get(f"outdoor_{k}", none)[i] is not None), None)
+        if outdoor is None:
+            continue
+        claiming = [loc for loc in rooms if hold.get(f"{loc}_claim", none)[i] == 1.0]
+        if not claiming or any((hold.get(f"{loc}_boost", none)[i] or 0) > 0 for loc in claiming):
+            continue
+
+        needed = flow - max(0, len(claiming) - 1) * multi_room_offset
+        valves = [hold[f"{loc}_valve"][i] for loc in claiming if hold.get(f"{loc}_valve", none)[i] is not None]
+        if valves and max(valves) < VALVE_TARGET:
+            needed -= VALVE_GAIN * (VALVE_TARGET - max(valves)) / 100.0
+        else:
+            deficit = 0.0
+            for loc in claiming:
+                temp, target = hold.get(f"{loc}_temp", none)[i], hold.get(f"{loc}_target", none)[i]
+                valve = hold.get(f"{loc}_valve", none)[i]
+                before = hold.get(f"{loc}_temp", none)[i - lag] if i >= lag else None
+                if None in (temp, target, valve, before) or valve < VALVE_OPEN:
+                    continue
+                if temp - before < STALLED_RISE and target - temp > 0:
+                    deficit = max(deficit, target - temp)
+            needed += ERROR_GAIN * deficit
+        points.append((outdoor, needed))
+    return points
+
+
+def solve(a, b):
+    """Gaussian elimination for a small dense system (None if singular)."""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-9:
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(n):
+            if r != col:
+                f = m[r][col] / m[col][col]
+                m[r] = [v - f * p for v, p in zip(m[r], m[col])]
+    return [m[i][n] / m[i][i] for i in range(n)]
+
+
+def fit_polynomial(points, degree):
+    """Least-squares coefficients [c0, c1, ...] of needed = c0 + c1 * out + c2 * out^2 ..."""
+    n = degree + 1
+    xtx = [[0.0] * n for _ in range(n)]
+    xty = [0.0] * n
+    for out, needed in points:
+        powers = [out ** k for k in range(n)]
+        for r in range(n):
+            xty[r] += powers[r] * needed
+            for c in range(n):
+                xtx[r][c] += powers[r] * powers[c]
+    return solve(xtx, xty)
+
+
+def propose(points, baseline_0_deg, adjustment):
+    """Proposed (baseline_0_deg, adjustment) plus fit details, or None if the data is not sufficient."""
+    if len(points) < MIN_SAMPLES:
+        return None
+    outs = [p[0] for p in points]
+    spread = max(outs) - min(outs)
+    line = fit_polynomial(points, 1) if spread >= MIN_SPREAD else None
+    if line is not None:
+        fit_0, fit_adj = line[0], -line[1]
+    else:
+        # Too little outdoor range for a slope: only shift the curve
+        shift = sum(needed - (baseline_0_deg - adjustment * out) for out, needed in points) / len(points)
+        fit_0, fit_adj = baseline_0_deg + shift, adjustment
+
+    def step(current, target, key, rounding):
+        lo, hi = LIMITS[key]
+        moved = current + max(-MAX_STEP[key], min(MAX_STEP[key], target - current))
+        return round(round(min(hi, max(lo, moved)) / rounding) * rounding, 2)
+
+    new_0 = step(baseline_0_deg, fit_0, "baseline_0_deg", 0.5)
+    new_adj = step(adjustment, fit_adj, "adjustment", 0.05)
+    rmse = (sum((needed - (new_0 - new_adj * out)) ** 2 for out, needed in points) / len(points)) ** 0.5
+    quadratic = fit_polynomial(points, 2) if spread >= 2 * MIN_SPREAD else None
+    return {
+        "baseline_0_deg": new_0,
+        "baseline_adjustment": new_adj,
+        "fitted_baseline_0_deg": round(fit_0, 2),
+        "fitted_baseline_adjustment": round(fit_adj, 3),
+        "quadratic": [round(c, 4) for c in quadratic] if quadratic else None,
+        "samples": len(points),
+        "outdoor_range": [round(min(outs), 1), round(max(outs), 1)],
+        "rmse": round(rmse, 2),
+    }
+
+
+def series_names(rooms, outdoor_keys):
+    names = ["hfft"] + [f"outdoor_{k}" for k in outdoor_keys]
+    for loc in rooms:
+        names += [f"{loc}_{kind}" for kind in ["temp", "target", "claim", "boost", "valve"]]
+    return names
+
+# ==================================================================================================
+# HEATING CURVE FITTER (app)
+# ==================================================================================================
+class HeatingCurveFitter(Instrumented, hass.Hass):
+    def initialize(self):
+        self.gl = self.get_app("global_config")
+        self.history = self.get_app(self.args.get("history_app", "heating_history"))
+        self.rooms = list(self.gl.get_all_rooms())
+        self.outdoor_keys = list(self.gl.args.get("temp_outdoor_map", {}))
+        self.apply = bool(self.args.get("apply", False))
+        self.window_days = float(self.args.get("window_days", 14))
+        self.autotune_helper = "input_boolean.heating_curve_autotune"
+        self.sensor = "sensor.heating_curve_proposal"
+
+        interval = int(float(self.args.get("fit_interval_hours", 6)) * 3600)
+        self.run_every(self.fit, "now+600", interval)
+        self.log(f"Heating curve fitter running every {interval // 3600}h (apply: {self.apply}).")
+
+    def fit(self, kwargs):
+        now = self.get_now().timestamp()
+        start = now - self.window_days * 86400
+        series = {}
+        for name in series_names(self.rooms, self.outdoor_keys):
+            try: series[name] = self.history.get_series(name, since=start)
+            except KeyError: continue
+        hfft = series.get("hfft") or []
+        covered_days = round((now - hfft[0][0]) / 86400, 1) if hfft else 0.0
+
+        baseline_0_deg = float(self.get_state("input_number.heating_baseline_0_deg") or 36.0)
+        adjustment = float(self.get_state("input_number.baseline_adjustment") or 0.4)
+        multi_room_offset = float(self.get_state("input_number.flow_temp_multi_room_offset") or 0.0)
+
+        points = curve_points(series, self.rooms, self.outdoor_keys, multi_room_offset, start=start, end=now)
+        self.log(f"Heating curve fit over {covered_days} of {self.window_days:g} days of history ({len(points)} points).")
+        proposal = propose(points, baseline_0_deg, adjustment)
+        if proposal is None:
+            self.set_state(self.sensor, state="insufficient data", attributes={
+                "friendly_name": "Heating Curve Proposal", "samples": len(points), "covered_days": covered_days})
+            return
+
+        apply = self.apply or self.get_state(self.autotune_helper) == "on"
+        self.set_state(self.sensor, state=f"{proposal['baseline_0_deg']} / {proposal['baseline_adjustment']}",
+                       attributes=dict(proposal, friendly_name="Heating Curve Proposal", applied=apply, covered_days=covered_days,
+                                       current_baseline_0_deg=baseline_0_deg, current_baseline_adjustment=adjustment))
+        if not apply:
+            return
+        if proposal["baseline_0_deg"] != baseline_0_deg:
+            self.call_service("input_number/set_value", entity_id="input_number.heating_baseline_0_deg", value=proposal["baseline_0_deg"])
+        if proposal["baseline_adjustment"] != adjustment:
+            self.call_service("input_number/set_value", entity_id="input_number.baseline_adjustment", value=proposal["baseline_adjustment"])
+        self.log(f"Heating curve: {baseline_0_deg}/{adjustment} -> {proposal['baseline_0_deg']}/{proposal['baseline_adjustment']} ({proposal['samples']} samples, rmse {proposal['rmse']}).")
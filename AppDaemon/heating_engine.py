@@ -0,0 +1,338 @@
+''' Manual
+HeatingDemandEngine is an optional alternative to running one RoomDemandCalculator app per room: a
+single app holds all rooms as compact __slots__ records that mirror the rooms' HA helpers through
+listeners. A change to a globally watched entity (heating mode, garden temperature, boost factor or
+threshold, HEATING_FORCE_EVALUATION) is one callback and one pass over all rooms instead of one
+callback per room app, and no evaluation re-reads HA.
+
+Hysteresis, sun compensation and boost are computed with the very functions RoomDemandCalculator
+uses (calc_claim, calc_sun_offset, calc_boost), and the entities written (target temp, claim, boost
+and sun compensation sensors, next-event text) are the same, so per-room behavior is identical
+(except for predictive preheat, which only the per-room apps do).
+
+apps.yaml (engine mode): disable the heating_<room> apps, enable heating_engine, and list the rooms
+that may start the pump under heat_supply_manager's `rooms:` (its dependencies then only need
+global_config and heating_engine). By default the engine runs every room in temp_room_map; use
+`rooms:` to restrict it.
+'''
+
+import hassapi as hass  # type: ignore
+from datetime import datetime, timedelta
+from heating_metrics import Instrumented
+from heating_automation import (CompiledSchedule, RoomDemandCalculator, SCHEDULE_MODES, boost_status,
+                                calc_boost, calc_claim, calc_sun_offset, sun_status)
+
+UNAVAILABLE = [None, "unavailable", "unknown"]
+
+def to_float(value, default):
+    try: return float(value)
+    except (ValueError, TypeError): return default
+
+# ==================================================================================================
+# ROOM RECORD
+# ==================================================================================================
+class RoomRecord:
+    """Mirror of one room's helpers (raw HA states) plus its debounce timer."""
+    __slots__ = ("location", "sensor_temp", "schedules", "has_sun", "has_boost",
+                 "temp", "target", "delta", "base", "heat", "sun_max", "boost_enabled", "claim",
+                 "sched_mode", "sched_states", "sched_temps", "next_events", "delay_timer")
+
+    def __init__(self, location, sensor_temp):
+        self.location = location
+        self.sensor_temp = sensor_temp
+        self.schedules = [f'schedule.{s}_{location}' for s in list(SCHEDULE_MODES.values()) + ['off']]
+        self.has_sun = self.has_boost = False
+        self.temp = self.target = self.delta = self.base = self.heat = None
+        self.sun_max = self.boost_enabled = self.claim = self.sched_mode = None
+        self.sched_states, self.sched_temps, self.next_events = {}, {}, {}
+        self.delay_timer = None
+
+    def current_schedule(self):
+        return f'schedule.{SCHEDULE_MODES.get(self.sched_mode, "off")}_{self.location}'
+
+    def schedule_active(self):
+        return self.sched_states.get(self.current_schedule()) == 'on'
+
+    def off_schedule(self):
+        return self.current_schedule() == f'schedule.off_{self.location}'
+
+    def current_temp(self):
+        return to_float(self.temp, None) if self.temp not in UNAVAILABLE else None
+
+# ==================================================================================================
+# BATCH EVALUATION (pure; no HA access)
+# ==================================================================================================
+def room_sun_offset(rec, g_raw):
+    if not rec.has_sun:
+        return 0.0
+    max_comp = to_float(rec.sun_max or 0, 0.0)
+    if max_comp == 0 or g_raw in UNAVAILABLE:
+        return 0.0
+    g_temp = to_float(g_raw, None)
+    return calc_sun_offset(max_comp, g_temp) if g_temp is not None else 0.0
+
+def evaluate_claims(records, env, overrides=None, force_reset=False, force_start=False):
+    """Batch form of RoomDemandCalculator.evaluate_heating_claim.
+
+    env holds the parsed global values (mode, garten, factor, threshold, margin) read once per pass.
+    Returns one entry per record: None (no valid room temperature, nothing to write) or a tuple
+    (has_claim, boost, boost_enabled, sun_offset).
+    """
+    results = []
+    for i, rec in enumerate(records):
+        if env["mode"] == "Off" or rec.off_schedule() or not rec.schedule_active():
+            results.append((False, 0.0, "off", 0.0))
+            continue
+        curr_t = rec.current_temp()
+        if curr_t is None:
+            results.append(None)
+            continue
+        sun = room_sun_offset(rec, env["garten"])
+        override = overrides[i] if overrides else None
+        if override is not None:
+            targ_t = override
+        else:
+            target = to_float(rec.target, None)
+            targ_t = target - sun if target is not None else 5.0
+        has_claim = (rec.claim == 'on') if not force_reset else False
+        has_claim = calc_claim(curr_t, targ_t, env["margin"], to_float(rec.delta, 2), has_claim, force_start)
+        boost_enabled = rec.boost_enabled if rec.has_boost else "off"
+        boost = calc_boost(boost_enabled, curr_t, targ_t, env["factor"], env["threshold"])
+        results.append((has_claim, boost, boost_enabled, sun))
+    return results
+
+# ==================================================================================================
+# HEATING DEMAND ENGINE
+# ==================================================================================================
+class HeatingDemandEngine(Instrumented, hass.Hass):
+    def initialize(self):
+        self.gl = self.get_app("global_config")
+        room_map = self.gl.get_all_rooms()
+        locations = self.args.get("rooms") or list(room_map)
+        self.rooms = {loc: RoomRecord(loc, room_map.get(loc)) for loc in locations}
+        self.compiled_schedules = {}
+
+        self.garten_temp_sensor = self.gl.get_outdoor_temp("garten_temp")
+        self.mode = self.get_state("input_select.heating_mode")
+        self.garten = self.get_state(self.garten_temp_sensor)
+        self.factor = self.get_state("input_number.heating_boost_factor")
+        self.threshold = self.get_state("input_number.heating_boost_threshold")
+        self.margin = self.get_state("input_number.heating_margin")
+
+        for rec in self.rooms.values():
+            self.register_room(rec)
+
+        # Globally watched entities: one listener each, one pass over all rooms per change
+        self.listen_state(self.on_master_switch, "input_select.heating_mode")
+        self.listen_state(self.on_global_change, self.garten_temp_sensor, field="garten")
+        self.listen_state(self.on_global_change, "input_number.heating_boost_factor", field="factor", boost_only=True)
+        self.listen_state(self.on_global_change, "input_number.heating_boost_threshold", field="threshold", boost_only=True)
+        self.listen_state(self.on_global_change, "input_number.heating_margin", field="margin", mirror_only=True)
+        self.listen_event(self.force_refresh_handler, "HEATING_FORCE_EVALUATION")
+
+        self.log(f"Heating engine running {len(self.rooms)} rooms.")
+        self.run_in(self.first_evaluation, 5)
+
+    def register_room(self, rec):
+        loc = rec.location
+        watch = [
+            (rec.sensor_temp, "temp", "claim"),
+            (f'input_number.target_temp_{loc}', "target", "claim"),
+            (f'input_number.delta_temp_{loc}', "delta", "refresh"),
+            (f'input_number.base_temp_{loc}', "base", None),
+            (f'input_number.heat_temp_{loc}', "heat", None),
+            (f'input_boolean.heating_claim_{loc}', "claim", None),
+            (f'input_select.heating_schedule_{loc}', "sched_mode", "refresh"),
+        ]
+        sun_helper = f"input_number.sun_compensation_{loc}"
+        if self.entity_exists(sun_helper):
+            rec.has_sun = True
+            watch.append((sun_helper, "sun_max", "claim"))
+        boost_helper = f"input_boolean.boost_enabled_{loc}"
+        if self.entity_exists(boost_helper):
+            rec.has_boost = True
+            watch.append((boost_helper, "boost_enabled", "claim"))
+
+        for entity, field, action in watch:
+            setattr(rec, field, self.get_state(entity))
+            self.listen_state(self.on_room_state, entity, loc=loc, field=field, action=action)
+
+        for sched in rec.schedules:
+            if not self.entity_exists(sched):
+                continue
+            full = self.get_state(sched, attribute="all") or {}
+            attributes = full.get("attributes", {})
+            rec.sched_states[sched] = full.get("state")
+            rec.sched_temps[sched] = attributes.get("temp")
+            rec.next_events[sched] = attributes.get("next_event")
+            self.listen_state(self.on_schedule_state, sched, loc=loc, target=rec.sched_states)
+            self.listen_state(self.on_schedule_state, sched, attribute='temp', loc=loc, target=rec.sched_temps)
+            self.listen_state(self.on_schedule_state, sched, attribute='next_event', loc=loc, target=rec.next_events)
+        self.gl.register_schedule_listener(f"{self.name}_{loc}", rec.schedules, self.on_config_change)
+
+    # ==============================================================================================
+    # LISTENERS
+    # ==============================================================================================
+    def on_room_state(self, entity, attribute, old, new, kwargs):
+        rec = self.rooms[kwargs["loc"]]
+        setattr(rec, kwargs["field"], new)
+        if kwargs["action"] == "claim":
+            self.evaluate([rec])
+        elif kwargs["action"] == "refresh":
+            self.debounced_refresh(rec, entity, new)
+
+    def on_schedule_state(self, entity, attribute, old, new, kwargs):
+        kwargs["target"][entity] = new
+        self.debounced_refresh(self.rooms[kwargs["loc"]], entity, new)
+
+    def on_master_switch(self, entity, attribute, old, new, kwargs):
+        self.mode = new
+        self.evaluate(list(self.rooms.values()), force_start=(new == "Heating" and old != "Heating"))
+
+    def on_global_change(self, entity, attribute, old, new, kwargs):
+        setattr(self, kwargs["field"], new)
+        if kwargs.get("mirror_only"):
+            return
+        records = [r for r in self.rooms.values() if r.has_boost or not kwargs.get("boost_only")]
+        self.evaluate(records)
+
+    def on_config_change(self, sched_entity):
+        self.compiled_schedules.pop(sched_entity, None)
+        for rec in self.rooms.values():
+            if sched_entity in rec.schedules:
+                self.prepare_dashboard_next_event(rec)
+
+    def force_refresh_handler(self, event_name, data, kwargs):
+        # One transaction around all rooms, so HeatSupplyManager evaluates once afterwards
+        with self.gl.transaction(event_name):
+            for rec in self.rooms.values():
+                self.turn_off(f'input_boolean.heating_claim_{rec.location}')
+                rec.claim = 'off'
+            self.refresh(list(self.rooms.values()), force_reset=True)
+
+    def debounced_refresh(self, rec, entity, new):
+        self.update_dashboard_msg(rec, 'Calculating next event...')
+        if rec.delay_timer:
+            try: self.cancel_timer(rec.delay_timer)
+            except: pass
+        # Use a longer debounce for schedule transitions to allow attributes to populate
+        delay = 3 if (entity.startswith("schedule.") and new == "on") else 1
+        rec.delay_timer = self.run_in(self.first_evaluation, delay, loc=rec.location)
+
+    # ==============================================================================================
+    # EVALUATION
+    # ==============================================================================================
+    def env(self):
+        return {
+            "mode": self.mode,
+            "garten": self.garten,
+            "factor": to_float(self.factor or 1.0, 1.0),
+            "threshold": to_float(self.threshold or 4.0, 4.0),
+            "margin": to_float(self.margin, 0.5),
+        }
+
+    def first_evaluation(self, kwargs):
+        loc = kwargs.get("loc")
+        records = [self.rooms[loc]] if loc else list(self.rooms.values())
+        ready = []
+        for rec in records:
+            rec.delay_timer = None
+            curr_sched = rec.current_schedule()
+            sched_temp = rec.sched_temps.get(curr_sched)
+            next_event = rec.next_events.get(curr_sched)
+            # Same race condition check as RoomDemandCalculator.first_evaluation
+            if rec.schedule_active() and sched_temp is None and (next_event is None or next_event == "None"):
+                retry_count = kwargs.get("retry_count", 0) if loc else 0
+                if retry_count < 2:
+                    self.log(f"⚠️ {curr_sched} is active but appears unloaded. Retrying in 5s...")
+                    self.run_in(self.first_evaluation, 5, loc=rec.location, retry_count=retry_count + 1)
+                    continue
+            ready.append(rec)
+        self.refresh(ready)
+        for rec in ready:
+            self.prepare_dashboard_next_event(rec)
+
+    def refresh(self, records, force_reset=False):
+        """Batch form of RoomDemandCalculator.refresh_logic."""
+        g_raw = self.garten
+        claim_records, overrides = [], []
+        for rec in records:
+            if rec.off_schedule():
+                self.set_target_temp(rec, 5.0)
+                self.apply(rec, (False, 0.0, "off", 0.0))
+                continue
+            if rec.schedule_active():
+                target = to_float(rec.sched_temps.get(rec.current_schedule()), None)
+                if target is None:
+                    target = to_float(rec.heat, 21.0)
+            else:
+                target = to_float(rec.base, 5.0)
+            self.set_target_temp(rec, target)
+            sun = room_sun_offset(rec, g_raw)
+            claim_records.append(rec)
+            overrides.append(target - sun)
+        self.evaluate(claim_records, overrides=overrides, force_reset=force_reset)
+
+    def evaluate(self, records, overrides=None, force_reset=False, force_start=False):
+        if not records:
+            return
+        results = evaluate_claims(records, self.env(), overrides, force_reset, force_start)
+        for rec, result in zip(records, results):
+            if result is not None:
+                self.apply(rec, result)
+
+    def apply(self, rec, result):
+        has_claim, boost, boost_enabled, sun = result
+        loc = rec.location
+        state, attributes = sun_status(loc, sun, self.garten)
+        self.gl.set_state_cached(self, f"binary_sensor.sun_compensation_{loc}", state, attributes)
+        new_state = 'on' if has_claim else 'off'
+        if rec.claim != new_state:
+            entity = f'input_boolean.heating_claim_{loc}'
+            self.turn_on(entity) if has_claim else self.turn_off(entity)
+            rec.claim = new_state
+        state, attributes = boost_status(loc, boost, boost, boost_enabled)
+        self.gl.set_state_cached(self, f"binary_sensor.boost_status_{loc}", state, attributes)
+
+    def set_target_temp(self, rec, x):
+        if to_float(rec.target, None) == x:
+            return
+        self.call_service("input_number/set_value", entity_id=f'input_number.target_temp_{rec.location}', value=x)
+        rec.target = x
+
+    # ==============================================================================================
+    # DASHBOARD
+    # ==============================================================================================
+    def update_dashboard_msg(self, rec, msg):
+        self.gl.call_service_cached(self, "input_text/set_value", f'input_text.next_event_{rec.location}', value=msg)
+
+    def prepare_dashboard_next_event(self, rec):
+        self.run_in(self.calculate_relay_chain, 1, loc=rec.location, sched_entity=rec.current_schedule())
+
+    def calculate_relay_chain(self, kwargs):
+        rec = self.rooms[kwargs["loc"]]
+        if rec.delay_timer is not None:
+            return
+        curr_sched = kwargs["sched_entity"]
+        try:
+            rules_dict = self.gl.get_schedule_rules(curr_sched)
+            if rules_dict is None:
+                self.log(f"No schedule definition available for {curr_sched}.", level="WARNING")
+                return
+            next_event_str = rec.next_events.get(curr_sched)
+            if not rules_dict or not next_event_str or next_event_str == "None":
+                self.update_dashboard_msg(rec, 'No heating scheduled.')
+                return
+            event_dt = datetime.strptime(next_event_str, '%Y-%m-%dT%H:%M:%S%z').astimezone()
+            if rec.schedule_active():
+                compiled = self.compiled_schedules.get(curr_sched)
+                if compiled is None:
+                    compiled = self.compiled_schedules[curr_sched] = CompiledSchedule(rules_dict)
+                true_end_dt = compiled.chain_end(event_dt)
+                limit_dt = event_dt + timedelta(days=7)
+                msg = 'Heating stops at next power cut ;)' if true_end_dt >= limit_dt else f"Heating stops at {RoomDemandCalculator.format_time_msg(true_end_dt)}"
+            else:
+                msg = f"Heating starts at {RoomDemandCalculator.format_time_msg(event_dt)}"
+            self.update_dashboard_msg(rec, msg)
+        except Exception as e:
+            self.log(f"Response Evaluation Error: {e}")
@@ -57,11 +57,12 @@ global_config:
 '''
 
 import hassapi as hass  # type: ignore
+from heating_metrics import Instrumented
 
 # ==================================================================================================
 # FROELING HEATING ESP INTERFACE
 # ==================================================================================================
-class FroelingHeatingESP(hass.Hass):
+class FroelingHeatingESP(Instrumented, hass.Hass):
     def initialize(self):
         self.gl = self.get_app("global_config")
         self.telegram_target = self.args.get('telegram_id')
@@ -71,23 +72,10 @@ class FroelingHeatingESP(hass.Hass):
         # Get the entity ID for the HK2 external pump control from globals
         self.hk2_pump_control = self.gl.get_heating("froeling_hk2_pump_external")
         
-        self.startup_timer = None
-        self.try_startup()
+        self.gl.when_ready(self, [self.target_temp_helper], self.boot_up)
 
-    def try_startup(self, kwargs=None):
-        if not self.check_system_health():
-            self.startup_timer = self.run_in(self.try_startup, 30)
-            return
-        self.boot_up()
-
-    def check_system_health(self):
-        if not self.entity_exists(self.target_temp_helper) or self.get_state(self.target_temp_helper) in ["unavailable", "unknown", None]:
-            self.log(f"Waiting for {self.target_temp_helper}...", level="WARNING")
-            return False
-        return True
-
-    def boot_up(self):
-        self.log("Froeling ESP Interface Booted. Modbus watchdog active.")
+    def boot_up(self, kwargs=None):
+        self.log(f"Froeling ESP Interface Booted after {self.gl.record_boot(self.name)}s. Modbus watchdog active.")
         
         # Monitor Modbus health
         self.listen_state(self.on_modbus_status_change, self.modbus_sensor)
@@ -131,12 +119,12 @@ class FroelingHeatingESP(hass.Hass):
             self.log("MODBUS DISCONNECTED!", level="ERROR")
             if self.telegram_target:
                 self.notify(self.telegram_target, "🚨 Boiler Modbus Down", 
-                            "ESP32 lost link to boiler.", True)
+                            "ESP32 lost link to boiler.", True, key="modbus_status")
         elif new == "on" and old == "off":
             self.log("MODBUS RESTORED", level="INFO")
             if self.telegram_target:
                 self.notify(self.telegram_target, "✅ Boiler Modbus Restored", 
-                            "Modbus connection established.", True)
+                            "Modbus connection established.", True, key="modbus_status")
 
-    def notify(self, target, title, message, disable_notification=True):
-        self.gl.send_telegram(target, title, message, disable_notification)
+    def notify(self, target, title, message, disable_notification=True, key=None):
+        self.gl.send_telegram(target, title, message, disable_notification, key)
@@ -65,104 +65,230 @@ global_config:
 
 '''
 import hassapi as hass  # type: ignore
+from collections import deque
 from datetime import datetime, timedelta, time
+from heating_async import AsyncEvaluation
+from heating_metrics import Instrumented
+from froeling_modbus_tcp import READ_HOLDING, READ_INPUT, ModbusTcpPool, plan_blocks, signed
+
+KEEP_ALIVE_SECONDS = 110
+PUMP_CONFIRM_SECONDS = 30  # an unconfirmed pump enable is sent again after this long
+LATENCY_BUCKETS = [5, 10, 20, 30, 60, 120, 300]  # seconds; everything above lands in 'inf'
+
+# Lambdatronic remote control registers (holding offsets for heating circuit 1; + circuit - 1), see doc/
+FLOW_TARGET_OFFSET = 8000     # 48001: Vorlauf-Solltemperatur, °C * 2
+PUMP_ENABLE_OFFSET = 8028     # 48029: Freigabe Heizkreis, 0/1
+OPERATING_MODE_OFFSET = 8046  # 48047: Betriebsart Heizkreis
+OPERATING_MODES = {0: "aus", 1: "automatik", 2: "extraheizen", 3: "absenken", 4: "dauerabsenken", 5: "party"}
 
 # ==================================================================================================
 # FROELING HEATING MODBUS (Actual Boiler Interaction)
 # ==================================================================================================
-class FroelingHeatingModbus(hass.Hass):
+class FroelingHeatingModbus(Instrumented, AsyncEvaluation, hass.Hass):
     def initialize(self):
         self.gl = self.get_app("global_config")
         
         self.flow_temp_entity = self.gl.get_heating('froeling_hk2_flow_temp_external')      
         self.pump_enable_entity = self.gl.get_heating('froeling_hk2_pump_external')         
         self.main_mode_entity = self.gl.get_heating('froeling_hk2_operating_mode')             
+        self.flow_report_entity = self.gl.get_heating('froeling_hk2_flow_target_temp')
         
         self.flow_target_helper = "input_number.target_flow_temp"
+        self.latency_sensor = self.args.get('latency_sensor', "sensor.froeling_actuation_latency")
         self.telegram_target = self.args.get('telegram_id') 
 
+        # 'ha' writes through the entities of the HA integration, 'tcp' talks Modbus TCP to the boiler directly
+        self.backend = self.args.get('backend', 'ha')
+        self.heating_circuit = int(self.args.get('heating_circuit', 2))
+        self.modbus = None
+
+        # Minimum spacing between two flow writes; changes arriving in between collapse into one trailing write
+        self.min_write_interval = float(self.args.get('min_write_interval', 10))
+
         self.last_flow_write_time = self.get_now()
+        self.shadow = {}  # entity -> last value written to / reported by the boiler
+        self.pump_enable_sent = None  # time of the last pump enable not yet confirmed by the boiler
+        self.write_stats = {"writes": 0, "skipped": 0, "collapsed": 0}
+        self.trailing_timer = None
+        self.keep_alive_timer = None
 
-        if not self.check_system_health():
+        self.pending_actuation = None  # (target, time of the HFFT change)
+        self.latency_samples = deque(maxlen=200)
+        self.latency_buckets = {b: 0 for b in LATENCY_BUCKETS + ["inf"]}
+
+        # Warm restart: last HFFT written and when, so a restart neither rewrites nor restarts the keep-alive rhythm
+        self.restored = self.gl.register_snapshot(self.name, self.snapshot_state)
+
+        if self.backend == 'tcp':
+            self.gl.when_ready(self, [self.flow_target_helper], self.boot_up)
             return
+        # 'unknown' is fine for the operating mode, it happens during active heating
+        critical = [self.flow_temp_entity, self.pump_enable_entity, self.main_mode_entity, self.flow_target_helper]
+        self.gl.when_ready(self, critical, self.boot_up, allow={self.main_mode_entity: ["unknown"]})
 
-        self.log("Modbus Interface Healthy. Registering listeners.")
-        
-        self.listen_state(self.on_target_flow_change, self.flow_target_helper)
-        self.listen_state(self.enforce_automatik_mode, self.main_mode_entity)
+    def boot_up(self, kwargs=None):
+        self.log(f"Modbus Interface Healthy after {self.gl.record_boot(self.name)}s. Registering listeners.")
         
-        # Start the Keep-Alive heartbeat (runs every 110s)
-        self.run_every(self.modbus_keep_alive, self.get_now(), 110)
-        
-        # Run an initial evaluation right away
-        self.evaluate_and_write_modbus()
+        if self.backend == 'tcp':
+            self.start_tcp_backend()
+        else:
+            self.shadow[self.pump_enable_entity] = self.get_state(self.pump_enable_entity)
+            self.listen_state(self.enforce_automatik_mode, self.main_mode_entity)
+            self.listen_state(self.on_pump_enable_change, self.pump_enable_entity)
+            if self.flow_report_entity and self.entity_exists(self.flow_report_entity):
+                self.listen_state(self.on_flow_report, self.flow_report_entity)
 
-    def check_system_health(self):
-        critical_entities = [
-            self.flow_temp_entity,
-            self.pump_enable_entity,
-            self.main_mode_entity,
-            self.flow_target_helper
-        ]
+        self.listen_state(self.hot(self.on_target_flow_change), self.flow_target_helper)
         
-        missing = []
-        unavailable = []
-        
-        for entity in critical_entities:
-            if not self.entity_exists(entity):
-                missing.append(entity)
-                continue
-            
-            state = self.get_state(entity)
-            
-            # Allow 'unknown' for main_mode_entity as it happens during active heating
-            if entity == self.main_mode_entity and state == "unknown":
-                continue
-
-            if state in ["unavailable", "unknown", None]:
-                unavailable.append(f"{entity} ({state})")
-
-        if missing:
-            self.log(f"CRITICAL: Entities missing: {missing}", level="ERROR")
-            return False
-
-        if unavailable:
-            self.log(f"Startup delayed. Waiting for: {unavailable}", level="WARNING")
-            self.run_in(self.initialize, 30)
-            return False
-        
-        return True
+        keep_alive = False
+        restored, self.restored = self.restored, None
+        if restored:
+            self.restore_snapshot(restored)
+            if self.flow_temp_entity in self.shadow:
+                elapsed = (self.get_now() - self.last_flow_write_time).total_seconds()
+                if elapsed < KEEP_ALIVE_SECONDS:
+                    self.arm_keep_alive(KEEP_ALIVE_SECONDS - elapsed)
+                else:
+                    keep_alive = True  # the boiler may have dropped the external specification meanwhile
+
+        # Run an initial evaluation right away; it also starts the keep-alive heartbeat
+        self.evaluate_and_write_modbus(keep_alive=keep_alive)
 
     def on_target_flow_change(self, entity, attribute, old, new, args):
-        # Instantly react to a change in the target flow helper
+        try: target = float(new or 0.0)
+        except (ValueError, TypeError): target = 0.0
+        if target > 0 and (self.pending_actuation is None or self.pending_actuation[0] != target):
+            self.pending_actuation = (target, self.get_now())
+
+        # Leading edge writes at once; anything inside the rate limit waits for a single trailing write
+        if self.trailing_timer:
+            self.write_stats["collapsed"] += 1
+            return
+        wait = self.min_write_interval - (self.get_now() - self.last_flow_write_time).total_seconds()
+        if wait > 0:
+            self.trailing_timer = self.run_in(self.hot(self.trailing_write), wait)
+            return
         self.evaluate_and_write_modbus()
 
+    def trailing_write(self, kwargs):
+        self.trailing_timer = None
+        self.evaluate_and_write_modbus()
+
+    def on_pump_enable_change(self, entity, attribute, old, new, args):
+        self.shadow[entity] = new
+        if new == 'ein':
+            self.pump_enable_sent = None
+
     def modbus_keep_alive(self, kwargs):
         # The heartbeat function
-        self.evaluate_and_write_modbus()
+        self.keep_alive_timer = None
+        if not self.modbus:
+            # Reconcile the pump state in case a state change was missed (the TCP backend polls it)
+            self.on_pump_enable_change(self.pump_enable_entity, None, None, self.get_state(self.pump_enable_entity), {})
+        self.evaluate_and_write_modbus(keep_alive=True)
+
+    def arm_keep_alive(self, delay=KEEP_ALIVE_SECONDS):
+        """The Lambdatronic drops the external specification without a write every ~2 min; 110s after the last one is enough."""
+        if self.keep_alive_timer:
+            try: self.cancel_timer(self.keep_alive_timer)
+            except: pass
+        self.keep_alive_timer = self.run_in(self.hot(self.modbus_keep_alive), delay)
 
-    def evaluate_and_write_modbus(self):
+    def evaluate_and_write_modbus(self, keep_alive=False):
         try:
             target = float(self.get_state(self.flow_target_helper) or 0.0)
         except (ValueError, TypeError):
             target = 0.0
 
         if target > 0:
-            # 1. Continually write Flow Temp (Triggering Boiler Keep-Alive)
-            self.call_service("number/set_value", entity_id=self.flow_temp_entity, value=target)
-            self.last_flow_write_time = self.get_now()
-
-            # 2. Ensure External Pump is Enabled ('ein')
-            current_pump_state = self.get_state(self.pump_enable_entity)
-            if current_pump_state != 'ein':
-                self.log(f"Enabling Heating Pump (State was: {current_pump_state})")
-                self.call_service("select/select_option", entity_id=self.pump_enable_entity, option='ein')
-                if self.telegram_target:
-                     self.notify(self.telegram_target, "🌀 Heating Active", f"Pump enabled.\nFlow Target: {target}°C", True)
+            # 1. Write Flow Temp if it changed; the keep-alive rewrites it regardless (Triggering Boiler Keep-Alive)
+            if keep_alive or self.shadow.get(self.flow_temp_entity) != target:
+                self.write_flow(target)
+                self.shadow[self.flow_temp_entity] = target
+                self.last_flow_write_time = self.get_now()
+                self.write_stats["writes"] += 1
+                self.arm_keep_alive()
+                self.gl.snapshot_changed(self.name)
+            else:
+                self.write_stats["skipped"] += 1
+
+            # 2. Ensure External Pump is Enabled ('ein'); the shadow is only set by the boiler's confirmation
+            current_pump_state = self.shadow.get(self.pump_enable_entity)
+            sent = self.pump_enable_sent
+            if current_pump_state != 'ein' and (sent is None or (self.get_now() - sent).total_seconds() >= PUMP_CONFIRM_SECONDS):
+                if sent is None:
+                    self.log(f"Enabling Heating Pump (State was: {current_pump_state})")
+                    if self.telegram_target:
+                         self.notify(self.telegram_target, "🌀 Heating Active", f"Pump enabled.\nFlow Target: {target}°C", True)
+                else:
+                    self.log(f"Pump enable not confirmed (State is: {current_pump_state}), sending again.", level="WARNING")
+                self.write_pump_enable()
+                self.pump_enable_sent = self.get_now()
         else:
             # Target is 0. Do NOT write 0 to the boiler Modbus register. 
-            # Simply stop poking it.
-            pass
+            # Simply stop poking it (and forget the shadow, the boiler falls back to its own curve).
+            if self.shadow.pop(self.flow_temp_entity, None) is not None:
+                self.gl.snapshot_changed(self.name)
+            self.pending_actuation = None
+
+        if self.keep_alive_timer is None:
+            self.arm_keep_alive()
+
+    # ==============================================================================================
+    # WARM RESTART SNAPSHOT (see GlobalSettings.register_snapshot)
+    # ==============================================================================================
+    def snapshot_state(self):
+        if self.restored is not None:
+            return self.restored  # not booted yet, keep the previous run's state
+        pending = self.pending_actuation
+        return {
+            "flow_target": self.shadow.get(self.flow_temp_entity),
+            "last_flow_write": self.last_flow_write_time.isoformat(),
+            "pending_actuation": [pending[0], pending[1].isoformat()] if pending else None,
+        }
+
+    def restore_snapshot(self, state):
+        self.last_flow_write_time = datetime.fromisoformat(state["last_flow_write"])
+        if state.get("flow_target") is not None:
+            self.shadow[self.flow_temp_entity] = state["flow_target"]
+        if state.get("pending_actuation"):
+            target, changed_at = state["pending_actuation"]
+            self.pending_actuation = (target, datetime.fromisoformat(changed_at))
+        self.log(f"Warm restart: last HFFT {state.get('flow_target')} written at {self.last_flow_write_time.strftime('%H:%M:%S')}.")
+
+    # ==============================================================================================
+    # ACTUATION LATENCY (HFFT change -> value reported back by the boiler)
+    # ==============================================================================================
+    def on_flow_report(self, entity, attribute, old, new, args):
+        if self.pending_actuation is None:
+            return
+        try: reported = float(new)
+        except (ValueError, TypeError): return
+        target, changed_at = self.pending_actuation
+        # The register has 0.5°C resolution
+        if abs(reported - target) > 0.25:
+            return
+        self.pending_actuation = None
+        self.record_latency((self.get_now() - changed_at).total_seconds())
+
+    def record_latency(self, seconds):
+        self.latency_samples.append(seconds)
+        bucket = next((b for b in LATENCY_BUCKETS if seconds <= b), "inf")
+        self.latency_buckets[bucket] += 1
+
+        ordered = sorted(self.latency_samples)
+        pick = lambda pct: ordered[min(len(ordered) - 1, int(pct * len(ordered)))]
+        attributes = {
+            "unit_of_measurement": "s",
+            "friendly_name": "Froeling Actuation Latency",
+            "count": sum(self.latency_buckets.values()),
+            "p50": round(pick(0.5), 1),
+            "p95": round(pick(0.95), 1),
+            "max": round(ordered[-1], 1),
+            "buckets": {f"le_{b}": n for b, n in self.latency_buckets.items()},
+            "writes": dict(self.write_stats),
+        }
+        self.set_state(self.latency_sensor, state=round(seconds, 1), attributes=attributes)
 
     def enforce_automatik_mode(self, entity, attribute, old, new, args):
         if new in ["automatik", "unknown", "unavailable", None]:
@@ -174,7 +300,109 @@ class FroelingHeatingModbus(hass.Hass):
             return
 
         self.log(f"Heating idle (last write {int(time_since_last_write)}s ago). Mode is '{new}'. Resetting to 'automatik'.")
-        self.call_service("select/select_option", entity_id=entity, option='automatik')
+        self.write_automatik_mode()
+
+    def notify(self, target, title, message, disable_notification=True, key=None):
+        self.gl.send_telegram(target, title, message, disable_notification, key)
+
+    # ==============================================================================================
+    # WRITES (HA integration entities or direct Modbus TCP)
+    # ==============================================================================================
+    def write_flow(self, target):
+        if self.modbus:
+            self.write_register(FLOW_TARGET_OFFSET, int(round(target * 2)))
+        else:
+            self.call_service("number/set_value", entity_id=self.flow_temp_entity, value=target)
+
+    def write_pump_enable(self):
+        if self.modbus:
+            self.write_register(PUMP_ENABLE_OFFSET, 1)
+        else:
+            self.call_service("select/select_option", entity_id=self.pump_enable_entity, option='ein')
+
+    def write_automatik_mode(self):
+        if self.modbus:
+            self.write_register(OPERATING_MODE_OFFSET, 1)
+        else:
+            self.call_service("select/select_option", entity_id=self.main_mode_entity, option='automatik')
+
+    # ==============================================================================================
+    # DIRECT MODBUS TCP BACKEND (backend: tcp)
+    # ==============================================================================================
+    def start_tcp_backend(self):
+        """Persistent connection(s) to the boiler; the remote control registers plus poll_registers are polled in blocks."""
+        hk = self.heating_circuit - 1
+        self.polled = {}  # (function, offset) -> [entity, scale]
+        for entity, spec in (self.args.get('poll_registers') or {}).items():
+            reg_id, scale = (spec, 1) if isinstance(spec, int) else (int(spec['register']), float(spec.get('scale', 1)))
+            key = (READ_INPUT, reg_id - 30001) if reg_id < 40001 else (READ_HOLDING, reg_id - 40001)
+            self.polled[key] = (entity, scale)
+        self.flow_report_key = (READ_INPUT, 1001 + 30 * self.heating_circuit)  # 'HKn - Vorlauf-Solltemperatur'
+        self.pump_enable_key = (READ_HOLDING, PUMP_ENABLE_OFFSET + hk)
+        self.mode_key = (READ_HOLDING, OPERATING_MODE_OFFSET + hk)
+
+        keys = set(self.polled) | {self.flow_report_key, self.pump_enable_key, self.mode_key}
+        max_gap = int(self.args.get('poll_max_gap', 8))
+        self.poll_reads = [(function, start, count)
+                           for function in (READ_INPUT, READ_HOLDING)
+                           for start, count in plan_blocks([o for f, o in keys if f == function], max_gap)]
+        self.poll_values = {}
+        self.mode_value = None
+        self.tcp_errors = 0
+
+        self.modbus = ModbusTcpPool(self.args.get('modbus_host'), int(self.args.get('modbus_port', 502)),
+                                    int(self.args.get('unit_id', 2)), int(self.args.get('connections', 1)))
+        self.log(f"Modbus TCP backend: {self.args.get('modbus_host')}:{self.args.get('modbus_port', 502)}, "
+                 f"{len(keys)} registers in {len(self.poll_reads)} block reads")
+        self.run_every(self.poll_boiler, "now", int(self.args.get('poll_interval', 10)))
+
+    def write_register(self, offset, raw):
+        offset += self.heating_circuit - 1
+
+        def done(result, error):
+            if error:
+                self.run_in(self.on_write_failed, 0, offset=offset, error=str(error))
+        self.modbus.write(offset, raw, done)
+
+    def on_write_failed(self, kwargs):
+        self.log(f"Modbus TCP write to {40001 + kwargs['offset']} failed: {kwargs['error']}", level="WARNING")
+        # Forget what we believe the boiler has, the next evaluation writes again
+        base = kwargs['offset'] - (self.heating_circuit - 1)
+        if base == FLOW_TARGET_OFFSET:
+            self.shadow.pop(self.flow_temp_entity, None)
+            self.gl.snapshot_changed(self.name)
+        elif base == PUMP_ENABLE_OFFSET:
+            self.shadow.pop(self.pump_enable_entity, None)
+            self.pump_enable_sent = None
+
+    def poll_boiler(self, kwargs):
+        # Skipped while the previous poll is still queued (e.g. the boiler is slow or unreachable)
+        self.modbus.poll(self.poll_reads, lambda values, error: self.run_in(
+            self.on_poll_result, 0, values=values, error=str(error) if error else None))
+
+    def on_poll_result(self, kwargs):
+        if kwargs.get('error'):
+            self.tcp_errors += 1
+            if self.tcp_errors == 1:
+                self.log(f"Modbus TCP poll failed: {kwargs['error']}", level="WARNING")
+        elif self.tcp_errors:
+            self.log(f"Modbus TCP poll working again after {self.tcp_errors} failed polls.")
+            self.tcp_errors = 0
+        values = kwargs.get('values') or {}
+
+        for key, (entity, scale) in self.polled.items():
+            if key in values and self.poll_values.get(key) != values[key]:
+                self.poll_values[key] = values[key]
+                self.gl.set_state_cached(self, entity, round(signed(values[key]) / scale, 2))
+
+        if self.pump_enable_key in values:
+            self.on_pump_enable_change(self.pump_enable_entity, None, None, 'ein' if values[self.pump_enable_key] == 1 else 'aus', {})
+        if self.flow_report_key in values:
+            self.on_flow_report(None, None, None, signed(values[self.flow_report_key]) / 2, {})
+        if self.mode_key in values and values[self.mode_key] != self.mode_value:
+            self.mode_value = values[self.mode_key]
+            self.enforce_automatik_mode(self.main_mode_entity, None, None, OPERATING_MODES.get(self.mode_value, "unknown"), {})
 
-    def notify(self, target, title, message, disable_notification=True):
-        self.gl.send_telegram(target, title, message, disable_notification)
+    def terminate(self):
+        if self.modbus:
+            self.modbus.close()
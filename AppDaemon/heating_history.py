@@ -0,0 +1,240 @@
+''' Manual
+HeatingHistory keeps a fixed-size history of the heating data in AppDaemon itself: per room the
+temperature, target temperature, heating claim, boost, sun compensation and valve position (if in
+valve_map), plus every outdoor sensor and the HFFT (input_number.target_flow_temp).
+
+Each series lives in its own memory-mapped file in `history_dir` (raw samples plus 5 min and 1 h
+rollups, all ring buffers of doubles), so the history survives AppDaemon restarts without replaying
+HA's recorder. Rollups are time-weighted min/max/mean, updated incrementally with every sample.
+
+Published as sensor.heating_history_<series> (e.g. sensor.heating_history_stubbe_temp): state is the
+latest value, attributes `rollup_5m` (last 2 hours) and `rollup_1h` (last 24 hours) are lists of
+[bucket start (unix time), min, max, mean], ready for dashboard charts.
+
+apps.yaml: history_dir, capacity (raw samples per series, default 4096).
+'''
+
+import hassapi as hass  # type: ignore
+import math
+import mmap
+import os
+from array import array
+from datetime import timedelta
+from heating_metrics import Instrumented
+
+VERSION = 1
+ROLLUPS = [("rollup_5m", 300, 288, 24), ("rollup_1h", 3600, 336, 24)]  # name, seconds, kept, published
+UNAVAILABLE = [None, "unavailable", "unknown"]
+
+# ==================================================================================================
+# RING BUFFER STORE
+# ==================================================================================================
+class RingBuffer:
+    """Fixed number of records of `width` doubles on a slice of a memory-mapped file; slot 0 counts writes."""
+    def __init__(self, view, capacity, width):
+        self.view = view
+        self.capacity = capacity
+        self.width = width
+
+    def __len__(self):
+        return min(int(self.view[0]), self.capacity)
+
+    def append(self, record):
+        written = int(self.view[0])
+        base = 1 + (written % self.capacity) * self.width
+        self.view[base:base + self.width] = array('d', record)
+        self.view[0] = written + 1
+
+    def records(self, last=None):
+        """Records in chronological order (only the newest `last` ones if given)."""
+        written, n = int(self.view[0]), len(self)
+        if last is not None:
+            n = min(n, last)
+        out = []
+        for i in range(written - n, written):
+            base = 1 + (i % self.capacity) * self.width
+            out.append(tuple(self.view[base:base + self.width]))
+        return out
+
+    @staticmethod
+    def size(capacity, width):
+        return 1 + capacity * width
+
+
+class Rollup:
+    """Time-weighted min/max/mean per fixed bucket, fed with 'value held from t0 to t1' segments."""
+    def __init__(self, seconds, ring):
+        self.seconds = seconds
+        self.ring = ring
+        self.start = None
+        self.reset()
+
+    def reset(self):
+        self.lo = self.hi = None
+        self.area = 0.0
+        self.covered = 0.0
+
+    def feed(self, t0, t1, value):
+        """Returns True if at least one bucket was closed."""
+        closed = False
+        while t0 < t1:
+            if self.start is None:
+                self.start = t0 - t0 % self.seconds
+            end = self.start + self.seconds
+            seg_end = min(t1, end)
+            if value is not None:
+                self.lo = value if self.lo is None else min(self.lo, value)
+                self.hi = value if self.hi is None else max(self.hi, value)
+                self.area += value * (seg_end - t0)
+                self.covered += seg_end - t0
+            t0 = seg_end
+            if t0 >= end:
+                closed = self.close() or closed
+                self.start = None
+        return closed
+
+    def close(self):
+        closed = self.covered > 0
+        if closed:
+            self.ring.append((self.start, self.lo, self.hi, self.area / self.covered))
+        self.reset()
+        return closed
+
+
+class Series:
+    """One memory-mapped file: header, raw (time, value) samples and one ring per rollup."""
+    def __init__(self, path, capacity):
+        layout = [(capacity, 2)] + [(kept, 4) for _, _, kept, _ in ROLLUPS]
+        header = [VERSION, capacity] + [kept for _, _, kept, _ in ROLLUPS]
+        doubles = len(header) + sum(RingBuffer.size(c, w) for c, w in layout)
+
+        fresh = not os.path.exists(path) or os.path.getsize(path) != doubles * 8
+        with open(path, "w+b" if fresh else "r+b") as f:
+            if fresh:
+                f.truncate(doubles * 8)
+            self.mm = mmap.mmap(f.fileno(), doubles * 8)
+        view = memoryview(self.mm).cast('d')
+        if list(view[:len(header)]) != header:
+            view[:] = array('d', bytes(doubles * 8))  # different layout: start over
+            view[:len(header)] = array('d', header)
+
+        offset = len(header)
+        rings = []
+        for c, w in layout:
+            rings.append(RingBuffer(view[offset:offset + RingBuffer.size(c, w)], c, w))
+            offset += RingBuffer.size(c, w)
+        self.raw = rings[0]
+        self.rollups = {name: Rollup(seconds, ring) for (name, seconds, _, _), ring in zip(ROLLUPS, rings[1:])}
+        self.last = None  # (time, value) of the sample currently held
+
+    def add(self, t, value):
+        """Records a new sample; returns True if a rollup bucket was closed."""
+        closed = self.advance(t)
+        self.raw.append((t, math.nan if value is None else value))
+        self.last = (t, value)
+        return closed
+
+    def advance(self, t):
+        """Extends the held value up to t (closes due buckets even without new samples)."""
+        if self.last is None or t <= self.last[0]:
+            return False
+        closed = False
+        for rollup in self.rollups.values():
+            closed = rollup.feed(self.last[0], t, self.last[1]) or closed
+        self.last = (t, self.last[1])
+        return closed
+
+    def samples(self, since=None):
+        """(time, value) samples since `since` (value None where unavailable). Raw samples cover a few days
+        only (capacity), so older parts of the window come from the 1 h rollup means (up to 14 days)."""
+        raw = [(t, None if math.isnan(v) else v) for t, v in self.raw.records() if since is None or t >= since]
+        oldest = raw[0][0] if raw else math.inf
+        hourly = [(start, mean) for start, _, _, mean in self.rollups["rollup_1h"].ring.records()
+                  if start + 3600 <= oldest and (since is None or start >= since)]
+        return hourly + raw
+
+    def flush(self):
+        self.mm.flush()
+
+# ==================================================================================================
+# HEATING HISTORY (app)
+# ==================================================================================================
+class HeatingHistory(Instrumented, hass.Hass):
+    def initialize(self):
+        self.gl = self.get_app("global_config")
+        self.history_dir = self.args.get("history_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), "history"))
+        self.capacity = int(self.args.get("capacity", 4096))
+        os.makedirs(self.history_dir, exist_ok=True)
+
+        self.series = {}
+        self.parsers = {}
+        for name, entity, attribute, parser in self.series_definitions():
+            self.series[name] = Series(os.path.join(self.history_dir, f"{name}.ring"), self.capacity)
+            self.parsers[name] = parser
+            # Start from the current state; whatever happened while AppDaemon was down is not interpolated
+            self.record(name, parser(self.get_state(entity, attribute=attribute)))
+            if attribute:
+                self.listen_state(self.on_change, entity, attribute=attribute, series=name)
+            else:
+                self.listen_state(self.on_change, entity, series=name)
+
+        # Close and publish rollup buckets on time, also for series that do not change
+        start = self.get_now().replace(second=5, microsecond=0) + timedelta(minutes=5 - self.get_now().minute % 5)
+        self.run_every(self.on_tick, start, 300)
+        self.log(f"History store running {len(self.series)} series in {self.history_dir}.")
+
+    def series_definitions(self):
+        to_float, to_binary = self.parse_float, self.parse_binary
+        definitions = [("hfft", "input_number.target_flow_temp", None, to_float)]
+        for key, sensor in self.gl.args.get("temp_outdoor_map", {}).items():
+            definitions.append((f"outdoor_{key}", sensor, None, to_float))
+        for loc, sensor in self.gl.get_all_rooms().items():
+            definitions += [
+                (f"{loc}_temp", sensor, None, to_float),
+                (f"{loc}_target", f"input_number.target_temp_{loc}", None, to_float),
+                (f"{loc}_claim", f"input_boolean.heating_claim_{loc}", None, to_binary),
+                (f"{loc}_boost", f"binary_sensor.boost_status_{loc}", "boost", to_float),
+                (f"{loc}_sun", f"binary_sensor.sun_compensation_{loc}", "compensation", to_float),
+            ]
+            valve = self.gl.get_valve_map(loc)
+            if valve:
+                definitions.append((f"{loc}_valve", valve, None, to_float))
+        return definitions
+
+    @staticmethod
+    def parse_float(raw):
+        if raw in UNAVAILABLE:
+            return None
+        try: return float(raw)
+        except (ValueError, TypeError): return None
+
+    @staticmethod
+    def parse_binary(raw):
+        return None if raw in UNAVAILABLE else (1.0 if raw == "on" else 0.0)
+
+    def on_change(self, entity, attribute, old, new, kwargs):
+        self.record(kwargs["series"], self.parsers[kwargs["series"]](new))
+
+    def record(self, name, value):
+        if self.series[name].add(self.get_now().timestamp(), value):
+            self.publish(name)
+
+    def on_tick(self, kwargs):
+        now = self.get_now().timestamp()
+        for name, series in self.series.items():
+            if series.advance(now):
+                self.publish(name)
+            series.flush()
+
+    def publish(self, name):
+        series = self.series[name]
+        attributes = {"friendly_name": f"Heating History {name.replace('_', ' ').title()}"}
+        for rollup_name, _, _, published in ROLLUPS:
+            attributes[rollup_name] = [[int(r[0])] + [round(v, 2) for v in r[1:]]
+                                       for r in series.rollups[rollup_name].ring.records(published)]
+        value = series.last[1] if series.last else None
+        self.gl.set_state_cached(self, f"sensor.heating_history_{name}", "unavailable" if value is None else value, attributes)
+
+    def get_series(self, name, since=None):
+        """(time, value) samples of a series for other apps, hourly means where the raw samples do not reach back."""
+        return self.series[name].samples(since)
@@ -0,0 +1,221 @@
+'''
+Callback instrumentation for the heating apps (not an app itself; imported by the apps)
+
+Apps that list `Instrumented` before `hass.Hass` in their bases get every callback registered via
+listen_state / listen_event / run_in / run_every timed, and every get_state / entity_exists /
+set_state / call_service made during a callback counted against that callback:
+
+    class HeatSupplyManager(Instrumented, hass.Hass):
+
+Callbacks handed to GlobalSettings (subscribe, subscribe_event, register_schedule_listener) are
+wrapped there via instrument(). GlobalSettings exports the numbers periodically as
+sensor.heating_metrics and as a Prometheus text file (see 'metrics_*' in apps.yaml).
+Native async callbacks (async_mode, see heating_async.py) are timed as a whole; their API calls are
+counted for the part that runs in the executor.
+'''
+import asyncio
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)  # seconds
+API_CALLS = ("get_state", "entity_exists", "set_state", "call_service")
+
+ENABLED = True
+REGISTRY = {}  # (app name, callback name) -> CallbackStats
+_registry_lock = threading.Lock()
+_local = threading.local()  # .stats = CallbackStats of the callback running in this thread
+
+
+class CallbackStats:
+    __slots__ = ("count", "errors", "total", "max", "buckets", "api")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+        self.api = dict.fromkeys(API_CALLS, 0)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+
+def _stats_for(key):
+    stats = REGISTRY.get(key)
+    if stats is None:
+        with _registry_lock:
+            stats = REGISTRY.setdefault(key, CallbackStats())
+    return stats
+
+
+def count_api(api):
+    stats = getattr(_local, "stats", None)
+    if stats is not None:
+        stats.api[api] += 1
+
+
+def instrument(callback, app=None):
+    """Returns callback wrapped for timing if it is a method of an Instrumented app (or app is given), else callback itself."""
+    app = app or getattr(callback, "__self__", None)
+    if not isinstance(app, Instrumented) or hasattr(callback, "__wrapped__"):
+        return callback
+    key = (app.name, callback.__name__)
+
+    if asyncio.iscoroutinefunction(callback):
+        # Native async callbacks (see heating_async): timed here, API calls counted by their executor part
+        @functools.wraps(callback)
+        async def async_wrapper(*args, **kwargs):
+            if not ENABLED:
+                return await callback(*args, **kwargs)
+            stats = _stats_for(key)
+            start = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.observe(time.perf_counter() - start)
+        return async_wrapper
+
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        # Nested callbacks (e.g. one callback calling another directly) count towards the outer one
+        if not ENABLED or getattr(_local, "stats", None) is not None:
+            return callback(*args, **kwargs)
+        stats = _stats_for(key)
+        _local.stats = stats
+        start = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.observe(time.perf_counter() - start)
+            _local.stats = None
+    return wrapper
+
+
+@contextmanager
+def counting(app_name, callback_name):
+    """Counts the API calls made in this thread towards a callback without timing it (async passes)."""
+    if not ENABLED or getattr(_local, "stats", None) is not None:
+        yield
+        return
+    _local.stats = _stats_for((app_name, callback_name))
+    try:
+        yield
+    finally:
+        _local.stats = None
+
+
+# ==================================================================================================
+# MIXIN
+# ==================================================================================================
+class Instrumented:
+    """Mixin for hass.Hass apps; must come before hass.Hass in the bases."""
+
+    def listen_state(self, callback, *args, **kwargs):
+        return super().listen_state(instrument(callback), *args, **kwargs)
+
+    def listen_event(self, callback, *args, **kwargs):
+        return super().listen_event(instrument(callback), *args, **kwargs)
+
+    def run_in(self, callback, *args, **kwargs):
+        return super().run_in(instrument(callback), *args, **kwargs)
+
+    def run_every(self, callback, *args, **kwargs):
+        return super().run_every(instrument(callback), *args, **kwargs)
+
+    def get_state(self, *args, **kwargs):
+        count_api("get_state")
+        return super().get_state(*args, **kwargs)
+
+    def entity_exists(self, *args, **kwargs):
+        count_api("entity_exists")
+        return super().entity_exists(*args, **kwargs)
+
+    def set_state(self, *args, **kwargs):
+        count_api("set_state")
+        return super().set_state(*args, **kwargs)
+
+    def call_service(self, *args, **kwargs):
+        count_api("call_service")
+        return super().call_service(*args, **kwargs)
+
+
+# ==================================================================================================
+# EXPORT
+# ==================================================================================================
+def snapshot():
+    with _registry_lock:
+        items = list(REGISTRY.items())
+    return sorted(items, key=lambda item: item[1].total, reverse=True)
+
+
+def summary(top=20):
+    """Attributes for the HA sensor: the `top` callbacks by total time spent."""
+    callbacks = {}
+    for (app, name), s in snapshot()[:top]:
+        if not s.count:
+            continue
+        callbacks[f"{app}.{name}"] = {
+            "count": s.count,
+            "errors": s.errors,
+            "mean_ms": round(s.total / s.count * 1e3, 3),
+            "max_ms": round(s.max * 1e3, 3),
+            "api_per_call": {api: round(n / s.count, 2) for api, n in s.api.items() if n},
+        }
+    return callbacks
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_prometheus():
+    lines = [
+        "# HELP heating_callback_duration_seconds Time spent in AppDaemon callbacks of the heating apps.",
+        "# TYPE heating_callback_duration_seconds histogram",
+    ]
+    items = snapshot()
+    for (app, name), s in items:
+        labels = f'app="{_label(app)}",callback="{_label(name)}"'
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), s.buckets):
+            cumulative += n
+            lines.append(f'heating_callback_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"heating_callback_duration_seconds_sum{{{labels}}} {s.total:.6f}")
+        lines.append(f"heating_callback_duration_seconds_count{{{labels}}} {s.count}")
+    lines += [
+        "# HELP heating_callback_errors_total Callbacks that raised an exception.",
+        "# TYPE heating_callback_errors_total counter",
+    ]
+    for (app, name), s in items:
+        lines.append(f'heating_callback_errors_total{{app="{_label(app)}",callback="{_label(name)}"}} {s.errors}')
+    lines += [
+        "# HELP heating_callback_api_calls_total HA API calls made while handling a callback.",
+        "# TYPE heating_callback_api_calls_total counter",
+    ]
+    for (app, name), s in items:
+        for api, n in s.api.items():
+            lines.append(f'heating_callback_api_calls_total{{app="{_label(app)}",callback="{_label(name)}",api="{api}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """Writes the text exposition atomically (node_exporter's textfile collector never sees half a file)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
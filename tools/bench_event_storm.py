@@ -0,0 +1,115 @@
+'''
+Event-storm benchmark for the heating apps (runs offline on top of fake_hass.FakeHouse)
+
+Fires a configurable storm of sensor updates (room temperatures, optionally garden and outdoor
+temperature ticks) against the real apps and reports throughput, service calls per input event
+and callback latency percentiles.
+
+    python tools/bench_event_storm.py --events 5000 --interval 0.2 --garden-every 10
+    python tools/bench_event_storm.py --events 2000 --active     # schedules on, rooms claiming
+'''
+
+import argparse
+import json
+import random
+import time
+
+from fake_hass import FakeHouse
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def run(args):
+    rnd = random.Random(args.seed)
+    house = FakeHouse().boot()
+    gl = house.config["global_config"]
+    room_sensors = list(gl["temp_room_map"].values())
+    garden = gl["temp_outdoor_map"].get("garten_temp")
+    outdoor = [s for k, s in gl["temp_outdoor_map"].items() if k != "garten_temp"]
+
+    if args.active:
+        # Every schedule active and rooms cold enough to claim, so the full claim/boost path runs
+        for room in house.rooms:
+            house.set_state(f"schedule.standard_{room}", "on", {"temp": 21.0})
+        house.advance(30)
+
+    house.reset_stats()
+    temps = {s: float(house.get_state(s)) for s in room_sensors}
+    garden_t = 18.0
+    started = time.perf_counter()
+
+    for i in range(args.events):
+        sensor = rnd.choice(room_sensors)
+        temps[sensor] = round(temps[sensor] + rnd.uniform(-0.3, 0.3), 1)
+        house.set_state(sensor, temps[sensor])
+        if args.garden_every and i % args.garden_every == 0 and garden:
+            garden_t = round(garden_t + rnd.uniform(-0.5, 0.6), 1)
+            house.set_state(garden, garden_t)
+        if args.outdoor_every and i % args.outdoor_every == 0 and outdoor:
+            house.set_state(rnd.choice(outdoor), round(rnd.uniform(-5, 10), 1))
+        house.advance(args.interval)
+    house.advance(args.settle)
+
+    elapsed = time.perf_counter() - started
+    latencies = sorted(v for values in house.runtime.callback_latency.values() for v in values)
+    per_callback = sorted(((key, sum(v), len(v)) for key, v in house.runtime.callback_latency.items()),
+                          key=lambda x: x[1], reverse=True)
+    stats = house.stats
+    writes = stats["services"] + stats["api_calls"].get("set_state", 0)
+
+    report = {
+        "events": args.events,
+        "wall_seconds": round(elapsed, 3),
+        "events_per_sec": round(args.events / elapsed, 1) if elapsed else None,
+        "service_calls_per_event": round(stats["services"] / args.events, 3),
+        "writes_per_event": round(writes / args.events, 3),
+        "reads_per_event": round((stats["api_calls"].get("get_state", 0) + stats["api_calls"].get("entity_exists", 0)) / args.events, 3),
+        "callbacks": stats["callbacks"],
+        "latency_us": {f"p{p}": round(percentile(latencies, p) * 1e6, 1) for p in [50, 90, 95, 99]},
+        "latency_us_max": round(latencies[-1] * 1e6, 1) if latencies else 0.0,
+        "top_callbacks": [{"callback": k, "total_ms": round(t * 1e3, 2), "count": n} for k, t, n in per_callback[:args.top]],
+        "api_calls": stats["api_calls"],
+    }
+    gl_app = house.apps.get("global_config")
+    if gl_app is not None and hasattr(gl_app, "get_write_stats"):
+        report["write_cache"] = gl_app.get_write_stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event-storm benchmark for the heating apps.")
+    parser.add_argument("--events", type=int, default=2000, help="number of room temperature updates")
+    parser.add_argument("--interval", type=float, default=0.5, help="virtual seconds between updates")
+    parser.add_argument("--garden-every", type=int, default=20, help="garden temperature tick every N events (0 = never)")
+    parser.add_argument("--outdoor-every", type=int, default=50, help="outdoor temperature tick every N events (0 = never)")
+    parser.add_argument("--settle", type=float, default=30, help="virtual seconds to drain timers after the storm")
+    parser.add_argument("--active", action="store_true", help="switch all schedules on before the storm")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--top", type=int, default=8, help="number of most expensive callbacks to list")
+    parser.add_argument("--json", action="store_true", help="print the raw JSON report")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"events:                 {report['events']} in {report['wall_seconds']} s ({report['events_per_sec']} events/s)")
+    print(f"service calls / event:  {report['service_calls_per_event']}")
+    print(f"writes / event:         {report['writes_per_event']}")
+    print(f"reads / event:          {report['reads_per_event']}")
+    print(f"callbacks:              {report['callbacks']}")
+    print("latency (us):           " + ", ".join(f"{k}={v}" for k, v in report["latency_us"].items()) + f", max={report['latency_us_max']}")
+    if "write_cache" in report:
+        print(f"write cache:            {report['write_cache']}")
+    print("most expensive callbacks:")
+    for row in report["top_callbacks"]:
+        print(f"  {row['callback']:55} {row['total_ms']:9.2f} ms  x{row['count']}")
+
+
+if __name__ == "__main__":
+    main()
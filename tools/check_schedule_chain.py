@@ -0,0 +1,118 @@
+'''
+Checks CompiledSchedule.chain_end against the day-by-day walk it replaced (find_true_chain_end)
+
+    python tools/check_schedule_chain.py --schedules 2000 --seed 1
+
+Generates random weekly schedules in the shape of a schedule/get_schedule response (non-overlapping
+blocks per day, gaps of a few seconds to hours, days ending at 23:59:59.999999 or a minute before
+midnight) and compares the chain end from every block start. Known, intended differences:
+
+* midnight: a block ending within 65 s before midnight is chained into a block starting at 00:00 of
+  the next day. The old walk only chained across midnight for blocks ending at 24:00.
+* limit: both reach the 7 day cap; the old walk could overshoot it by up to a day, the new one
+  returns start + 7 days (both give "Heating stops at next power cut").
+
+Any other difference is reported as a mismatch and the script exits with status 1.
+'''
+
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+from fake_hass import APPDAEMON_DIR, install_hassapi_shim
+
+install_hassapi_shim()
+sys.path.insert(0, APPDAEMON_DIR)
+from heating_automation import CHAIN_TOLERANCE, WEEKDAYS, CompiledSchedule  # noqa: E402
+
+TZ = timezone(timedelta(hours=1))
+MONDAY = datetime(2026, 1, 5, tzinfo=TZ)
+
+
+def old_chain_end(start_dt, rules_dict):
+    """find_true_chain_end as it was before the schedules were compiled."""
+    current_dt = start_dt
+    limit_dt = start_dt + timedelta(days=7)
+    while current_dt < limit_dt:
+        day_name = current_dt.strftime('%A').lower()
+        day_rules = rules_dict.get(day_name, [])
+        found_link = False
+        for block in day_rules:
+            try:
+                f_str = block.get('from')
+                f_time = datetime.strptime(f_str, '%H:%M:%S' if len(f_str) > 5 else '%H:%M').time()
+                block_start_dt = datetime.combine(current_dt.date(), f_time).replace(tzinfo=current_dt.tzinfo)
+                if abs((block_start_dt - current_dt).total_seconds()) <= 65:
+                    to_str = block.get('to')
+                    if ".999999" in to_str:
+                        current_dt = (current_dt + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+                    else:
+                        t_parts = [int(p) for p in to_str.split(':')]
+                        current_dt = current_dt.replace(hour=t_parts[0], minute=t_parts[1], second=t_parts[2] if len(t_parts) > 2 else 0, microsecond=0)
+                    found_link = True
+                    break
+            except: continue
+        if not found_link: break
+    return current_dt
+
+
+def hms(seconds):
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def random_schedule(rnd):
+    rules = {}
+    for day in WEEKDAYS:
+        blocks, t = [], rnd.choice([0, 0, rnd.randrange(0, 12) * 3600])
+        while t < 86400 and rnd.random() < 0.8:
+            end = min(86400, t + rnd.choice([900, 3600, 2 * 3600, 6 * 3600, 86400]))
+            if end == 86400 and t < 86400 - 60 and rnd.random() < 0.3:
+                end = 86400 - 60  # "until 23:59"
+            blocks.append({"from": hms(t), "to": "23:59:59.999999" if end == 86400 else hms(end)})
+            t = end + rnd.choice([0, 30, 60, 600, 3600, 4 * 3600])
+        rules[day] = blocks
+    return rules
+
+
+def classify(start_dt, old, new):
+    if old == new:
+        return "equal"
+    limit_dt = start_dt + timedelta(days=7)
+    if old >= limit_dt and new >= limit_dt:
+        return "limit"
+    # The old walk stopped just before midnight where the new one chains into the next day
+    midnight = (old + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    if new > old and (midnight - old).total_seconds() <= CHAIN_TOLERANCE:
+        return "midnight"
+    return "mismatch"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CompiledSchedule.chain_end with the old walk.")
+    parser.add_argument("--schedules", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    counts, examples = {}, []
+    for _ in range(args.schedules):
+        rules = random_schedule(rnd)
+        compiled = CompiledSchedule(rules)
+        for day_idx, day in enumerate(WEEKDAYS):
+            for block in rules[day]:
+                h, m, s = (int(p) for p in block["from"].split(":"))
+                start_dt = MONDAY + timedelta(days=day_idx, hours=h, minutes=m, seconds=s)
+                old, new = old_chain_end(start_dt, rules), compiled.chain_end(start_dt)
+                kind = classify(start_dt, old, new)
+                counts[kind] = counts.get(kind, 0) + 1
+                if kind == "mismatch" and len(examples) < 5:
+                    examples.append((start_dt, old, new, rules))
+    print(", ".join(f"{kind}: {n}" for kind, n in sorted(counts.items())))
+    for start_dt, old, new, rules in examples:
+        print(f"mismatch from {start_dt:%a %H:%M:%S}: old {old:%a %H:%M:%S}, new {new:%a %H:%M:%S}\n  {rules}")
+    sys.exit(1 if examples else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+'''
+Generates the Modbus sensors of the ESP firmware from one register table (firmware/lambdatronic_registers.csv)
+
+    python tools/compile_register_map.py                  # rewrites both firmware YAMLs, prints the bus load
+    python tools/compile_register_map.py --check          # only prints what would change
+    python tools/compile_register_map.py --heating-map    # additionally prints the heating_map for apps.yaml
+
+Table columns: address, register_type (read = input register, holding), value_type, multiply (ESPHome
+filter, e.g. 0.5 for °C * 2), decimals, unit, name (empty: internal sensor), id, poll (wanted poll
+interval in seconds), entity_category, icon, heating_map (key in apps.yaml, optional).
+
+The fastest poll interval becomes the controller's update_interval, slower sensors get skip_updates.
+ESPHome reads contiguous registers in a single request; small gaps between two sensors of the same tier
+(up to --max-gap registers, default 8) are bridged with register_count on the first one, so the
+Lambdatronic is asked for a few register blocks instead of one register at a time. ESPHome joins
+contiguous registers regardless of skip_updates and polls the whole range at its lowest non-zero skip, so
+a lone slow register between faster ones is promoted to their tier (it costs no extra request), and every
+other tier boundary gets force_new_range so no register is polled slower than its table entry asks for. Modbus entities
+outside the generated block (numbers, selects, binary sensors) are left alone but counted in the report.
+'''
+
+import argparse
+import csv
+import os
+import re
+
+import yaml
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+TABLE = os.path.join(ROOT, "firmware", "lambdatronic_registers.csv")
+FIRMWARE = [os.path.join(ROOT, "firmware", f) for f in
+            ("ESP32-P4-ETH_Froeling_Lambdatronic3200.yml", "ESP32-P4-NANO_Froeling_Lambdatronic3200.yml")]
+
+BEGIN = "  # BEGIN modbus registers (generated by tools/compile_register_map.py from firmware/lambdatronic_registers.csv, do not edit)"
+END = "  # END modbus registers"
+MAX_BLOCK = 122  # registers per read request, from the Lambdatronic doc
+DEFAULT_REGISTER_TYPE = {"number": "holding", "select": "holding", "switch": "coil"}
+
+
+class Loader(yaml.SafeLoader):
+    pass
+Loader.add_multi_constructor("!", lambda loader, suffix, node: None)  # !lambda, !secret, ...
+
+
+# ==================================================================================================
+# TABLE -> ENTRIES
+# ==================================================================================================
+def load_table(path):
+    with open(path, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        row["address"] = int(row["address"])
+        row["poll"] = int(row["poll"] or 0)
+    return rows
+
+
+def register_size(value_type):
+    value_type = (value_type or "U_WORD").upper()
+    if "QWORD" in value_type:
+        return 4
+    return 2 if "DWORD" in value_type or value_type.startswith("FP32") else 1
+
+
+def esphome_ranges(entities):
+    """Read ranges the way ESPHome's modbus_controller builds them from (register_type, address, skip_updates,
+    register_count, force_new_range): contiguous registers of one type form one range, whatever their
+    skip_updates, unless force_new_range is set or the range would exceed MAX_BLOCK. The lowest non-zero
+    skip_updates of its members applies to the whole range. Returns [register_type, start, end, skip, members]."""
+    ranges, current = [], None
+    for entity in sorted(entities):
+        t, a, s, c, force = entity
+        if current and current[0] == t and a <= current[2] and not force and a + c - current[1] <= MAX_BLOCK:
+            current[2] = max(current[2], a + c)
+            if s:
+                current[3] = min(current[3], s) if current[3] else s
+            current[4].append(entity)
+            continue
+        current = [t, a, a + c, s, [entity]]
+        ranges.append(current)
+    return ranges
+
+
+def plan(rows, fixed, max_gap):
+    """Returns (update_interval, {(register_type, address): (skip_updates, register_count, force_new_range)})
+    for the table rows, and the rows promoted to a faster tier."""
+    interval = min(row["poll"] for row in rows)
+    layout = {(row["register_type"], row["address"]): [max(0, round(row["poll"] / interval) - 1), register_size(row["value_type"]), False]
+              for row in rows}
+    # Neighbours in address order (fixed entries included, they must not end up inside a bridged gap)
+    items = sorted([(t, a, s, c, True) for (t, a), (s, c, _) in layout.items()] +
+                   [(t, a, s, c, False) for t, a, s, c, _ in fixed])
+    start = items[0][1] if items else 0
+    for (t1, a1, s1, c1, ours), (t2, a2, s2, c2, _) in zip(items, items[1:]):
+        gap = a2 - (a1 + (layout[(t1, a1)][1] if ours else c1))
+        same_range = t1 == t2 and s1 == s2 and a2 + c2 - start <= MAX_BLOCK
+        if ours and same_range and 0 < gap <= max_gap:
+            layout[(t1, a1)][1] = a2 - a1
+        elif not same_range or gap > 0:
+            start = a2
+
+    # Registers of different tiers that touch end up in one range, polled at the slower tier. A lone slow
+    # register between faster ones is read along with them (no extra request); any other tier change inside
+    # a contiguous run starts a new range with force_new_range.
+    def runs():
+        entities = [(t, a, *layout[(t, a)][:2], False) for t, a in layout] + [(t, a, s, c, False) for t, a, s, c, _ in fixed]
+        return [r[4] for r in esphome_ranges(entities)]
+
+    promoted = []
+    for run in runs():
+        for i, (t, a, s, c, _) in enumerate(run):
+            neighbours = [m[2] for m in (run[i - 1] if i else None, run[i + 1] if i + 1 < len(run) else None) if m]
+            if (t, a) in layout and neighbours and all(n < s for n in neighbours):
+                layout[(t, a)][0] = max(neighbours)
+                promoted.append((t, a))
+    for run in runs():
+        for (t1, a1, s1, _, _), (t2, a2, s2, _, _) in zip(run, run[1:]):
+            if s1 != s2:
+                if (t2, a2) not in layout:
+                    raise SystemExit(f"{t2} register {a2} (outside the table) follows register {a1} of another poll tier; "
+                                     f"set force_new_range on it or give both the same poll interval.")
+                layout[(t2, a2)][2] = True
+    return interval, {key: tuple(value) for key, value in layout.items()}, promoted
+
+
+def render(rows, controller, layout):
+    lines = [BEGIN]
+    for row in rows:
+        skip, count, force = layout[(row["register_type"], row["address"])]
+        lines += ["  - platform: modbus_controller", f"    modbus_controller_id: {controller}"]
+        if row["name"]:
+            lines.append(f'    name: "{row["name"]}"')
+        if row["id"]:
+            lines.append(f"    id: {row['id']}")
+        lines += [f"    address: {row['address']}", f"    register_type: {row['register_type']}",
+                  f"    value_type: {row['value_type'] or 'U_WORD'}"]
+        if count != register_size(row["value_type"]):
+            lines.append(f"    register_count: {count}  # bridges the gap to the next register")
+        if skip:
+            lines.append(f"    skip_updates: {skip}")
+        if force:
+            lines.append("    force_new_range: true  # other poll tier than the register before")
+        if row["unit"]:
+            lines.append(f'    unit_of_measurement: "{row["unit"]}"')
+        if row["decimals"]:
+            lines.append(f"    accuracy_decimals: {row['decimals']}")
+        if row["multiply"]:
+            lines += ["    filters:", f"      - multiply: {row['multiply']}"]
+        if row["entity_category"]:
+            lines.append(f"    entity_category: {row['entity_category']}")
+        if row["icon"]:
+            lines.append(f'    icon: "{row["icon"]}"')
+        if not row["name"]:
+            lines.append("    internal: true")
+        lines.append("")
+    return lines + [END, ""]
+
+
+# ==================================================================================================
+# FIRMWARE YAML
+# ==================================================================================================
+def modbus_entities(text):
+    """(register_type, address, skip_updates, register_count, force_new_range) of every modbus_controller entity, and the update_interval."""
+    config = yaml.load(text, Loader=Loader)
+    entities = []
+    for component, items in config.items():
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            if isinstance(item, dict) and item.get("platform") == "modbus_controller" and "address" in item:
+                entities.append((item.get("register_type", DEFAULT_REGISTER_TYPE.get(component, "holding")), int(item["address"]),
+                                 int(item.get("skip_updates", 0)), int(item.get("register_count", register_size(item.get("value_type")))),
+                                 bool(item.get("force_new_range", False))))
+    controller = (config.get("modbus_controller") or [{}])[0]
+    interval = int(str(controller.get("update_interval", "60s")).rstrip("s"))
+    return entities, interval, controller.get("id", "lambdatronic")
+
+
+def transactions_per_minute(entities, interval):
+    """Requests per cycle and per minute with ESPHome's range building (see esphome_ranges)."""
+    ranges = esphome_ranges(entities)
+    return len(ranges), sum(60 / interval / (skip + 1) for _, _, _, skip, _ in ranges)
+
+
+def slowed_registers(entities):
+    """(register_type, address, wanted skip_updates, effective skip_updates) of registers polled slower than configured."""
+    return [(t, a, s, skip) for t, _, _, skip, members in esphome_ranges(entities)
+            for t, a, s, _, _ in members if skip > s]
+
+
+def sensor_chunks(lines):
+    """(start, end) line ranges of the list items in the top-level 'sensor:' section."""
+    start = lines.index("sensor:") + 1
+    end = next((i for i in range(start, len(lines)) if lines[i] and not lines[i][0].isspace()), len(lines))
+    items = [i for i in range(start, end) if lines[i].startswith("  - ")]
+    return list(zip(items, items[1:] + [end]))
+
+
+def strip_generated(lines, table_addresses):
+    """Removes the generated block (or, the first time, the hand-written table sensors); returns lines and insert position."""
+    if BEGIN in lines:
+        begin, end = lines.index(BEGIN), lines.index(END) + 1
+        if end < len(lines) and not lines[end]:
+            end += 1
+        return lines[:begin] + lines[end:], begin
+    removed = set()
+    for start, end in sensor_chunks(lines):
+        chunk = "\n".join(lines[start:end])
+        address = re.search(r"^\s+address: (\d+)", chunk, re.M)
+        if "platform: modbus_controller" in chunk and address and int(address.group(1)) in table_addresses:
+            removed.update(range(start, end))
+    if not removed:
+        raise SystemExit("No generated block and no table sensors found in the sensor section.")
+    return [line for i, line in enumerate(lines) if i not in removed], min(removed)
+
+
+def compile_firmware(path, rows, max_gap):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    before, old_interval, controller = modbus_entities(text)
+
+    lines, position = strip_generated(text.split("\n"), {row["address"] for row in rows})
+    fixed, _, _ = modbus_entities("\n".join(lines))
+    interval, layout, promoted = plan(rows, fixed, max_gap)
+    lines[position:position] = render(rows, controller, layout)
+    new_text = "\n".join(lines)
+    new_text = re.sub(r"(modbus_controller:\n(?:    .*\n|  - .*\n)*?    update_interval: )\S+",
+                      lambda m: f"{m.group(1)}{interval}s", new_text, count=1)
+
+    after, _, _ = modbus_entities(new_text)
+    return (new_text, transactions_per_minute(before, old_interval), transactions_per_minute(after, interval), text != new_text,
+            slowed_registers(after), promoted)
+
+
+def heating_map(rows, firmware_text):
+    esphome = yaml.load(firmware_text, Loader=Loader)["esphome"]
+    device = re.sub(r"[^a-z0-9]+", "_", str(esphome.get("friendly_name") or esphome["name"]).lower()).strip("_")
+    lines = ["  heating_map:"]
+    for row in sorted((r for r in rows if r["heating_map"] and r["name"]), key=lambda r: r["heating_map"]):
+        slug = re.sub(r"[^a-z0-9]+", "_", row["name"].lower()).strip("_")
+        lines.append(f"    {row['heating_map']}: 'sensor.{device}_{slug}'")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the firmware's Modbus sensors from the register table.")
+    parser.add_argument("--table", default=TABLE)
+    parser.add_argument("--max-gap", type=int, default=8, help="largest gap (registers) read along to merge two ranges")
+    parser.add_argument("--check", action="store_true", help="report only, do not write the firmware files")
+    parser.add_argument("--heating-map", action="store_true", help="print the matching heating_map for apps.yaml")
+    parser.add_argument("firmware", nargs="*", default=FIRMWARE)
+    args = parser.parse_args()
+
+    rows = load_table(args.table)
+    for path in args.firmware:
+        text, (ranges_before, tpm_before), (ranges_after, tpm_after), changed, slowed, promoted = compile_firmware(path, rows, args.max_gap)
+        print(f"{os.path.basename(path)}: {ranges_before} -> {ranges_after} read requests per cycle, "
+              f"{tpm_before:.1f} -> {tpm_after:.1f} bus transactions/min" + ("" if changed else " (unchanged)"))
+        for t, a in promoted:
+            print(f"  {t} register {a}: read along with its faster neighbours (no extra request)")
+        for t, a, wanted, actual in slowed:
+            print(f"  WARNING: {t} register {a} is polled every {actual + 1} instead of every {wanted + 1} cycles")
+        if changed and not args.check:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+    if args.heating_map:
+        with open(args.firmware[0], encoding="utf-8") as f:
+            print(heating_map(rows, f.read()))
+
+
+if __name__ == "__main__":
+    main()
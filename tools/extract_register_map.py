@@ -0,0 +1,130 @@
+'''
+Extracts the register tables of the bundled Lambdatronic 3200 Modbus documentation into a CSV file
+
+    python tools/extract_register_map.py            # writes doc/lambdatronic_3200_registers.csv
+
+The PDF (doc/B1200522_ModBus Lambdatronic 3200_50-04_05-19_de.pdf) embeds subset fonts whose glyph
+ids are the character codes shifted by 29, so the text can be read with zlib alone (no PDF library).
+Columns: id (Modbus ID as in the doc, e.g. 30001), table (coil, discrete, input, holding), offset
+(register address on the wire), description, unit, scale (raw = value * scale), decimals, min, max,
+rw. The remote control registers (48001 - 48064, section 3.5) are expanded to one row each.
+'''
+
+import argparse
+import csv
+import os
+import re
+import zlib
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PDF = os.path.join(ROOT, "doc", "B1200522_ModBus Lambdatronic 3200_50-04_05-19_de.pdf")
+CSV = os.path.join(ROOT, "doc", "lambdatronic_3200_registers.csv")
+COLUMNS = ["id", "table", "offset", "description", "unit", "scale", "decimals", "min", "max", "rw"]
+
+GLYPH_OFFSET = 29
+# Umlauts etc. sit at other glyph ids in the subset font
+FIXES = {"Ċ": "ü", "¾": "°", "ò": "ä", "Ą": "ö", "í": "ß", "ê": "Ü", "ä": "Ö", "Ò": "Ä"}
+
+# Sections: (header starting the table, kind, lines per row after the ID, valid ID range)
+SECTIONS = [
+    ("3.1 Digitale Ausg", "coil", 1, range(0, 10000)),
+    ("3.2 Digitale Eing", "discrete", 1, range(10001, 20000)),
+    ("3.3 Aktuelle Werte", "input", 4, range(30001, 40000)),
+    ("3.4 Parameter", "holding", 7, range(40001, 48000)),
+    ("3.5 ModBus-Kesselfernsteuerung", "remote", 0, range(48001, 49000)),
+    ("3.6 Fehlerpuffer", "plain", 1, range(30001, 40000)),
+]
+FOOTER = "Fröling GesmbH"
+
+
+def pdf_lines(path):
+    """Text lines of the PDF, one per BT..ET block."""
+    with open(path, "rb") as f:
+        data = f.read()
+    lines = []
+    for stream in re.findall(rb'stream\r?\n(.*?)\r?\nendstream', data, re.S):
+        try: content = zlib.decompress(stream).decode("latin1")
+        except zlib.error: continue
+        for block in re.findall(r'BT(.*?)ET', content, re.S):
+            text = ""
+            for hexstr in re.findall(r'<([0-9A-Fa-f]+)>', block):
+                for i in range(0, len(hexstr) - 3, 4):
+                    code = int(hexstr[i:i + 4], 16) + GLYPH_OFFSET
+                    text += chr(code) if 32 <= code < 0x250 else "-"
+            if text:
+                lines.append("".join(FIXES.get(c, c) for c in text).strip())
+    return lines
+
+
+def number(text):
+    try: return float(text.replace(",", "."))
+    except ValueError: return None
+
+
+def table_of(reg_id, section):
+    if section == "coil":
+        return "coil", reg_id
+    for table, base in [("holding", 40001), ("input", 30001), ("discrete", 10001)]:
+        if reg_id >= base:
+            return table, reg_id - base
+
+
+def parse(lines):
+    rows, section, width, ids, i = {}, None, 0, range(0), 0
+    while i < len(lines):
+        line = lines[i]
+        header = next((s for s in SECTIONS if line.startswith(s[0])), None)
+        if header:
+            section, width, ids = header[1:]
+            i += 1
+            continue
+        if section == "remote":
+            m = re.match(r'^(48\d{3}) - (48\d{3})$', line)
+            if m and i + 4 < len(lines):
+                first, last = int(m.group(1)), int(m.group(2))
+                desc, scale, lo, hi = lines[i + 1:i + 5]
+                base = re.sub(r'\s*\d+\s*-\s*\d+$', '', desc).strip()
+                for n, reg_id in enumerate(range(first, last + 1), start=1):
+                    rows[reg_id] = {"id": reg_id, "table": "holding", "offset": reg_id - 40001,
+                                    "description": f"{base} {n}", "unit": "°C" if "temperatur" in base.lower() else "",
+                                    "scale": number(scale) or 1, "decimals": 0, "min": number(lo), "max": number(hi), "rw": "R/W"}
+                i += 5
+                continue
+        elif section and re.match(r'^\d{1,5}$', line) and int(line) in ids and i + width < len(lines):
+            reg_id = int(line)
+            fields = lines[i + 1:i + 1 + width]
+            table, offset = table_of(reg_id, section)
+            row = {"id": reg_id, "table": table, "offset": offset, "description": fields[0],
+                   "unit": "", "scale": 1, "decimals": 0, "min": None, "max": None, "rw": "R"}
+            if width >= 4:
+                row.update(unit=fields[1].strip(), scale=number(fields[2]) or 1, decimals=int(number(fields[3]) or 0))
+            if width == 7:
+                row.update(min=number(fields[4]), max=number(fields[5]), rw=fields[6] if fields[6] in ["R", "R/W"] else "R")
+            if fields[0] and number(fields[0]) is None and not fields[0].startswith(FOOTER) and reg_id not in rows:
+                rows[reg_id] = row
+                i += 1 + width
+                continue
+        i += 1
+    return [rows[k] for k in sorted(rows, key=lambda r: (rows[r]["table"], rows[r]["offset"]))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the Lambdatronic 3200 register map from the bundled PDF.")
+    parser.add_argument("--pdf", default=PDF)
+    parser.add_argument("--out", default=CSV)
+    args = parser.parse_args()
+
+    rows = parse(pdf_lines(args.pdf))
+    with open(args.out, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS, lineterminator="\n")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: ("" if row[k] is None else (int(row[k]) if isinstance(row[k], float) and row[k].is_integer() else row[k])) for k in COLUMNS})
+    counts = {}
+    for row in rows:
+        counts[row["table"]] = counts.get(row["table"], 0) + 1
+    print(f"{len(rows)} registers written to {args.out}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
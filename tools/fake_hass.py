@@ -0,0 +1,492 @@
+'''
+In-process stand-in for AppDaemon's hassapi.Hass
+
+FakeHouse loads the real AppDaemon/apps.yaml, instantiates the heating apps (GlobalSettings, every
+RoomDemandCalculator, HeatSupplyManager and FroelingHeatingModbus) against an in-memory state
+machine and drives them with a virtual clock. No Home Assistant or AppDaemon required.
+
+    from fake_hass import FakeHouse
+
+    house = FakeHouse()                  # loads ../AppDaemon/apps.yaml and seeds all helpers
+    house.boot()                         # initialize() in dependency order, startup timers run
+    house.set_state("sensor.some_room_temperature", 18.2)
+    house.advance(10)                    # run everything due within the next 10 virtual seconds
+    print(house.stats)
+
+The virtual clock runs in UTC like AppDaemon's get_now(); FakeHouse(local_tz="Europe/Vienna") sets the
+process time zone, so schedule logic that converts to local time is exercised off UTC as well.
+
+State callbacks are queued and dispatched after the triggering write has completed (like AppDaemon
+does), timers fire in virtual time order. Every dispatch is timed, every API call is counted.
+Native async callbacks run to completion on an event loop; inside them the API calls return
+awaitables and run_in_executor runs its function inline, as AppDaemon's sync wrappers behave.
+'''
+
+import asyncio
+import heapq
+import importlib
+import os
+import sys
+import tempfile
+import time
+import types
+from collections import defaultdict, deque
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+
+import yaml
+
+APPDAEMON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AppDaemon")
+
+# The Modbus app's keys, for an apps.yaml that does not define them
+MODBUS_HEATING_MAP = {
+    "froeling_hk2_flow_temp_external": "number.froeling_hk2_flow_temperature_external_specification",
+    "froeling_hk2_operating_mode": "select.froeling_hk2_operating_mode",
+}
+
+DEFAULT_SCHEDULE = {day: [{"from": "06:00:00", "to": "22:00:00", "data": {}}]
+                    for day in ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]}
+
+
+# ==================================================================================================
+# FAKE HASS (base class for the apps)
+# ==================================================================================================
+def loop_aware(method):
+    """Like AppDaemon's sync_wrapper: called from an async callback, the API returns an awaitable."""
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        if not self.runtime.in_loop:
+            return result
+        async def done():
+            return result
+        return done()
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+class FakeHass:
+    def __init__(self, runtime, name, args):
+        self.runtime = runtime
+        self.name = name
+        self.args = args
+
+    # --- apps / logging ---
+    def get_app(self, name):
+        return self.runtime.apps[name]
+
+    def log(self, msg, level="INFO", **kwargs):
+        self.runtime.log(self.name, msg, level)
+
+    def get_now(self):
+        return self.runtime.now
+
+    # --- states ---
+    @loop_aware
+    def get_state(self, entity_id=None, attribute=None, default=None, **kwargs):
+        self.runtime.count(self.name, "get_state")
+        return self.runtime.read(entity_id, attribute, default)
+
+    @loop_aware
+    def entity_exists(self, entity_id, **kwargs):
+        self.runtime.count(self.name, "entity_exists")
+        return entity_id in self.runtime.states
+
+    @loop_aware
+    def set_state(self, entity_id, state=None, attributes=None, replace=False, **kwargs):
+        # Like AppDaemon: attributes are merged into the existing ones unless replace=True
+        self.runtime.count(self.name, "set_state")
+        self.runtime.write(entity_id, state, attributes, replace_attributes=replace)
+
+    def listen_state(self, callback, entity_id=None, attribute=None, **kwargs):
+        return self.runtime.add_state_listener(self, callback, entity_id, attribute, kwargs)
+
+    def cancel_listen_state(self, handle):
+        self.runtime.state_listeners.pop(handle, None)
+
+    # --- events ---
+    def listen_event(self, callback, event=None, **kwargs):
+        return self.runtime.add_event_listener(self, callback, event, kwargs)
+
+    def cancel_listen_event(self, handle):
+        self.runtime.event_listeners.pop(handle, None)
+
+    def fire_event(self, event, **data):
+        self.runtime.count(self.name, "fire_event")
+        self.runtime.fire_event(event, data)
+
+    # --- scheduler ---
+    def run_in(self, callback, delay, **kwargs):
+        return self.runtime.schedule(self, callback, self.runtime.now + timedelta(seconds=delay), None, kwargs)
+
+    def run_every(self, callback, start, interval, **kwargs):
+        if start == "now" or start is None:
+            start = self.runtime.now
+        elif isinstance(start, str) and start.startswith("now"):
+            start = self.runtime.now + timedelta(seconds=int(start.split("+")[1].strip()))
+        return self.runtime.schedule(self, callback, start, interval, kwargs)
+
+    def cancel_timer(self, handle, **kwargs):
+        self.runtime.timers.pop(handle, None)
+
+    def timer_running(self, handle):
+        return handle in self.runtime.timers
+
+    async def run_in_executor(self, func, *args, **kwargs):
+        self.runtime.in_loop = False
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.runtime.in_loop = True
+
+    # --- services ---
+    @loop_aware
+    def call_service(self, service, **kwargs):
+        self.runtime.count(self.name, "call_service")
+        return self.runtime.call_service(self.name, service, kwargs)
+
+    def turn_on(self, entity_id, **kwargs):
+        return self.call_service(f"{entity_id.split('.')[0]}/turn_on", entity_id=entity_id, **kwargs)
+
+    def turn_off(self, entity_id, **kwargs):
+        return self.call_service(f"{entity_id.split('.')[0]}/turn_off", entity_id=entity_id, **kwargs)
+
+
+def install_hassapi_shim():
+    """Makes `import hassapi as hass` (and AppDaemon's plugin path) resolve to FakeHass."""
+    shim = types.ModuleType("hassapi")
+    shim.Hass = FakeHass
+    sys.modules["hassapi"] = shim
+    for name in ["appdaemon", "appdaemon.plugins", "appdaemon.plugins.hass"]:
+        sys.modules.setdefault(name, types.ModuleType(name))
+    sys.modules["appdaemon.plugins.hass"].Hass = FakeHass
+
+
+# ==================================================================================================
+# RUNTIME (state machine, scheduler, dispatcher, virtual clock)
+# ==================================================================================================
+class Runtime:
+    def __init__(self, start=None, verbose=False):
+        self.now = start or datetime(2026, 1, 5, 5, 0, tzinfo=timezone.utc)
+        self.verbose = verbose
+        self.apps = {}
+        self.states = {}
+        self.schedules = {}
+        self.state_listeners = {}
+        self.event_listeners = {}
+        self.timers = {}
+        self.timer_heap = []
+        self.queue = deque()
+        self.handles = 0
+        self.service_log = []
+        self.notifications = []
+        self.api_calls = defaultdict(int)
+        self.callback_latency = defaultdict(list)
+        self.log_lines = []
+        self.device = types.SimpleNamespace(name="device")
+        self.device_echo = {}  # command entity -> (reported entity, delay in seconds)
+        self.loop = asyncio.new_event_loop()
+        self.in_loop = False
+
+    def next_handle(self):
+        self.handles += 1
+        return self.handles
+
+    def count(self, app_name, api):
+        self.api_calls[(app_name, api)] += 1
+
+    def log(self, app_name, msg, level):
+        self.log_lines.append((self.now, app_name, level, msg))
+        if self.verbose or level in ["WARNING", "ERROR"]:
+            print(f"{self.now:%H:%M:%S} {level:7} {app_name}: {msg}")
+
+    # --- states ---
+    def read(self, entity_id, attribute=None, default=None):
+        if entity_id is None:
+            return deepcopy(self.states)
+        entry = self.states.get(entity_id)
+        if entry is None:
+            return default
+        if attribute == "all":
+            return deepcopy(entry)
+        if attribute is not None:
+            return entry["attributes"].get(attribute, default)
+        return entry["state"]
+
+    def write(self, entity_id, state, attributes=None, replace_attributes=False):
+        old = deepcopy(self.states.get(entity_id))
+        entry = self.states.setdefault(entity_id, {"state": None, "attributes": {}, "last_changed": None, "last_updated": None})
+        if replace_attributes:
+            entry["attributes"] = dict(attributes or {})
+        elif attributes:
+            entry["attributes"].update(attributes)
+        if state is not None:
+            entry["state"] = str(state) if isinstance(state, (int, float)) and not isinstance(state, bool) else state
+        stamp = self.now.isoformat()
+        entry["last_updated"] = stamp
+        if old is None or old["state"] != entry["state"]:
+            entry["last_changed"] = stamp
+        self.notify_state(entity_id, old, deepcopy(entry))
+
+    def notify_state(self, entity_id, old, new):
+        for handle, (app, callback, entity, attribute, kwargs) in list(self.state_listeners.items()):
+            if entity is not None and entity != entity_id and entity != entity_id.split(".")[0]:
+                continue
+            old_state = old["state"] if old else None
+            if attribute == "all":
+                if old == new:
+                    continue
+                self.enqueue(app, callback, (entity_id, "all", old, new, kwargs))
+            elif attribute is not None:
+                old_val = old["attributes"].get(attribute) if old else None
+                new_val = new["attributes"].get(attribute)
+                if old_val != new_val:
+                    self.enqueue(app, callback, (entity_id, attribute, old_val, new_val, kwargs))
+            elif old_state != new["state"]:
+                if "new" in kwargs and kwargs["new"] != new["state"]:
+                    continue
+                if "old" in kwargs and kwargs["old"] != old_state:
+                    continue
+                self.enqueue(app, callback, (entity_id, "state", old_state, new["state"], kwargs))
+
+    def add_state_listener(self, app, callback, entity_id, attribute, kwargs):
+        handle = self.next_handle()
+        self.state_listeners[handle] = (app, callback, entity_id, attribute, kwargs)
+        return handle
+
+    # --- events ---
+    def add_event_listener(self, app, callback, event, kwargs):
+        handle = self.next_handle()
+        self.event_listeners[handle] = (app, callback, event, kwargs)
+        return handle
+
+    def fire_event(self, event, data):
+        for app, callback, name, kwargs in list(self.event_listeners.values()):
+            if name is None or name == event:
+                self.enqueue(app, callback, (event, data, kwargs))
+
+    # --- scheduler ---
+    def schedule(self, app, callback, when, interval, kwargs):
+        handle = self.next_handle()
+        self.timers[handle] = (app, callback, interval, kwargs)
+        heapq.heappush(self.timer_heap, (when, handle))
+        return handle
+
+    # --- dispatch ---
+    def enqueue(self, app, callback, args):
+        self.queue.append((app, callback, args))
+
+    def dispatch(self, app, callback, args):
+        key = f"{app.name}.{getattr(callback, '__name__', 'callback')}"
+        start = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(callback):
+                self.in_loop = True
+                try:
+                    self.loop.run_until_complete(callback(*args))
+                finally:
+                    self.in_loop = False
+            else:
+                callback(*args)
+        except Exception as e:
+            self.log(app.name, f"Callback {key} raised {type(e).__name__}: {e}", "ERROR")
+        self.callback_latency[key].append(time.perf_counter() - start)
+
+    def drain(self):
+        while self.queue:
+            self.dispatch(*self.queue.popleft())
+
+    def advance(self, seconds):
+        """Runs every callback and timer due within the next `seconds` of virtual time."""
+        target = self.now + timedelta(seconds=seconds)
+        self.drain()
+        while self.timer_heap and self.timer_heap[0][0] <= target:
+            when, handle = heapq.heappop(self.timer_heap)
+            timer = self.timers.get(handle)
+            if timer is None:
+                continue
+            app, callback, interval, kwargs = timer
+            self.now = max(self.now, when)
+            if interval:
+                heapq.heappush(self.timer_heap, (when + timedelta(seconds=interval), handle))
+            else:
+                del self.timers[handle]
+            self.dispatch(app, callback, (kwargs,))
+            self.drain()
+        self.now = target
+
+    # --- services ---
+    def call_service(self, app_name, service, data):
+        self.service_log.append((self.now, app_name, service, data))
+        domain, action = service.split("/")
+        entity_id = data.get("entity_id")
+        if action == "set_value" and domain in ["input_number", "number"]:
+            self.write(entity_id, float(data["value"]))
+            if entity_id in self.device_echo:
+                # The boiler reports the accepted value back on its next poll
+                reported, delay = self.device_echo[entity_id]
+                value = float(data["value"])
+                def boiler_report(kwargs):
+                    self.write(reported, value)
+                self.schedule(self.device, boiler_report, self.now + timedelta(seconds=delay), None, {})
+        elif action == "set_value":
+            self.write(entity_id, data["value"])
+        elif action == "select_option":
+            self.write(entity_id, data["option"])
+        elif action in ["turn_on", "turn_off"]:
+            self.write(entity_id, action.removeprefix("turn_"))
+        elif service == "schedule/get_schedule":
+            ids = entity_id if isinstance(entity_id, list) else [entity_id]
+            return {"result": {"response": {e: deepcopy(self.schedules.get(e, {})) for e in ids}}}
+        elif service == "telegram_bot/send_message":
+            self.notifications.append((self.now, data))
+        return None
+
+
+# ==================================================================================================
+# FAKE HOUSE (apps.yaml + seeded helpers)
+# ==================================================================================================
+class FakeHouse:
+    def __init__(self, apps_yaml=None, overrides=None, start=None, verbose=False, boiler_delay=15, local_tz=None):
+        install_hassapi_shim()
+        if local_tz:
+            # Like AppDaemon, get_now() stays UTC; astimezone() in the apps converts to this zone
+            os.environ["TZ"] = local_tz
+            time.tzset()
+        if APPDAEMON_DIR not in sys.path:
+            sys.path.insert(0, APPDAEMON_DIR)
+        with open(apps_yaml or os.path.join(APPDAEMON_DIR, "apps.yaml")) as f:
+            self.config = yaml.safe_load(f)
+        for app_name, extra in (overrides or {}).items():
+            self.config.setdefault(app_name, {}).update(extra)
+        gl = self.config["global_config"]
+        gl["heating_map"] = dict(MODBUS_HEATING_MAP, **gl.get("heating_map", {}))
+        gl.pop("metrics_file", None)  # stay off the disk; render via heating_metrics.render_prometheus()
+        if "heating_history" in self.config and not self.config["heating_history"].get("disable", False):
+            self.config["heating_history"]["history_dir"] = tempfile.mkdtemp(prefix="heating_history_")
+        gl.setdefault("snapshot_file", os.path.join(tempfile.mkdtemp(prefix="heating_snapshot_"), "snapshot.json"))
+        self.runtime = Runtime(start=start, verbose=verbose)
+        self.rooms = list(gl.get("temp_room_map", {}))
+        reported = gl["heating_map"].get("froeling_hk2_flow_target_temp")
+        external = gl["heating_map"].get("froeling_hk2_flow_temp_external")
+        if reported and external:
+            self.runtime.device_echo[external] = (reported, boiler_delay)
+        self.seed_states()
+
+    # --- convenience pass-throughs ---
+    @property
+    def now(self):
+        return self.runtime.now
+
+    @property
+    def apps(self):
+        return self.runtime.apps
+
+    def get_state(self, entity_id, attribute=None):
+        return self.runtime.read(entity_id, attribute)
+
+    def set_state(self, entity_id, state, attributes=None):
+        """External (device) update; listeners run on the next advance()."""
+        self.runtime.write(entity_id, state, attributes)
+
+    def fire_event(self, event, **data):
+        self.runtime.fire_event(event, data)
+
+    def advance(self, seconds):
+        self.runtime.advance(seconds)
+
+    # --- seeding ---
+    def seed_states(self):
+        gl = self.config["global_config"]
+        w = self.runtime.write
+        for entity, value in {
+            "input_select.heating_mode": "Auto",
+            "input_number.target_flow_temp": 0.0,
+            "input_number.heating_boost_threshold": 4.0,
+            "input_number.heating_boost_factor": 1.0,
+            "input_number.heating_baseline_0_deg": 36.0,
+            "input_number.baseline_adjustment": 0.4,
+            "input_number.heating_claim_duration": 0.0,
+            "input_number.heating_margin": 0.5,
+            "input_number.max_flow_temp": 45.0,
+            "input_number.flow_temp_multi_room_offset": 0.0,
+            "binary_sensor.froeling_modbus_status": "on",
+        }.items():
+            w(entity, value)
+        for sensor in gl.get("temp_outdoor_map", {}).values():
+            w(sensor, 5.0)
+        for entity in gl.get("heating_map", {}).values():
+            domain = entity.split(".")[0]
+            w(entity, {"number": 0.0, "select": "aus", "binary_sensor": "off"}.get(domain, 0.0))
+        if "froeling_hk2_operating_mode" in gl["heating_map"]:
+            w(gl["heating_map"]["froeling_hk2_operating_mode"], "automatik")
+        for valve in gl.get("valve_map", {}).values():
+            w(valve, 50.0)
+        for room, sensor in gl.get("temp_room_map", {}).items():
+            w(sensor, 20.0)
+            w(f"input_select.heating_schedule_{room}", "Standard")
+            for kind in ["standard", "holiday", "temp", "party", "off"]:
+                entity = f"schedule.{kind}_{room}"
+                w(entity, "off", {"next_event": (self.now + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S%z')})
+                self.runtime.schedules[entity] = deepcopy(DEFAULT_SCHEDULE) if kind != "off" else {}
+            w(f"input_number.target_temp_{room}", 21.0)
+            w(f"input_number.delta_temp_{room}", 1.0)
+            w(f"input_number.base_temp_{room}", 18.0)
+            w(f"input_number.heat_temp_{room}", 21.0)
+            w(f"input_boolean.heating_claim_{room}", "off")
+            w(f"input_boolean.boost_enabled_{room}", "off")
+            w(f"input_number.sun_compensation_{room}", 0.0)
+            w(f"input_text.next_event_{room}", "")
+        self.runtime.queue.clear()
+
+    # --- app loading ---
+    def app_order(self):
+        """Enabled apps in dependency order."""
+        apps = {name: cfg for name, cfg in self.config.items()
+                if isinstance(cfg, dict) and "module" in cfg and not cfg.get("disable", False)}
+        order, seen = [], set()
+
+        def visit(name):
+            if name in seen or name not in apps:
+                return
+            seen.add(name)
+            for dep in apps[name].get("dependencies", []) or []:
+                visit(dep)
+            order.append(name)
+
+        for name in apps:
+            visit(name)
+        return [(name, apps[name]) for name in order]
+
+    def boot(self, settle=60):
+        """Instantiates and initializes all enabled apps, then lets startup timers run."""
+        for name, cfg in self.app_order():
+            module = importlib.import_module(cfg["module"])
+            app = getattr(module, cfg["class"])(self.runtime, name, dict(cfg))
+            self.runtime.apps[name] = app
+            app.initialize()
+            self.runtime.drain()
+        self.advance(settle)
+        return self
+
+    def shutdown(self):
+        """Calls terminate() of every app like AppDaemon does when it stops (GlobalSettings writes its snapshot)."""
+        for app in self.runtime.apps.values():
+            if hasattr(app, "terminate"):
+                app.terminate()
+
+    # --- measurements ---
+    def reset_stats(self):
+        self.runtime.service_log.clear()
+        self.runtime.api_calls.clear()
+        self.runtime.callback_latency.clear()
+
+    @property
+    def stats(self):
+        calls = defaultdict(int)
+        for (_, api), n in self.runtime.api_calls.items():
+            calls[api] += n
+        return {
+            "api_calls": dict(calls),
+            "services": len(self.runtime.service_log),
+            "callbacks": sum(len(v) for v in self.runtime.callback_latency.values()),
+        }
@@ -0,0 +1,83 @@
+'''
+Offline heating-curve fit on a copy of HeatingHistory's ring files (same fit as HeatingCurveFitter)
+
+Copy the history_dir of the heating_history app (e.g. /config/heating_history) to this machine and run
+
+    python tools/fit_heating_curve.py --history-dir ./heating_history --baseline 36 --adjustment 0.4
+
+Rooms, outdoor sensors and the ring capacity are taken from AppDaemon/apps.yaml. Prints the proposed
+heating_baseline_0_deg and baseline_adjustment plus the unconstrained fit; --points dumps the
+(outdoor temp, needed HFFT) pairs as CSV for plotting.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import yaml
+
+from fake_hass import APPDAEMON_DIR, install_hassapi_shim
+
+
+def load_series(history_dir, names, capacity):
+    from heating_history import Series
+    series = {}
+    for name in names:
+        path = os.path.join(history_dir, f"{name}.ring")
+        if not os.path.exists(path):
+            continue
+        series[name] = Series(path, capacity).samples()  # raw samples, hourly means before them
+    return series
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the HFFT heating curve from recorded history.")
+    parser.add_argument("--history-dir", required=True, help="copy of the heating_history app's history_dir")
+    parser.add_argument("--apps-yaml", default=os.path.join(APPDAEMON_DIR, "apps.yaml"))
+    parser.add_argument("--baseline", type=float, default=36.0, help="current input_number.heating_baseline_0_deg")
+    parser.add_argument("--adjustment", type=float, default=0.4, help="current input_number.baseline_adjustment")
+    parser.add_argument("--multi-room-offset", type=float, default=0.0, help="current input_number.flow_temp_multi_room_offset")
+    parser.add_argument("--days", type=float, default=14, help="only use the last N days")
+    parser.add_argument("--points", action="store_true", help="print the curve points as CSV instead")
+    args = parser.parse_args()
+
+    install_hassapi_shim()
+    if APPDAEMON_DIR not in sys.path:
+        sys.path.insert(0, APPDAEMON_DIR)
+    import heating_curve
+
+    with open(args.apps_yaml) as f:
+        config = yaml.safe_load(f)
+    gl = config["global_config"]
+    rooms = list(gl.get("temp_room_map", {}))
+    outdoor_keys = list(gl.get("temp_outdoor_map", {}))
+    capacity = int(config.get("heating_history", {}).get("capacity", 4096))
+
+    series = load_series(args.history_dir, heating_curve.series_names(rooms, outdoor_keys), capacity)
+    if "hfft" not in series:
+        sys.exit(f"No hfft series in {args.history_dir}.")
+    end = max(samples[-1][0] for samples in series.values() if samples)
+    points = heating_curve.curve_points(series, rooms, outdoor_keys, args.multi_room_offset,
+                                        start=end - args.days * 86400, end=end)
+    if args.points:
+        print("outdoor,needed_hfft")
+        for out, needed in points:
+            print(f"{out:.2f},{needed:.2f}")
+        return
+
+    proposal = heating_curve.propose(points, args.baseline, args.adjustment)
+    if proposal is None:
+        sys.exit(f"Not enough heating data: {len(points)} points, at least {heating_curve.MIN_SAMPLES} needed.")
+    start = max(end - args.days * 86400, series["hfft"][0][0])
+    print(f"data:                    {time.strftime('%Y-%m-%d %H:%M', time.localtime(start))} - "
+          f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(end))} ({(end - start) / 86400:.1f} days)")
+    print(f"current curve:           {args.baseline} - {args.adjustment} * outdoor")
+    print(f"proposed curve:          {proposal['baseline_0_deg']} - {proposal['baseline_adjustment']} * outdoor")
+    print(f"unconstrained fit:       {proposal['fitted_baseline_0_deg']} - {proposal['fitted_baseline_adjustment']} * outdoor")
+    print(f"details:                 {json.dumps(proposal)}")
+
+
+if __name__ == "__main__":
+    main()
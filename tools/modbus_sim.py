@@ -0,0 +1,155 @@
+'''
+Local Modbus TCP simulator of a Lambdatronic 3200, preloaded from doc/lambdatronic_3200_registers.csv
+
+    python tools/modbus_sim.py --port 5020          # then point froeling_modbus at 127.0.0.1:5020
+
+Serves FC03 (holding), FC04 (input) and FC06 (write single holding). Holding registers start at
+their doc minimum, input registers at 0 (set --outdoor etc. for the few the apps look at). Like the
+boiler, a flow target written to 48001 - 48018 shows up in the heating circuit's
+'Vorlauf-Solltemperatur' input register after --delay seconds and is dropped again when no write
+came in for 2 minutes; reads beyond MAX_BLOCK registers or outside the map answer with exception 2.
+Usable from a script as well: start_simulator(port) returns the running Simulator.
+'''
+
+import argparse
+import csv
+import os
+import socketserver
+import struct
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CSV = os.path.join(ROOT, "doc", "lambdatronic_3200_registers.csv")
+MAX_BLOCK = 122
+REMOTE_TIMEOUT = 120
+FLOW_TARGETS = range(8000, 8018)  # holding offsets of 48001 - 48018 (HK1 - HK18)
+
+
+def flow_report_offset(hk):
+    """Input register offset of 'HKn - Vorlauf-Solltemperatur' (31032 for HK1, 31062 for HK2, ...)."""
+    return 1001 + 30 * hk
+
+
+class Simulator:
+    def __init__(self, path=CSV, delay=5.0):
+        self.lock = threading.Lock()
+        self.delay = delay
+        self.registers = {3: {}, 4: {}}
+        self.meta = {}
+        with open(path, encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                function = {"holding": 3, "input": 4}.get(row["table"])
+                if function is None:
+                    continue
+                offset, scale = int(row["offset"]), float(row["scale"] or 1)
+                start = float(row["min"]) if function == 3 and row["min"] else 0.0
+                self.registers[function][offset] = int(round(start * scale)) & 0xFFFF
+                self.meta[(function, offset)] = row
+        self.remote = {}  # hk -> (raw flow target, time of the last write)
+        self.writes = []  # (time, offset, raw) for inspection
+
+    def set_value(self, reg_id, value):
+        """Sets a register by its doc ID (e.g. 30001) from a scaled value."""
+        function, offset = (4, reg_id - 30001) if reg_id < 40001 else (3, reg_id - 40001)
+        scale = float(self.meta.get((function, offset), {}).get("scale") or 1)
+        with self.lock:
+            self.registers[function][offset] = int(round(value * scale)) & 0xFFFF
+
+    def tick(self):
+        now = time.monotonic()
+        for hk, (raw, written) in list(self.remote.items()):
+            if now - written > REMOTE_TIMEOUT:
+                del self.remote[hk]
+                self.registers[4][flow_report_offset(hk)] = 0
+            elif now - written >= self.delay:
+                self.registers[4][flow_report_offset(hk)] = raw
+
+    def handle(self, pdu):
+        function = pdu[0]
+        with self.lock:
+            self.tick()
+            if function in (3, 4):
+                start, count = struct.unpack(">HH", pdu[1:5])
+                table = self.registers[function]
+                if not 1 <= count <= MAX_BLOCK or any(o not in table for o in (start, start + count - 1)):
+                    return bytes([function | 0x80, 2])
+                values = [table.get(o, 0) for o in range(start, start + count)]
+                return struct.pack(f">BB{count}H", function, 2 * count, *values)
+            if function == 6:
+                offset, raw = struct.unpack(">HH", pdu[1:5])
+                if offset not in self.registers[3]:
+                    return bytes([function | 0x80, 2])
+                self.registers[3][offset] = raw
+                self.writes.append((time.monotonic(), offset, raw))
+                if offset in FLOW_TARGETS:
+                    self.remote[offset - 7999] = (raw, time.monotonic())
+                return pdu[:5]
+            return bytes([function | 0x80, 1])
+
+
+class Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        while True:
+            header = self.recv(sock, 7)
+            if header is None:
+                return
+            tid, proto, length, unit = struct.unpack(">HHHB", header)
+            pdu = self.recv(sock, length - 1)
+            if pdu is None:
+                return
+            response = self.server.simulator.handle(pdu)
+            sock.sendall(struct.pack(">HHHB", tid, proto, len(response) + 1, unit) + response)
+
+    @staticmethod
+    def recv(sock, n):
+        data = b""
+        while len(data) < n:
+            chunk = sock.recv(n - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_simulator(port=5020, host="127.0.0.1", **kwargs):
+    simulator = Simulator(**kwargs)
+    server = Server((host, port), Handler)
+    server.simulator = simulator
+    simulator.server = server
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return simulator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modbus TCP simulator of a Lambdatronic 3200.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--delay", type=float, default=5.0, help="seconds until a flow target is reported back")
+    parser.add_argument("--outdoor", type=float, default=5.0, help="Außentemperatur (30001 + 1000)")
+    parser.add_argument("--boiler", type=float, default=70.0, help="Kesseltemperatur (30001)")
+    args = parser.parse_args()
+
+    simulator = start_simulator(args.port, args.host, delay=args.delay)
+    simulator.set_value(30001, args.boiler)
+    simulator.set_value(31001, args.outdoor)
+    print(f"Lambdatronic simulator on {args.host}:{args.port} "
+          f"({len(simulator.registers[3])} holding, {len(simulator.registers[4])} input registers)")
+    try:
+        while True:
+            time.sleep(10)
+            if simulator.writes:
+                _, offset, raw = simulator.writes[-1]
+                print(f"last write: {40001 + offset} = {raw}, {len(simulator.writes)} writes")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+'''
+Thermal house simulator for tuning the heating parameters offline (runs on top of fake_hass.FakeHouse)
+
+Every room of apps.yaml gets a first-order RC model (heat loss to outdoors, heat input from the
+radiators/floor loop proportional to valve opening and flow-minus-room temperature). The real apps
+(RoomDemandCalculator, HeatSupplyManager, FroelingHeatingModbus) control it under the virtual clock:
+schedules switch on and off by their definitions, room sensors and valve positions are written back
+whenever they change by a display step, the boiler's flow temperature follows the HFFT with a lag.
+
+    python tools/simulate_house.py --days 7
+    python tools/simulate_house.py --days 14 --sweep heating_margin=0.3,0.5 delta=0.5,1,1.5 --workers 4
+    python tools/simulate_house.py --days 7 --timezone Europe/Vienna   # schedules in local time, clock in UTC
+
+Reported per configuration: comfort deficit (°C·h below the scheduled temperature while a schedule
+is active, mean per room), overshoot (°C·h more than 1 °C above it), boiler on-time (hours with
+HFFT > 0), number of HFFT changes, and heat delivered (relative units).
+'''
+
+import argparse
+import itertools
+import json
+import math
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from fake_hass import FakeHouse
+
+# Sweepable parameters -> helper entity ('{room}' is expanded to every room)
+PARAMETERS = {
+    "heating_margin": "input_number.heating_margin",
+    "delta": "input_number.delta_temp_{room}",
+    "boost_factor": "input_number.heating_boost_factor",
+    "boost_threshold": "input_number.heating_boost_threshold",
+    "claim_duration": "input_number.heating_claim_duration",
+    "baseline_0_deg": "input_number.heating_baseline_0_deg",
+    "adjustment": "input_number.baseline_adjustment",
+    "multi_room_offset": "input_number.flow_temp_multi_room_offset",
+    "max_flow_temp": "input_number.max_flow_temp",
+}
+
+# Apps that only observe; left out to keep the simulation fast
+OBSERVERS = ["heating_history", "heating_curve"]
+
+# ==================================================================================================
+# THERMAL MODEL
+# ==================================================================================================
+class Room:
+    """dT/dt = (T_out - T) / tau + gain * valve * max(0, T_flow - T), in °C and hours."""
+    def __init__(self, name, rnd, start_temp):
+        self.name = name
+        self.tau = rnd.uniform(30.0, 60.0)         # hours, heat loss time constant
+        self.gain = rnd.uniform(0.05, 0.09)        # 1/h at fully open valve
+        self.temp = start_temp
+        self.valve = 0.0
+
+    def step(self, hours, outdoor, flow, setpoint):
+        # Thermostatic valve: proportional band of 1.5 °C below the room's target
+        self.valve = max(0.0, min(1.0, (setpoint + 0.5 - self.temp) / 1.5))
+        heat = self.gain * self.valve * max(0.0, flow - self.temp)
+        self.temp += hours * ((outdoor - self.temp) / self.tau + heat)
+        return heat * hours
+
+
+def outdoor_trace(mean, amplitude, seed):
+    """Daily sine (coldest at 05:00) plus a slow random drift."""
+    rnd = random.Random(seed)
+    drift = [rnd.uniform(-3, 3) for _ in range(400)]
+    def at(t_hours):
+        day = int(t_hours // 24)
+        frac = (t_hours % 24) / 24
+        d = drift[day % len(drift)] * (1 - frac) + drift[(day + 1) % len(drift)] * frac
+        return mean + d - amplitude * math.cos(2 * math.pi * (t_hours - 5) / 24)
+    return at
+
+# ==================================================================================================
+# SIMULATION
+# ==================================================================================================
+def drive_schedules(house, compiled):
+    """Switches schedule entities on/off like HA does, with 'next_event' (and 'temp' if in the block data)."""
+    now = house.now.astimezone()  # schedules are local time (see --timezone)
+    for entity, sched in compiled.items():
+        offset = sched.week_offset(now)
+        idx = sched._containing(offset)
+        inside = idx is not None and sched.intervals[idx][0] <= offset < sched.intervals[idx][1]
+        if inside:
+            start, end, data = sched.intervals[idx]
+            next_event = now + timedelta(seconds=end - offset)
+            attrs = {"next_event": next_event.strftime('%Y-%m-%dT%H:%M:%S%z')}
+            if "temp" in data:
+                attrs["temp"] = data["temp"]
+            state = "on"
+        else:
+            next_event, _ = sched.next_start(now)
+            attrs = {"next_event": next_event.strftime('%Y-%m-%dT%H:%M:%S%z') if next_event else None}
+            state = "off"
+        current = house.runtime.states.get(entity, {})
+        if current.get("state") != state or current.get("attributes", {}).get("next_event") != attrs["next_event"]:
+            house.set_state(entity, state, attrs)
+
+
+def simulate(config):
+    """Runs one configuration; returns its metrics (module-level so it can run in a worker process)."""
+    house = FakeHouse(overrides={name: {"disable": True} for name in OBSERVERS}, local_tz=config.get("timezone"))
+    from heating_automation import CompiledSchedule  # importable once FakeHouse has set up the path
+    gl = house.config["global_config"]
+    rnd = random.Random(config.get("seed", 1))
+    outdoor_at = outdoor_trace(config.get("outdoor_mean", 3.0), config.get("outdoor_amplitude", 4.0), config.get("seed", 1))
+    rooms = {loc: Room(loc, rnd, 19.0) for loc in house.rooms}
+    valves = {loc: gl.get("valve_map", {}).get(f"valve_{loc}") for loc in house.rooms}
+
+    for name, value in config.get("params", {}).items():
+        entity = PARAMETERS[name]
+        for target in ([entity.format(room=r) for r in house.rooms] if "{room}" in entity else [entity]):
+            house.runtime.write(target, value)
+    house.runtime.queue.clear()
+
+    compiled = {e: CompiledSchedule(rules) for e, rules in house.runtime.schedules.items() if rules}
+    drive_schedules(house, compiled)
+    house.boot()
+
+    step = config.get("step", 60)
+    hours = step / 3600
+    steps = int(config.get("days", 7) * 86400 / step)
+    flow = 20.0
+    metrics = {"deficit": 0.0, "overshoot": 0.0, "boiler_hours": 0.0, "heat": 0.0}
+    written = {}
+
+    def write(entity, value, force=False):
+        if entity and (force or written.get(entity) != value):
+            written[entity] = value
+            house.set_state(entity, value)
+
+    for i in range(steps):
+        t_hours = i * hours
+        outdoor = outdoor_at(t_hours)
+        hfft = float(house.get_state("input_number.target_flow_temp") or 0)
+        # Boiler: flow temperature follows the HFFT with ~10 min lag, cools down towards 20 °C when off
+        flow += (hfft - flow if hfft > 0 else 20.0 - flow) * min(1.0, hours / (1 / 6))
+        if hfft > 0:
+            metrics["boiler_hours"] += hours
+
+        for loc, room in rooms.items():
+            setpoint = float(house.get_state(f"input_number.target_temp_{loc}") or 18.0)
+            metrics["heat"] += room.step(hours, outdoor, flow if hfft > 0 else 20.0, setpoint)
+            sched = f"schedule.{house.get_state(f'input_select.heating_schedule_{loc}').lower()}_{loc}"
+            if house.get_state(sched) == "on":
+                wanted = float(house.get_state(sched, "temp") or house.get_state(f"input_number.heat_temp_{loc}") or 21.0)
+                metrics["deficit"] += max(0.0, wanted - room.temp) * hours
+                metrics["overshoot"] += max(0.0, room.temp - wanted - 1.0) * hours
+            write(gl["temp_room_map"][loc], round(room.temp, 1))
+            write(valves[loc], round(room.valve * 100))
+
+        # Outdoor sensors report every 10 minutes even if unchanged (else GlobalSettings flags them stale)
+        for sensor in gl.get("temp_outdoor_map", {}).values():
+            write(sensor, round(outdoor, 1), force=i % max(1, 600 // step) == 0)
+        drive_schedules(house, compiled)
+        house.advance(step)
+
+    hfft_changes = sum(1 for _, _, service, data in house.runtime.service_log
+                       if service == "input_number/set_value" and data.get("entity_id") == "input_number.target_flow_temp")
+    n = max(1, len(rooms))
+    return {
+        "params": config.get("params", {}),
+        "comfort_deficit_Kh": round(metrics["deficit"] / n, 2),
+        "overshoot_Kh": round(metrics["overshoot"] / n, 2),
+        "boiler_hours": round(metrics["boiler_hours"], 1),
+        "hfft_changes": hfft_changes,
+        "heat": round(metrics["heat"], 1),
+    }
+
+
+def parse_sweep(items):
+    grid = {}
+    for item in items or []:
+        name, _, values = item.partition("=")
+        if name not in PARAMETERS:
+            sys.exit(f"Unknown parameter '{name}'. Known: {', '.join(PARAMETERS)}")
+        grid[name] = [float(v) for v in values.split(",") if v]
+    names = list(grid)
+    return [dict(zip(names, combo)) for combo in itertools.product(*grid.values())] or [{}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the house under the real heating apps.")
+    parser.add_argument("--days", type=float, default=7, help="simulated days per configuration")
+    parser.add_argument("--step", type=int, default=60, help="physics step in seconds")
+    parser.add_argument("--outdoor-mean", type=float, default=3.0)
+    parser.add_argument("--outdoor-amplitude", type=float, default=4.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timezone", help="local time zone of the schedules, e.g. Europe/Vienna (default: UTC)")
+    parser.add_argument("--sweep", nargs="*", help="parameter grid, e.g. heating_margin=0.3,0.5 delta=0.5,1")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--json", action="store_true", help="print the raw JSON results")
+    args = parser.parse_args()
+
+    base = {"days": args.days, "step": args.step, "seed": args.seed,
+            "outdoor_mean": args.outdoor_mean, "outdoor_amplitude": args.outdoor_amplitude,
+            "timezone": args.timezone or "UTC"}
+    configs = [dict(base, params=params) for params in parse_sweep(args.sweep)]
+    if len(configs) == 1:
+        results = [simulate(configs[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(simulate, configs))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    results.sort(key=lambda r: (r["comfort_deficit_Kh"], r["boiler_hours"]))
+    print(f"{'parameters':45} {'deficit Kh':>10} {'overshoot':>10} {'boiler h':>9} {'HFFT chg':>9} {'heat':>8}")
+    for r in results:
+        params = ", ".join(f"{k}={v:g}" for k, v in r["params"].items()) or "(current helpers)"
+        print(f"{params:45} {r['comfort_deficit_Kh']:>10} {r['overshoot_Kh']:>10} {r['boiler_hours']:>9} {r['hfft_changes']:>9} {r['heat']:>8}")
+
+
+if __name__ == "__main__":
+    main()